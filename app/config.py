@@ -8,6 +8,97 @@ MAX_FILE_BYTES = 512 * 1024
 MAX_IMAGE_BYTES = 5 * 1024 * 1024
 MAX_AUDIO_BYTES = 20 * 1024 * 1024
 
+def _env_int(name: str, default: int) -> int:
+    value = os.environ.get(name)
+    if value is None or not value.strip():
+        return default
+    try:
+        return int(value)
+    except ValueError:
+        return default
+
+# Streamed tokens are merged into frames of at most this age (ms) / size (chars)
+# on the model-process -> backend and backend -> SSE hops. 0 disables a bound.
+STREAM_COALESCE_MS = _env_int("IDLE_NPU_STREAM_COALESCE_MS", 30)
+STREAM_COALESCE_CHARS = _env_int("IDLE_NPU_STREAM_COALESCE_CHARS", 64)
+
+# Backend <-> model process transport: "queue" (multiprocessing.Queue) or
+# "shm" (shared-memory ring, see app/core/shm_transport.py).
+IPC_TRANSPORT = (os.environ.get("IDLE_NPU_IPC_TRANSPORT") or "queue").strip().lower()
+
+# Loaded models kept warm in their own processes. The RAM budget caps the
+# summed RSS of the pool (0 = 60% of physical memory); least recently used
+# idle models are evicted first, also when free memory drops below the floor.
+MODEL_POOL_SIZE = max(1, _env_int("IDLE_NPU_MODEL_POOL_SIZE", 2))
+MODEL_POOL_RAM_MB = _env_int("IDLE_NPU_MODEL_POOL_RAM_MB", 0)
+MODEL_POOL_MIN_FREE_MB = _env_int("IDLE_NPU_MODEL_POOL_MIN_FREE_MB", 1024)
+
+# Model process supervision: idle processes are pinged every HEARTBEAT_S and
+# restarted when they miss a reply for HEARTBEAT_TIMEOUT_S; a generation that
+# streams nothing for GENERATION_TIMEOUT_S is treated as hung. A process that
+# needs more than MAX_RESTARTS restarts within 5 minutes is given up on.
+# 0 disables the heartbeat / watchdog.
+MODEL_HEARTBEAT_S = _env_int("IDLE_NPU_HEARTBEAT_S", 10)
+MODEL_HEARTBEAT_TIMEOUT_S = _env_int("IDLE_NPU_HEARTBEAT_TIMEOUT_S", 30)
+MODEL_GENERATION_TIMEOUT_S = _env_int("IDLE_NPU_GENERATION_TIMEOUT_S", 600)
+MODEL_MAX_RESTARTS = max(0, _env_int("IDLE_NPU_MODEL_MAX_RESTARTS", 3))
+
+# Tokens generated by the synthetic warm-up run after a text model loads, so
+# kernel compilation and weight upload are not paid by the first request.
+# 0 disables warm-up.
+MODEL_WARMUP_TOKENS = max(0, _env_int("IDLE_NPU_WARMUP_TOKENS", 4))
+
+# Reload the last successfully loaded model in the background at server start.
+RESTORE_LAST_MODEL = _env_int("IDLE_NPU_RESTORE_LAST_MODEL", 1) > 0
+
+# Generation jobs outlive their HTTP stream: finished jobs keep their event log
+# for JOB_RETENTION_S so a client can reattach, and the partial reply is saved
+# to the session every JOB_CHECKPOINT_S while the job runs.
+JOB_RETENTION_S = max(0, _env_int("IDLE_NPU_JOB_RETENTION_S", 300))
+JOB_CHECKPOINT_S = max(1, _env_int("IDLE_NPU_JOB_CHECKPOINT_S", 2))
+
+# Most prompts passed to one LLMPipeline.generate call by POST /api/batch.
+BATCH_MAX_SIZE = max(1, _env_int("IDLE_NPU_BATCH_SIZE", 8))
+
+# Audio attached through POST /api/uploads is streamed into the blob store
+# instead of travelling as a base64 data URL, so it may be this large (MB).
+MAX_AUDIO_UPLOAD_BYTES = max(1, _env_int("IDLE_NPU_MAX_AUDIO_UPLOAD_MB", 512)) * 1024 * 1024
+
+# Recordings longer than ASR_LONG_AUDIO_S seconds are split at pauses (energy
+# VAD) into segments of at most ASR_SEGMENT_S seconds (Whisper sees 30 s at a
+# time); each is transcribed in order and its text streamed as it finishes.
+# 0 disables segmentation.
+ASR_LONG_AUDIO_S = max(0, _env_int("IDLE_NPU_ASR_LONG_AUDIO_S", 30))
+ASR_SEGMENT_S = min(30, max(5, _env_int("IDLE_NPU_ASR_SEGMENT_S", 30)))
+
+# Decoded histories of recently used sessions kept by SessionManager and
+# updated in place on every write, bounded in MB (0 disables).
+SESSION_CACHE_MB = max(0, _env_int("IDLE_NPU_SESSION_CACHE_MB", 32))
+
+# Blob files (uploads, generated images) modified within the last GRACE_S
+# seconds are never collected, so one that is not yet attached to a message
+# survives. Files no message refers to are swept at most every SWEEP_S seconds.
+BLOB_GC_GRACE_S = max(0, _env_int("IDLE_NPU_BLOB_GC_GRACE_S", 3600))
+BLOB_GC_SWEEP_S = max(0, _env_int("IDLE_NPU_BLOB_GC_SWEEP_S", 6 * 3600))
+
+# Decoded VLM input images kept in each model process, bounded in MB of pixel
+# data (0 disables). Images larger than the vision encoder's input are
+# downscaled before they are cached.
+VLM_IMAGE_CACHE_MB = max(0, _env_int("IDLE_NPU_VLM_IMAGE_CACHE_MB", 256))
+
+# Cache of deterministic results (greedy text, seeded images, transcriptions):
+# an in-memory LRU and an on-disk tier under DATA_DIR, each bounded in MB.
+# 0 disables a tier.
+RESPONSE_CACHE_MB = max(0, _env_int("IDLE_NPU_RESPONSE_CACHE_MB", 64))
+RESPONSE_CACHE_DISK_MB = max(0, _env_int("IDLE_NPU_RESPONSE_CACHE_DISK_MB", 512))
+
+# Generated images are encoded once into the blob store as PNG, WebP or JPEG
+# (QUALITY applies to the lossy formats), with a THUMB_PX thumbnail for the
+# chat view. A request may override the format with "image_format".
+IMAGE_FORMAT = (os.environ.get("IDLE_NPU_IMAGE_FORMAT") or "png").strip().lower()
+IMAGE_QUALITY = min(100, max(1, _env_int("IDLE_NPU_IMAGE_QUALITY", 90)))
+IMAGE_THUMB_PX = max(0, _env_int("IDLE_NPU_IMAGE_THUMB_PX", 256))
+
 if getattr(sys, "frozen", False):
     APP_ROOT = Path(sys.executable).parent.resolve()
 else:
@@ -59,6 +150,15 @@ MODELS_DIR = _resolve_path(_PATH_OVERRIDES.get("models_dir"), DATA_DIR / "models
 DOWNLOAD_CACHE_DIR = _resolve_path(_PATH_OVERRIDES.get("download_cache_dir"), DATA_DIR / ".download_temp")
 OV_CACHE_DIR = _resolve_path(_PATH_OVERRIDES.get("ov_cache_dir"), DATA_DIR / ".ov_cache")
 SESSIONS_DB_PATH = _resolve_path(_PATH_OVERRIDES.get("sessions_db"), DATA_DIR / "sessions.db")
+RESPONSE_CACHE_DIR = DATA_DIR / "response_cache"
+# Attachment and generated-image bytes, stored by SHA-256. The blobs_dir
+# override moves the store; blobs written before that stay readable from the
+# default location and from the attachments_dir/blobs tree earlier builds used.
+DEFAULT_BLOBS_DIR = DATA_DIR / "blobs"
+BLOBS_DIR = _resolve_path(_PATH_OVERRIDES.get("blobs_dir"), DEFAULT_BLOBS_DIR)
+BLOB_FALLBACK_DIRS = [DEFAULT_BLOBS_DIR]
+if _PATH_OVERRIDES.get("attachments_dir"):
+    BLOB_FALLBACK_DIRS.append(_resolve_path(_PATH_OVERRIDES.get("attachments_dir"), DATA_DIR) / "blobs")
 
 CONFIG_DIR.mkdir(parents=True, exist_ok=True)
 LOGS_DIR.mkdir(parents=True, exist_ok=True)
@@ -66,6 +166,7 @@ MODELS_DIR.mkdir(parents=True, exist_ok=True)
 DOWNLOAD_CACHE_DIR.mkdir(parents=True, exist_ok=True)
 OV_CACHE_DIR.mkdir(parents=True, exist_ok=True)
 SESSIONS_DB_PATH.parent.mkdir(parents=True, exist_ok=True)
+BLOBS_DIR.mkdir(parents=True, exist_ok=True)
 
 def get_path_overrides() -> dict:
     return dict(_PATH_OVERRIDES)
@@ -87,6 +188,9 @@ DEFAULT_CONFIG = {
     "add_generation_prompt": True,
     "enable_thinking": True,
     "skip_special_tokens": True,
+    "reuse_kv_cache": True,
+    "prompt_lookup": False,
+    "max_ngram_size": 3,
     "negative_prompt": "",
     "width": 1024,
     "height": 1024,
@@ -153,6 +257,14 @@ CONFIG_GROUPS = [
             "skip_special_tokens": {
                 "type": "bool", "default": True,
                 "label_key": "conf_skip_special", "widget": "checkbox"
+            },
+            "prompt_lookup": {
+                "type": "bool", "default": False,
+                "label_key": "conf_prompt_lookup", "widget": "checkbox"
+            },
+            "max_ngram_size": {
+                "type": "int", "min": 1, "max": 10, "step": 1, "default": 3,
+                "label_key": "conf_max_ngram", "widget": "spin"
             }
         }
     }
@@ -0,0 +1,158 @@
+import itertools
+import time
+from typing import Callable, Dict, List, Optional
+
+from app.core.gen_metrics import GenerationTimer
+from app.core.token_coalescer import TimedCoalescer
+
+
+def _status_name(status) -> str:
+    name = getattr(status, "name", None) or str(status)
+    return name.split(".")[-1].upper()
+
+
+class _IncrementalDetokenizer:
+    """Turn a growing list of token ids into text deltas without re-decoding everything."""
+
+    def __init__(self, tokenizer) -> None:
+        self._tokenizer = tokenizer
+        self.ids: List[int] = []
+        self._prefix_offset = 0
+        self._read_offset = 0
+
+    def _decode(self, ids: List[int]) -> str:
+        if not ids:
+            return ""
+        try:
+            return self._tokenizer.decode(ids, skip_special_tokens=True)
+        except TypeError:
+            return self._tokenizer.decode(ids)
+
+    def push(self, new_ids) -> str:
+        self.ids.extend(int(x) for x in new_ids)
+        prefix_text = self._decode(self.ids[self._prefix_offset:self._read_offset])
+        new_text = self._decode(self.ids[self._prefix_offset:])
+        if len(new_text) <= len(prefix_text) or new_text.endswith("�"):
+            return ""
+        self._prefix_offset = self._read_offset
+        self._read_offset = len(self.ids)
+        return new_text[len(prefix_text):]
+
+
+class _BatchedRequest:
+    def __init__(self, job_id: str, handle, tokenizer, send: Callable[[dict], None],
+                 input_tokens: Optional[int] = None) -> None:
+        self.job_id = job_id
+        self.handle = handle
+        self.detok = _IncrementalDetokenizer(tokenizer)
+        self.coalescer = TimedCoalescer(lambda frame: send({"type": "token", "token": frame, "job_id": job_id}))
+        self.timer = GenerationTimer()
+        self.input_tokens = input_tokens
+        self.start_time = time.time()
+        self.steps = 0
+        self.peers_total = 0
+
+
+class ContinuousBatchingServer:
+    """
+    Drive an ``ov_genai.ContinuousBatchingPipeline`` for several jobs at once.
+
+    Each job is added as its own request; ``step`` advances all of them by one
+    scheduler iteration so concurrent chats share decode steps, and every job
+    streams its own tokens through ``send``.
+    """
+
+    def __init__(self, pipe, tokenizer, send: Callable[[dict], None]) -> None:
+        self._pipe = pipe
+        self._tokenizer = tokenizer
+        self._send = send
+        self._request_ids = itertools.count()
+        self._requests: Dict[str, _BatchedRequest] = {}
+
+    def has_work(self) -> bool:
+        return bool(self._requests)
+
+    def add(self, job_id: str, prompt: str, generation_config) -> None:
+        handle = self._pipe.add_request(next(self._request_ids), prompt, generation_config)
+        self._requests[job_id] = _BatchedRequest(
+            job_id, handle, self._tokenizer, self._send, self._count_tokens(prompt)
+        )
+
+    def _count_tokens(self, prompt: str) -> Optional[int]:
+        try:
+            return int(self._tokenizer.encode(prompt).input_ids.get_shape()[-1])
+        except Exception:
+            return None
+
+    def cancel(self, job_id: str) -> bool:
+        req = self._requests.get(job_id)
+        if req is None:
+            return False
+        stop = getattr(req.handle, "stop", None) or getattr(req.handle, "drop", None)
+        try:
+            if stop is not None:
+                stop()
+        except Exception:
+            pass
+        self._finish(req, cancelled=True)
+        return True
+
+    def cancel_all(self) -> None:
+        for job_id in list(self._requests):
+            self.cancel(job_id)
+
+    def _drain(self, req: _BatchedRequest) -> None:
+        while req.handle.can_read():
+            outputs = req.handle.read()
+            if not outputs:
+                break
+            output = outputs[min(outputs)] if isinstance(outputs, dict) else outputs[0]
+            text = req.detok.push(getattr(output, "generated_ids", []) or [])
+            if text:
+                req.timer.mark()
+                req.coalescer.push(text)
+
+    def _finish(self, req: _BatchedRequest, cancelled: bool = False, error: Optional[str] = None) -> None:
+        self._requests.pop(req.job_id, None)
+        req.coalescer.flush()
+        if error:
+            self._send({"type": "error", "msg": f"Gen Error: {error}", "job_id": req.job_id})
+        elapsed = time.time() - req.start_time
+        tokens = len(req.detok.ids)
+        stats = {
+            "tokens": tokens,
+            "time": round(elapsed, 2),
+            "speed": round(tokens / elapsed, 2) if elapsed > 0 else 0,
+            "ipc_frames_saved": req.coalescer.frames_saved,
+            "batched": True,
+            "batch_size_avg": round(req.peers_total / req.steps, 2) if req.steps else 1,
+        }
+        stats.update(req.timer.stats(input_tokens=req.input_tokens, output_tokens=tokens))
+        if cancelled:
+            stats["cancelled"] = True
+        self._send({"type": "finished", "stats": stats, "job_id": req.job_id})
+
+    def step(self) -> None:
+        if not self._requests:
+            return
+        active = len(self._requests)
+        try:
+            self._pipe.step()
+        except Exception as exc:
+            for req in list(self._requests.values()):
+                self._finish(req, error=str(exc))
+            return
+        for req in list(self._requests.values()):
+            req.steps += 1
+            req.peers_total += active
+            try:
+                self._drain(req)
+                status = _status_name(req.handle.get_status())
+            except Exception as exc:
+                self._finish(req, error=str(exc))
+                continue
+            if status != "RUNNING":
+                error = None
+                if status == "IGNORED":
+                    error = "Request rejected by scheduler (prompt does not fit the KV cache)."
+                self._finish(req, error=error)
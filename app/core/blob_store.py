@@ -0,0 +1,177 @@
+import hashlib
+import os
+import re
+import threading
+from pathlib import Path
+from typing import Iterable, Iterator, Optional
+
+_DIGEST_RE = re.compile(r"^[0-9a-f]{64}$")
+# Serialises "already stored? refresh it" in put/commit against the mtime
+# check and unlink in delete, across every BlobStore of this process.
+_STORE_LOCK = threading.Lock()
+
+
+class BlobStore:
+    """
+    Immutable files named by the SHA-256 of their bytes.
+
+    Both the backend and the model processes write here, so a generated
+    image crosses process boundaries as a 64-character digest instead of a
+    data URL. Writing the same bytes twice stores them once. ``fallbacks``
+    are older roots that are still read from (but never written to) after
+    the store has been moved.
+    """
+
+    def __init__(self, root: Path, fallbacks: Iterable[Path] = ()) -> None:
+        self.root = Path(root)
+        self.fallbacks = [Path(p) for p in fallbacks if Path(p) != self.root]
+
+    @staticmethod
+    def is_digest(value) -> bool:
+        return isinstance(value, str) and bool(_DIGEST_RE.match(value))
+
+    def _file(self, digest: str, root: Optional[Path] = None) -> Path:
+        return (root or self.root) / digest[:2] / digest
+
+    def path(self, digest: str) -> Optional[Path]:
+        """File of ``digest``, or None when it is unknown or malformed."""
+        if not self.is_digest(digest):
+            return None
+        for root in [self.root, *self.fallbacks]:
+            path = self._file(digest, root)
+            if path.is_file():
+                return path
+        return None
+
+    def put(self, data: bytes) -> str:
+        digest = hashlib.sha256(data).hexdigest()
+        path = self._file(digest)
+        with _STORE_LOCK:
+            if self._touch(path):
+                return digest
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(f"{digest}.{os.getpid()}.{threading.get_ident()}.tmp")
+        try:
+            tmp.write_bytes(data)
+            with _STORE_LOCK:
+                os.replace(tmp, path)
+        finally:
+            if tmp.exists():
+                try:
+                    tmp.unlink()
+                except OSError:
+                    pass
+        return digest
+
+    @staticmethod
+    def _touch(path: Path) -> bool:
+        """
+        Refresh the mtime of an existing file. Garbage collection spares
+        recent files, so writing bytes that are already stored must count
+        as a new write.
+        """
+        try:
+            os.utime(path)
+            return True
+        except OSError:
+            return False
+
+    def digests(self) -> Iterator[str]:
+        """Every digest stored under any root (a digest may repeat across roots)."""
+        for root in [self.root, *self.fallbacks]:
+            try:
+                shards = [p for p in root.iterdir() if p.is_dir() and len(p.name) == 2]
+            except OSError:
+                continue
+            for shard in shards:
+                try:
+                    names = [p.name for p in shard.iterdir()]
+                except OSError:
+                    continue
+                for name in names:
+                    if self.is_digest(name) and name.startswith(shard.name):
+                        yield name
+
+    def writer(self, max_bytes: Optional[int] = None) -> "BlobWriter":
+        """Incremental ``put`` for uploads that should not be held in memory."""
+        return BlobWriter(self, max_bytes)
+
+    def read(self, digest: str) -> Optional[bytes]:
+        path = self.path(digest)
+        if path is None:
+            return None
+        try:
+            return path.read_bytes()
+        except OSError:
+            return None
+
+    def delete(self, digest: str, before: Optional[float] = None) -> bool:
+        """
+        Remove ``digest`` from every root. Callers track references.
+        With ``before`` (a timestamp), copies modified at or after it are kept.
+        Shard directories stay in place so a concurrent ``put`` can always
+        write into them.
+        """
+        if not self.is_digest(digest):
+            return False
+        removed = False
+        for root in [self.root, *self.fallbacks]:
+            path = self._file(digest, root)
+            with _STORE_LOCK:
+                try:
+                    if before is not None and path.stat().st_mtime >= before:
+                        continue
+                    path.unlink()
+                    removed = True
+                except OSError:
+                    pass
+        return removed
+
+
+class BlobWriter:
+    """Hashes chunks while spooling them to a temporary file in the store."""
+
+    def __init__(self, store: BlobStore, max_bytes: Optional[int] = None) -> None:
+        self.store = store
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._hash = hashlib.sha256()
+        store.root.mkdir(parents=True, exist_ok=True)
+        self._tmp = store.root / f"upload.{os.getpid()}.{threading.get_ident()}.{id(self)}.tmp"
+        self._fh = open(self._tmp, "wb")
+
+    def write(self, chunk: bytes) -> None:
+        """Raises ValueError once more than ``max_bytes`` have been written."""
+        self.size += len(chunk)
+        if self.max_bytes is not None and self.size > self.max_bytes:
+            self.abort()
+            raise ValueError("blob too large")
+        self._hash.update(chunk)
+        self._fh.write(chunk)
+
+    def commit(self) -> str:
+        self._fh.close()
+        digest = self._hash.hexdigest()
+        path = self.store._file(digest)
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            with _STORE_LOCK:
+                stored = self.store._touch(path)
+                if not stored:
+                    os.replace(self._tmp, path)
+            if stored:
+                self._tmp.unlink()
+        except OSError:
+            self.abort()
+            raise
+        return digest
+
+    def abort(self) -> None:
+        try:
+            self._fh.close()
+        except OSError:
+            pass
+        try:
+            self._tmp.unlink()
+        except OSError:
+            pass
@@ -0,0 +1,51 @@
+from typing import List, Optional, Sequence
+
+
+class ChatKVCache:
+    """
+    Track what the pipeline's chat-mode KV cache holds for one session.
+
+    After a turn the cache contains the token ids of the prompt plus those of
+    the generated reply (end-of-turn token included), as the pipeline reported
+    them. When the token ids of the next rendered prompt start with exactly
+    those ids only the remainder has to be prefilled. Anything else (another
+    session, an edited or truncated history, a sliding history window, or a
+    chat template that renders past replies differently from how they were
+    generated) is a miss and the chat is restarted from scratch.
+    """
+
+    def __init__(self) -> None:
+        self.session_id: Optional[str] = None
+        self.ids: List[int] = []
+        self.active = False
+        self.disabled = False
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def tokens(self) -> int:
+        return len(self.ids)
+
+    def delta(self, session_id: Optional[str], prompt_ids: Sequence[int]) -> Optional[List[int]]:
+        """Return the ids of ``prompt_ids`` not yet in the cache, or None on a miss."""
+        if not self.active or not session_id or session_id != self.session_id:
+            return None
+        cached = len(self.ids)
+        if not cached or len(prompt_ids) <= cached:
+            return None
+        if list(prompt_ids[:cached]) != self.ids:
+            return None
+        return list(prompt_ids[cached:])
+
+    def commit(self, session_id: Optional[str], prompt_ids: Sequence[int], generated_ids: Sequence[int]) -> None:
+        self.session_id = session_id
+        self.ids = [*prompt_ids, *generated_ids]
+        self.active = True
+
+    def reset(self) -> None:
+        self.session_id = None
+        self.ids = []
+        self.active = False
+
+    def matches(self, session_id: Optional[str]) -> bool:
+        return self.active and (session_id is None or session_id == self.session_id)
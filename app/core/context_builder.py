@@ -0,0 +1,77 @@
+from typing import List, Optional, Sequence, Tuple
+
+# Chat template tokens (role markers, separators) added around each message.
+MESSAGE_OVERHEAD_TOKENS = 8
+# Never plan for less prompt room than this, even with a large max_new_tokens.
+MIN_PROMPT_BUDGET = 256
+TRUNCATION_MARK = "\n[...truncated]"
+# Byte-based token estimate (see ContextBuilder.count).
+_BYTES_PER_TOKEN = 3
+
+
+class ContextBuilder:
+    """
+    Pick the chat history that fits a model's prompt budget.
+
+    History is taken newest first until the budget (``max_prompt_len`` minus
+    ``max_new_tokens``) is used up; a single message that is larger than the
+    whole budget is cut down instead of being dropped. Tokens are estimated
+    from the UTF-8 length of the text, so the backend never has to load the
+    model's tokenizer (OpenVINO stays in the model process); a prompt that
+    still overflows is trimmed there.
+    """
+
+    @staticmethod
+    def count(text: str) -> int:
+        if not text:
+            return 0
+        # 3 UTF-8 bytes per token, on purpose: exact for CJK (3 bytes, ~1 token
+        # per character) and an overestimate for English (~4 bytes per token),
+        # so an estimated prompt errs towards fitting.
+        return max(1, len(text.encode("utf-8", errors="ignore")) // _BYTES_PER_TOKEN)
+
+    @staticmethod
+    def budget(max_prompt_len: int, max_new_tokens: int) -> int:
+        return max(MIN_PROMPT_BUDGET, int(max_prompt_len) - max(0, int(max_new_tokens)))
+
+    def select(
+        self,
+        messages: Sequence[dict],
+        counts: Sequence[int],
+        budget: int,
+        reserved: int = 0,
+        max_messages: Optional[int] = None,
+    ) -> Tuple[List[dict], int]:
+        """
+        Newest messages that fit ``budget`` after ``reserved`` tokens.
+        Returns the selection and its estimated prompt size.
+        """
+        if not messages:
+            return [], reserved
+        limit = len(messages) if not max_messages or max_messages <= 0 else max_messages
+        total = reserved
+        start = len(messages)
+        for index in range(len(messages) - 1, max(-1, len(messages) - 1 - limit), -1):
+            cost = counts[index] + MESSAGE_OVERHEAD_TOKENS
+            if start < len(messages) and total + cost > budget:
+                break
+            total += cost
+            start = index
+        selected = list(messages[start:])
+        # Start the window on a user turn so templates do not see a dangling reply.
+        while len(selected) > 1 and selected[0].get("role") != "user":
+            total -= counts[start] + MESSAGE_OVERHEAD_TOKENS
+            selected.pop(0)
+            start += 1
+
+        if total > budget and len(selected) == 1:
+            last = dict(selected[0])
+            content = str(last.get("content") or "")
+            tokens = counts[start]
+            room = budget - reserved - MESSAGE_OVERHEAD_TOKENS
+            if content and tokens > 0 and room > 0:
+                keep = int(len(content) * room / tokens)
+                last["content"] = content[:max(0, keep - len(TRUNCATION_MARK))] + TRUNCATION_MARK
+                selected[0] = last
+                total = reserved + room + MESSAGE_OVERHEAD_TOKENS
+        return selected, total
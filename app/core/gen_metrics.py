@@ -0,0 +1,91 @@
+import time
+from typing import Callable, List, Optional
+
+
+def _percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    pos = (len(ordered) - 1) * pct / 100.0
+    lo = int(pos)
+    hi = min(lo + 1, len(ordered) - 1)
+    return ordered[lo] + (ordered[hi] - ordered[lo]) * (pos - lo)
+
+
+def perf_metrics(result):
+    metrics = getattr(result, "perf_metrics", None)
+    if metrics is None:
+        return None
+    try:
+        metrics.get_num_generated_tokens()
+    except Exception:
+        return None
+    return metrics
+
+
+class GenerationTimer:
+    """
+    Latency breakdown of one generation.
+
+    ``mark`` is called whenever the streamer delivers text. ``stats`` prefers
+    the token counts and per-token durations of OpenVINO GenAI ``PerfMetrics``
+    when the pipeline result carries them and falls back to the streamer
+    arrival times and caller-provided token counts otherwise.
+    """
+
+    def __init__(self, clock: Callable[[], float] = time.perf_counter) -> None:
+        self._clock = clock
+        self.started_at = clock()
+        self.arrivals: List[float] = []
+
+    def restart(self) -> None:
+        self.started_at = self._clock()
+        self.arrivals = []
+
+    def mark(self) -> None:
+        self.arrivals.append(self._clock())
+
+    @property
+    def chunks(self) -> int:
+        return len(self.arrivals)
+
+    def stats(
+        self,
+        result=None,
+        input_tokens: Optional[int] = None,
+        output_tokens: Optional[int] = None,
+    ) -> dict:
+        end = self.arrivals[-1] if self.arrivals else self._clock()
+        total_ms = max(0.0, (end - self.started_at) * 1000.0)
+        ttft_ms = (self.arrivals[0] - self.started_at) * 1000.0 if self.arrivals else 0.0
+        gaps = [(b - a) * 1000.0 for a, b in zip(self.arrivals, self.arrivals[1:])]
+
+        metrics = perf_metrics(result)
+        if metrics is not None:
+            try:
+                input_tokens = int(metrics.get_num_input_tokens())
+                output_tokens = int(metrics.get_num_generated_tokens())
+                ttft_ms = float(metrics.get_ttft().mean) or ttft_ms
+                durations = list(getattr(metrics.raw_metrics, "m_durations", None) or [])
+                if len(durations) > 1:
+                    gaps = [float(d) for d in durations[1:]]
+            except Exception:
+                pass
+
+        stats = {"ttft_ms": round(ttft_ms, 1)}
+        if gaps:
+            stats.update({
+                "itl_p50_ms": round(_percentile(gaps, 50), 1),
+                "itl_p90_ms": round(_percentile(gaps, 90), 1),
+                "itl_p99_ms": round(_percentile(gaps, 99), 1),
+            })
+        if input_tokens is not None:
+            stats["input_tokens"] = int(input_tokens)
+            if ttft_ms > 0:
+                stats["prefill_tps"] = round(input_tokens / (ttft_ms / 1000.0), 2)
+        if output_tokens is not None:
+            stats["output_tokens"] = int(output_tokens)
+            decode_ms = total_ms - ttft_ms
+            if output_tokens > 1 and decode_ms > 0:
+                stats["decode_tps"] = round((output_tokens - 1) / (decode_ms / 1000.0), 2)
+        return stats
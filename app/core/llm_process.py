@@ -1,42 +1,122 @@
 import json
+import queue
 import time
 import traceback
 
 import base64
+import functools
+import hashlib
 import io
+import math
+import multiprocessing
+import os
 from pathlib import Path
 from typing import Optional
 
-def _decode_image_data(data_url: str):
+def _image_data_bytes(data_url: str) -> Optional[bytes]:
     if not data_url:
         return None
-    raw = None
     if data_url.startswith("data:"):
         try:
             _, b64 = data_url.split(",", 1)
         except ValueError:
             return None
-        try:
-            raw = base64.b64decode(b64, validate=False)
-        except Exception:
-            return None
     else:
-        try:
-            raw = base64.b64decode(data_url, validate=False)
-        except Exception:
-            return None
-    if raw is None:
+        b64 = data_url
+    try:
+        return base64.b64decode(b64, validate=False)
+    except Exception:
+        return None
+
+def _decode_image_data(data_url: str, limits: Optional[dict] = None):
+    return _decode_image_bytes(_image_data_bytes(data_url), limits)
+
+def _fit_size(width: int, height: int, limits: Optional[dict]):
+    """Size an image is reduced to so it is no larger than the vision encoder consumes."""
+    scale = 1.0
+    max_pixels = (limits or {}).get("max_pixels")
+    min_side = (limits or {}).get("min_side")
+    if max_pixels and width * height > max_pixels:
+        scale = (max_pixels / float(width * height)) ** 0.5
+    elif min_side and min(width, height) > min_side:
+        # The encoder resizes the short side to min_side (and crops); keep that much.
+        scale = min_side / float(min(width, height))
+    if scale >= 1.0:
+        return width, height
+    return max(1, int(round(width * scale))), max(1, int(round(height * scale)))
+
+def _decode_image_array(raw: Optional[bytes], limits: Optional[dict] = None):
+    """RGB uint8 array of encoded image bytes, downscaled to ``limits``."""
+    if not raw:
         return None
     try:
         from PIL import Image
         import numpy as np
+        image = Image.open(io.BytesIO(raw))
+        target = _fit_size(image.width, image.height, limits)
+        if target != image.size:
+            # JPEG can decode straight at 1/2, 1/4 or 1/8 scale.
+            image.draft("RGB", target)
+        image = image.convert("RGB")
+        if target != image.size:
+            image = image.resize(target, Image.BICUBIC)
+        return np.ascontiguousarray(np.asarray(image))
+    except Exception:
+        return None
+
+def _decode_image_bytes(raw: Optional[bytes], limits: Optional[dict] = None):
+    array = _decode_image_array(raw, limits)
+    if array is None:
+        return None
+    try:
         import openvino as ov
-        image = Image.open(io.BytesIO(raw)).convert("RGB")
-        array = np.array(image)
         return ov.Tensor(array)
     except Exception:
         return None
 
+def _infer_vision_limits(model_path: Optional[Path]) -> Optional[dict]:
+    """Largest image the vision encoder of a VLM uses, from its HF processor configs."""
+    if not model_path:
+        return None
+    data = {}
+    for name in ("config.json", "processor_config.json", "preprocessor_config.json"):
+        path = Path(model_path) / name
+        if not path.exists():
+            continue
+        try:
+            loaded = json.loads(path.read_text(encoding="utf-8"))
+        except Exception:
+            continue
+        if isinstance(loaded, dict):
+            data.update(loaded)
+    size = data.get("size") if isinstance(data.get("size"), dict) else {}
+    if data.get("max_pixels"):
+        # Qwen2-VL style dynamic resolution.
+        return {"max_pixels": int(data["max_pixels"])}
+    if "qwen2" in str(data.get("image_processor_type") or "").lower() and size.get("longest_edge"):
+        return {"max_pixels": int(size["longest_edge"])}
+    pinpoints = data.get("image_grid_pinpoints")
+    if isinstance(pinpoints, list) and pinpoints:
+        # LLaVA-NeXT tiles: the largest grid bounds the useful resolution.
+        try:
+            return {"max_pixels": max(int(w) * int(h) for w, h in pinpoints)}
+        except (TypeError, ValueError):
+            pass
+    if data.get("scale_resolution") and data.get("max_slice_nums"):
+        # MiniCPM-V slices.
+        return {"max_pixels": int(data["scale_resolution"]) ** 2 * (int(data["max_slice_nums"]) + 1)}
+    if data.get("force_image_size") and data.get("max_dynamic_patch"):
+        # InternVL dynamic tiles.
+        return {"max_pixels": int(data["force_image_size"]) ** 2 * int(data["max_dynamic_patch"])}
+    side = size.get("shortest_edge") or size.get("height")
+    if not side:
+        crop = data.get("crop_size")
+        side = crop.get("height") if isinstance(crop, dict) else crop
+    side = side or data.get("image_size")
+    if isinstance(side, int) and side > 0:
+        return {"min_side": side}
+    return None
+
 def _decode_audio_data_url(data_url: str):
     if not data_url:
         return None
@@ -62,14 +142,16 @@ def _decode_audio_data_url(data_url: str):
         mime = ""
     return {"bytes": raw, "mime": mime or "application/octet-stream"}
 
-def _decode_wav_bytes(raw: bytes):
+def _decode_wav_bytes(raw):
+    """Decode WAV ``raw`` bytes, or the WAV file at path ``raw``, to mono float32."""
     try:
         import wave
         import numpy as np
     except Exception:
         return None
     try:
-        with wave.open(io.BytesIO(raw), "rb") as wf:
+        source = io.BytesIO(raw) if isinstance(raw, (bytes, bytearray)) else str(raw)
+        with wave.open(source, "rb") as wf:
             sr = wf.getframerate()
             channels = wf.getnchannels()
             sampwidth = wf.getsampwidth()
@@ -79,49 +161,166 @@ def _decode_wav_bytes(raw: bytes):
     if not frames:
         return None
     try:
+        # Scale in place: one float32 buffer per decode, no float64 temporaries.
         if sampwidth == 1:
             audio = np.frombuffer(frames, dtype=np.uint8).astype(np.float32)
-            audio = (audio - 128.0) / 128.0
+            audio -= 128.0
+            audio *= 1.0 / 128.0
         elif sampwidth == 2:
-            audio = np.frombuffer(frames, dtype=np.int16).astype(np.float32) / 32768.0
+            audio = np.frombuffer(frames, dtype="<i2").astype(np.float32)
+            audio *= 1.0 / 32768.0
         elif sampwidth == 3:
             data = np.frombuffer(frames, dtype=np.uint8).reshape(-1, 3)
             audio = (data[:, 0].astype(np.int32) |
                      (data[:, 1].astype(np.int32) << 8) |
                      (data[:, 2].astype(np.int32) << 16))
-            audio = (audio ^ 0x800000) - 0x800000
-            audio = audio.astype(np.float32) / 8388608.0
+            audio = ((audio ^ 0x800000) - 0x800000).astype(np.float32)
+            audio *= 1.0 / 8388608.0
         elif sampwidth == 4:
-            audio = np.frombuffer(frames, dtype=np.int32).astype(np.float32) / 2147483648.0
+            audio = np.frombuffer(frames, dtype="<i4").astype(np.float32)
+            audio *= 1.0 / 2147483648.0
         else:
             return None
     except Exception:
         return None
     if channels and channels > 1:
         try:
-            audio = audio.reshape(-1, channels).mean(axis=1)
+            audio = audio.reshape(-1, channels).mean(axis=1, dtype=np.float32)
         except Exception:
             return None
     return audio, sr
 
+@functools.lru_cache(maxsize=8)
+def _polyphase_filter(up: int, down: int):
+    """
+    Kaiser-windowed sinc low-pass for resampling by ``up / down``, split into
+    its ``up`` phases (one row each, reversed for a dot product with the input
+    window). Cached: a process sees only a handful of source rates.
+    """
+    import numpy as np
+    max_rate = max(up, down)
+    half_len = 10 * max_rate
+    n = np.arange(-half_len, half_len + 1, dtype=np.float64)
+    h = np.sinc(n / max_rate) / max_rate * np.kaiser(2 * half_len + 1, 5.0) * up
+    taps = -(-len(h) // up)
+    h = np.pad(h, (0, taps * up - len(h)))
+    phases = np.ascontiguousarray(h.reshape(taps, up).T[:, ::-1], dtype=np.float32)
+    return phases, half_len
+
 def _resample_audio(audio, src_rate: int, target_rate: int = 16000):
-    if src_rate == target_rate:
-        return audio
+    """Polyphase resampling to ``target_rate``; returns contiguous float32."""
     try:
         import numpy as np
     except Exception:
         return audio
     if audio is None:
         return audio
-    length = len(audio)
-    if length == 0:
-        return audio
-    target_len = int(length * float(target_rate) / float(src_rate))
-    if target_len <= 0:
+    audio = np.ascontiguousarray(audio, dtype=np.float32)
+    if src_rate == target_rate or not src_rate or len(audio) == 0:
         return audio
-    x_old = np.linspace(0, length - 1, num=length)
-    x_new = np.linspace(0, length - 1, num=target_len)
-    return np.interp(x_new, x_old, audio).astype(np.float32)
+    g = math.gcd(int(target_rate), int(src_rate))
+    up, down = int(target_rate) // g, int(src_rate) // g
+    phases, half_len = _polyphase_filter(up, down)
+    taps = phases.shape[1]
+    out_len = -(-len(audio) * up // down)
+    # Zero history before the first sample and enough tail for the filter delay.
+    padded = np.concatenate([
+        np.zeros(taps - 1, dtype=np.float32), audio, np.zeros(taps + half_len // up + 1, dtype=np.float32),
+    ])
+    windows = np.lib.stride_tricks.sliding_window_view(padded, taps)
+    out = np.empty(out_len, dtype=np.float32)
+    # Outputs r, r + up, r + 2*up, ... share one filter phase and step the
+    # input by ``down``, so each residue is a single strided matrix-vector product.
+    for r in range(min(up, out_len)):
+        pos = r * down + half_len
+        count = len(range(r, out_len, up))
+        out[r::up] = windows[pos // up::down][:count] @ phases[pos % up]
+    return out
+
+def _vad_segments(audio, rate: int = 16000, max_s: float = 30.0,
+                  frame_ms: int = 30, min_silence_ms: int = 300, pad_ms: int = 200):
+    """
+    Split speech into ``(start, end)`` sample ranges of at most ``max_s``.
+
+    Energy VAD: a 30 ms frame is speech when its RMS is clearly above the
+    recording's noise floor. Ranges are cut in the middle of pauses of at
+    least ``min_silence_ms``, merged back up to ``max_s`` so Whisper keeps
+    context, and a range without a usable pause is cut at its quietest frame.
+    Stretches without speech are dropped.
+    """
+    import numpy as np
+    frame = max(1, rate * frame_ms // 1000)
+    count = len(audio) // frame
+    if count == 0:
+        return [(0, len(audio))] if len(audio) else []
+    energy = np.sqrt(np.mean(np.square(audio[:count * frame].reshape(count, frame)), axis=1))
+    level = 20.0 * np.log10(energy + 1e-10)
+    audible = level > -70.0
+    if not audible.any():
+        return []
+    floor = float(np.percentile(level[audible], 5))
+    peak = float(np.percentile(level[audible], 95))
+    if peak - floor < 10.0:
+        # No real pauses (continuous speech or music): only digital silence is cut.
+        speech = audible
+    else:
+        speech = level > floor + (peak - floor) * 0.3
+
+    # Runs of speech separated by pauses of at least min_silence frames.
+    min_gap = max(1, min_silence_ms // frame_ms)
+    idx = np.flatnonzero(speech)
+    breaks = np.flatnonzero(np.diff(idx) > min_gap)
+    starts = np.concatenate(([idx[0]], idx[breaks + 1]))
+    ends = np.concatenate((idx[breaks] + 1, [idx[-1] + 1]))
+    pad = pad_ms // frame_ms
+    max_frames = max(1, int(max_s * 1000) // frame_ms)
+
+    regions = []
+    for start, end in zip(starts.tolist(), ends.tolist()):
+        start, end = max(0, start - pad), min(count, end + pad)
+        if regions and regions[-1][1] >= start:
+            start = regions[-1][1]
+        if regions and end - regions[-1][0] <= max_frames:
+            regions[-1] = (regions[-1][0], end)
+        else:
+            regions.append((start, end))
+
+    segments = []
+    for start, end in regions:
+        while end - start > max_frames:
+            # Cut at the quietest frame of the second half of the window.
+            lo = start + max_frames // 2
+            cut = lo + int(np.argmin(energy[lo:start + max_frames]))
+            segments.append((start, cut))
+            start = cut
+        segments.append((start, end))
+    # The partial frame after the last whole one belongs to a range that reaches the end.
+    return [(a * frame, len(audio) if b >= count else b * frame) for a, b in segments if b > a]
+
+def _whisper_chunks(result, offset_s: float = 0.0):
+    """Timestamped chunks of a Whisper result, shifted by ``offset_s``."""
+    chunks = []
+    for chunk in getattr(result, "chunks", None) or []:
+        try:
+            chunks.append({
+                "start": round(float(chunk.start_ts) + offset_s, 2),
+                "end": round(float(chunk.end_ts) + offset_s, 2),
+                "text": str(chunk.text),
+            })
+        except Exception:
+            continue
+    return chunks
+
+def _whisper_generate(pipe, audio, streamer, gen_params):
+    """
+    Run Whisper on a float32 array. The binding converts the buffer into its
+    std::vector in C++; builds whose binding only takes a list are given one
+    built by ``tolist`` (still C speed), never a per-sample Python loop.
+    """
+    try:
+        return pipe.generate(audio, streamer=streamer, **gen_params)
+    except TypeError:
+        return pipe.generate(audio.tolist(), streamer=streamer, **gen_params)
 
 def _strip_attachment_block(text: str) -> str:
     if not text:
@@ -169,7 +368,33 @@ def _apply_image_max_sequence_length(pipe, max_sequence_length: int) -> bool:
     except Exception:
         return False
 
-def _image_tensor_to_attachments(image_tensor, max_bytes: int):
+_IMAGE_FORMATS = {
+    "png": ("PNG", "image/png", "png"),
+    "webp": ("WEBP", "image/webp", "webp"),
+    "jpeg": ("JPEG", "image/jpeg", "jpg"),
+    "jpg": ("JPEG", "image/jpeg", "jpg"),
+}
+
+
+def _encode_image(image, fmt: str, quality: int) -> bytes:
+    buffer = io.BytesIO()
+    if fmt == "PNG":
+        # Level 1 is several times faster than the default and barely larger.
+        image.save(buffer, format="PNG", compress_level=1)
+    elif fmt == "WEBP":
+        image.save(buffer, format="WEBP", quality=quality, method=4)
+    else:
+        image.convert("RGB").save(buffer, format="JPEG", quality=quality, optimize=True)
+    return buffer.getvalue()
+
+
+def _image_tensor_to_attachments(image_tensor, max_bytes: int, image_format: Optional[str] = None,
+                                 quality: Optional[int] = None):
+    """
+    Encode generated images into the blob store, in parallel, and return
+    attachment references (``blob``/``thumb`` digests) instead of data URLs.
+    Falls back to inline data URLs when the store cannot be written.
+    """
     try:
         import numpy as np
         from PIL import Image
@@ -187,7 +412,10 @@ def _image_tensor_to_attachments(image_tensor, max_bytes: int):
     if arr.ndim != 4:
         return []
 
-    attachments = []
+    fmt, mime, ext = _IMAGE_FORMATS.get(str(image_format or IMAGE_FORMAT).lower(), _IMAGE_FORMATS["png"])
+    quality = min(100, max(1, int(quality))) if isinstance(quality, int) and not isinstance(quality, bool) else IMAGE_QUALITY
+
+    images = []
     for idx, img in enumerate(arr, start=1):
         if img.ndim != 3:
             continue
@@ -198,29 +426,52 @@ def _image_tensor_to_attachments(image_tensor, max_bytes: int):
             if max_val <= 1.0:
                 img = img * 255.0
             img = np.clip(img, 0, 255).astype(np.uint8)
+        if img.shape[-1] == 1:
+            img = img[..., 0]
         try:
-            image = Image.fromarray(img)
+            images.append((idx, Image.fromarray(img)))
         except Exception:
             continue
-        buffer = io.BytesIO()
+
+    def encode(entry):
+        idx, image = entry
         try:
-            image.save(buffer, format="PNG")
+            raw = _encode_image(image, fmt, quality)
         except Exception:
-            continue
-        raw = buffer.getvalue()
+            return None
         if max_bytes and len(raw) > max_bytes:
-            continue
-        b64 = base64.b64encode(raw).decode("ascii")
-        attachments.append({
-            "name": f"generated_{idx}.png",
-            "content": f"data:image/png;base64,{b64}",
+            return None
+        att = {
+            "name": f"generated_{idx}.{ext}",
             "kind": "image",
-            "mime": "image/png",
+            "mime": mime,
             "truncated": False,
-        })
-    return attachments
+            "size": len(raw),
+            "width": image.width,
+            "height": image.height,
+        }
+        try:
+            att["blob"] = _blobs.put(raw)
+            att["content"] = ""
+            if IMAGE_THUMB_PX and max(image.size) > IMAGE_THUMB_PX:
+                thumb = image.copy()
+                thumb.thumbnail((IMAGE_THUMB_PX, IMAGE_THUMB_PX))
+                att["thumb"] = _blobs.put(_encode_image(thumb, "JPEG", 80))
+        except Exception:
+            att.pop("blob", None)
+            att["content"] = f"data:{mime};base64,{base64.b64encode(raw).decode('ascii')}"
+        return att
 
-def _extract_vlm_images(messages):
+    if len(images) > 1:
+        # PIL releases the GIL while encoding.
+        from concurrent.futures import ThreadPoolExecutor
+        with ThreadPoolExecutor(max_workers=min(len(images), os.cpu_count() or 1)) as pool:
+            encoded = list(pool.map(encode, images))
+    else:
+        encoded = [encode(entry) for entry in images]
+    return [att for att in encoded if att]
+
+def _extract_vlm_images(messages, cache: Optional["ImageTensorCache"] = None, limits: Optional[dict] = None):
     last_user = None
     for msg in reversed(messages):
         if msg.get("role") == "user":
@@ -233,9 +484,26 @@ def _extract_vlm_images(messages):
     for att in attachments:
         if (att.get("kind") or "").lower() != "image":
             continue
-        tensor = _decode_image_data(str(att.get("content", "")))
-        if tensor is not None:
-            images.append(tensor)
+        content = str(att.get("content", ""))
+        key = None
+        if cache is not None and cache.max_bytes:
+            key = att.get("blob") or hashlib.sha256(content.encode("utf-8")).hexdigest()
+            tensor = cache.get(key)
+            if tensor is not None:
+                images.append(tensor)
+                continue
+        raw = _blobs.read(att["blob"]) if att.get("blob") else _image_data_bytes(content)
+        array = _decode_image_array(raw, limits)
+        if array is None:
+            continue
+        try:
+            import openvino as ov
+            tensor = ov.Tensor(array)
+        except Exception:
+            continue
+        if key is not None:
+            cache.put(key, tensor, array.nbytes)
+        images.append(tensor)
     return images
 
 def _extract_asr_audio(messages):
@@ -253,27 +521,385 @@ def _extract_asr_audio(messages):
         mime = str(att.get("mime", "") or "").lower()
         if kind != "audio" and not content.startswith("data:audio/") and not mime.startswith("audio/"):
             continue
-        decoded = _decode_audio_data_url(content)
+        if att.get("blob"):
+            # Read straight from the store: uploads can be far larger than a data URL.
+            path = _blobs.path(att["blob"])
+            decoded = {"path": path, "mime": mime or "application/octet-stream"} if path else None
+        else:
+            decoded = _decode_audio_data_url(content)
         if not decoded:
             continue
         return decoded
     return None
 
+def _render_chat_prompt(tokenizer, msgs, add_gen_prompt: bool) -> str:
+    try:
+        return tokenizer.apply_chat_template(
+            msgs,
+            add_generation_prompt=add_gen_prompt,
+        )
+    except Exception:
+        prompt = ""
+        for msg in msgs:
+            prompt += f"<|im_start|>{msg['role']}\n{msg['content']}<|im_end|>\n"
+        if add_gen_prompt:
+            prompt += "<|im_start|>assistant\n"
+        return prompt
+
+def _end_chat(pipe, chat_cache) -> None:
+    if chat_cache.active and pipe is not None:
+        try:
+            pipe.finish_chat()
+        except Exception:
+            pass
+    chat_cache.reset()
+
+def _token_len(inputs) -> int:
+    try:
+        return int(inputs.input_ids.get_shape()[-1])
+    except Exception:
+        return 0
+
+def _token_ids(inputs) -> Optional[list]:
+    """Token ids of a single-prompt ``Tokenizer.encode`` result."""
+    try:
+        return [int(t) for t in inputs.input_ids.data[0]]
+    except Exception:
+        return None
+
+def _tokenized(ids):
+    """Pipeline input for a list of token ids."""
+    import numpy as np
+    import openvino as ov
+    import openvino_genai as ov_genai
+    input_ids = np.array([ids], dtype=np.int64)
+    return ov_genai.TokenizedInputs(ov.Tensor(input_ids), ov.Tensor(np.ones_like(input_ids)))
+
+def _generated_ids(result) -> Optional[list]:
+    """Ids the pipeline generated for the first sequence, end-of-turn token included."""
+    try:
+        return [int(t) for t in result.tokens[0]]
+    except Exception:
+        return None
+
+def _count_tokens(tokenizer, text: str) -> Optional[int]:
+    if tokenizer is None:
+        return None
+    if not text:
+        return 0
+    try:
+        return _token_len(tokenizer.encode(text, add_special_tokens=False))
+    except Exception:
+        return None
+
+def _speculative_stats(result) -> dict:
+    """Acceptance rate and tokens per main-model step from speculative decoding metrics."""
+    metrics = getattr(result, "extended_perf_metrics", None)
+    if metrics is None:
+        return {}
+    try:
+        accepted = int(metrics.get_num_accepted_tokens())
+        draft_tokens = int(metrics.draft_model_metrics.get_num_generated_tokens())
+        generated = int(metrics.main_model_metrics.get_num_generated_tokens())
+        raw = metrics.main_model_metrics.raw_metrics
+        steps = len(getattr(raw, "m_token_infer_durations", None) or getattr(raw, "m_durations", None) or [])
+    except Exception:
+        return {}
+    stats = {
+        "draft_tokens": draft_tokens,
+        "accepted_tokens": accepted,
+        "acceptance_rate": round(accepted / draft_tokens, 3) if draft_tokens else 0,
+    }
+    if steps:
+        stats["tokens_per_step"] = round(generated / steps, 2)
+    return stats
+
+def _prompt_lookup_stats(result) -> dict:
+    """Tokens accepted from prompt n-gram candidates and tokens per model step."""
+    metrics = getattr(result, "perf_metrics", None)
+    if metrics is None:
+        return {}
+    try:
+        generated = int(metrics.get_num_generated_tokens())
+        raw = metrics.raw_metrics
+        steps = len(getattr(raw, "m_token_infer_durations", None) or getattr(raw, "m_durations", None) or [])
+    except Exception:
+        return {}
+    if not steps:
+        return {}
+    return {
+        "accepted_tokens": max(0, generated - steps),
+        "tokens_per_step": round(generated / steps, 2),
+    }
+
 def _is_prompt_too_long(err: Exception) -> bool:
     if not err:
         return False
     msg = str(err)
     return "m_max_prompt_len" in msg or "MAX_PROMPT_LEN" in msg or "prompt_len" in msg
 
+def _trim_for_retry(messages):
+    """
+    Shrink the chat after a prompt-too-long error: drop the oldest turn, or
+    halve the last message once it is the only one left. None when nothing
+    can be trimmed any more.
+    """
+    system = [m for m in messages[:1] if m.get("role") == "system"]
+    rest = list(messages[len(system):])
+    if len(rest) > 1:
+        rest.pop(0)
+        while len(rest) > 1 and rest[0].get("role") != "user":
+            rest.pop(0)
+        return system + rest
+    if not rest:
+        return None
+    content = str(rest[0].get("content") or "")
+    if len(content) < MIN_TRIM_CHARS:
+        return None
+    last = dict(rest[0])
+    last["content"] = content[:len(content) // 2] + "\n[...truncated]"
+    return system + [last]
+
 def _is_image_seq_mismatch(err: Exception) -> bool:
     if not err:
         return False
     msg = str(err)
     return ("max_sequence_length" in msg and "reshape" in msg and "T5EncoderModel" in msg)
 
-from app.config import DEFAULT_CONFIG, MAX_IMAGE_BYTES
+from app.config import (
+    BATCH_MAX_SIZE,
+    ASR_LONG_AUDIO_S,
+    ASR_SEGMENT_S,
+    BLOBS_DIR,
+    BLOB_FALLBACK_DIRS,
+    DEFAULT_CONFIG,
+    IMAGE_FORMAT,
+    IMAGE_QUALITY,
+    IMAGE_THUMB_PX,
+    MAX_IMAGE_BYTES,
+    MODEL_WARMUP_TOKENS,
+    VLM_IMAGE_CACHE_MB,
+)
+from app.core.blob_store import BlobStore
+from app.core.batching import ContinuousBatchingServer
+from app.core.chat_cache import ChatKVCache
+from app.core.gen_metrics import GenerationTimer, perf_metrics
+from app.core.image_cache import ImageTensorCache
+from app.core.token_coalescer import TimedCoalescer
 from app.utils.config_loader import resolve_supported_setting_keys
 
+DEFAULT_NUM_ASSISTANT_TOKENS = 5
+DEFAULT_MAX_NGRAM_SIZE = 3
+DEFAULT_WARMUP_TOKENS = 4
+MAX_TRIM_RETRIES = 8
+MIN_TRIM_CHARS = 256
+WARMUP_PROMPT = "Hello"
+
+_blobs = BlobStore(BLOBS_DIR, BLOB_FALLBACK_DIRS)
+
+
+def _generation_params(runtime, ui_config):
+    """
+    Split a UI config into pipeline generation parameters and the options
+    handled by this process (chat template, KV reuse, assisted decoding).
+    """
+    gen_params = DEFAULT_CONFIG.copy()
+    if ui_config:
+        gen_params.update(ui_config)
+
+    options = {
+        "add_generation_prompt": gen_params.pop("add_generation_prompt", True),
+        "reuse_kv_cache": bool(gen_params.pop("reuse_kv_cache", True)),
+        "prompt_lookup": bool(gen_params.pop("prompt_lookup", False)),
+        "image_format": gen_params.pop("image_format", None),
+        "image_quality": gen_params.pop("image_quality", None),
+        "assistant": {
+            k: gen_params.pop(k, None)
+            for k in ("num_assistant_tokens", "assistant_confidence_threshold", "max_ngram_size")
+        },
+    }
+    gen_params.pop("enable_thinking", None)
+    for k in ["system_prompt", "max_history_turns", "skip_special_tokens"]:
+        if k in gen_params:
+            gen_params.pop(k)
+
+    supported_keys = None
+    if runtime.model_kind in ("image", "asr"):
+        supported_keys = runtime.supported_keys
+    if not supported_keys:
+        supported_keys = resolve_supported_setting_keys(
+            model_name=runtime.model_path.name if runtime.model_path else None,
+            model_path=str(runtime.model_path) if runtime.model_path else None,
+        )
+    if supported_keys:
+        gen_params = {k: v for k, v in gen_params.items() if k in supported_keys}
+    return gen_params, options
+
+
+def _apply_assistant_params(runtime, gen_params, assistant) -> None:
+    """Add the parameters a draft-model or prompt-lookup pipeline requires."""
+    if runtime.draft_path and not runtime.serving_mode:
+        threshold = assistant["assistant_confidence_threshold"]
+        if isinstance(threshold, (int, float)) and threshold > 0:
+            gen_params["assistant_confidence_threshold"] = float(threshold)
+        else:
+            num = assistant["num_assistant_tokens"]
+            gen_params["num_assistant_tokens"] = int(num) if isinstance(num, int) and num > 0 else DEFAULT_NUM_ASSISTANT_TOKENS
+    if runtime.prompt_lookup:
+        num = assistant["num_assistant_tokens"]
+        ngram = assistant["max_ngram_size"]
+        gen_params["num_assistant_tokens"] = int(num) if isinstance(num, int) and num > 0 else DEFAULT_NUM_ASSISTANT_TOKENS
+        gen_params["max_ngram_size"] = int(ngram) if isinstance(ngram, int) and ngram > 0 else DEFAULT_MAX_NGRAM_SIZE
+
+
+def _batch_chunks(items, max_size: int):
+    """
+    Group batch items whose generation parameters are identical (one
+    GenerationConfig per pipeline call), in order of first appearance, and
+    split each group into chunks of at most ``max_size`` prompts.
+    """
+    groups = {}
+    for item in items:
+        key = json.dumps(item["params"], sort_keys=True, default=str)
+        groups.setdefault(key, []).append(item)
+    size = max(1, max_size)
+    for group in groups.values():
+        for offset in range(0, len(group), size):
+            yield group[offset:offset + size]
+
+
+def _run_batch(runtime, ov_genai, items, stop_event, send) -> dict:
+    """
+    Offline generation for a list of prompts. Compatible prompts go through
+    ``LLMPipeline.generate`` as one list; a chunk the pipeline cannot batch
+    (e.g. static NPU shapes, assisted decoding) runs one prompt at a time.
+    Each result is sent as a ``batch_item`` event; returns aggregate stats.
+    """
+    prepared = []
+    for index, item in enumerate(items):
+        gen_params, options = _generation_params(runtime, item.get("config"))
+        _apply_assistant_params(runtime, gen_params, options["assistant"])
+        prepared.append({
+            "index": index,
+            "id": item.get("id"),
+            "prompt": _render_chat_prompt(runtime.tokenizer, item.get("messages") or [], options["add_generation_prompt"]),
+            "params": gen_params,
+        })
+
+    totals = {"items": len(prepared), "completed": 0, "errors": 0, "tokens": 0, "input_tokens": 0,
+              "batches": 0, "sequential": 0}
+    start_time = time.time()
+
+    def emit(entry, text, elapsed, batch_size):
+        input_tokens = _count_tokens(runtime.tokenizer, entry["prompt"]) or 0
+        output_tokens = _count_tokens(runtime.tokenizer, text) or 0
+        totals["completed"] += 1
+        totals["tokens"] += output_tokens
+        totals["input_tokens"] += input_tokens
+        send({
+            "type": "batch_item",
+            "index": entry["index"],
+            "id": entry["id"],
+            "text": text,
+            "input_tokens": input_tokens,
+            "output_tokens": output_tokens,
+            "time": round(elapsed, 3),
+            "speed": round(output_tokens / elapsed, 2) if elapsed > 0 else 0,
+            "batch_size": batch_size,
+        })
+
+    def fail(entry, err):
+        totals["errors"] += 1
+        send({"type": "batch_item", "index": entry["index"], "id": entry["id"], "error": f"Gen Error: {str(err)}"})
+
+    for chunk in _batch_chunks(prepared, BATCH_MAX_SIZE):
+        if stop_event.is_set():
+            break
+        try:
+            gen_cfg = ov_genai.GenerationConfig(**chunk[0]["params"])
+        except Exception as e:
+            for entry in chunk:
+                fail(entry, e)
+            continue
+
+        texts = None
+        if len(chunk) > 1:
+            chunk_start = time.perf_counter()
+            try:
+                result = runtime.pipe.generate([entry["prompt"] for entry in chunk], generation_config=gen_cfg)
+                texts = [str(text) for text in getattr(result, "texts", None) or []]
+            except Exception:
+                texts = None
+            if texts is not None and len(texts) == len(chunk):
+                elapsed = time.perf_counter() - chunk_start
+                totals["batches"] += 1
+                for entry, text in zip(chunk, texts):
+                    emit(entry, text, elapsed, len(chunk))
+                continue
+
+        for entry in chunk:
+            if stop_event.is_set():
+                break
+            item_start = time.perf_counter()
+            try:
+                result = runtime.pipe.generate(entry["prompt"], generation_config=gen_cfg)
+                texts = getattr(result, "texts", None)
+                text = str(texts[0]) if texts else str(result)
+            except Exception as e:
+                fail(entry, e)
+                continue
+            totals["sequential"] += 1
+            emit(entry, text, time.perf_counter() - item_start, 1)
+
+    elapsed = time.time() - start_time
+    totals.update({
+        "time": round(elapsed, 2),
+        "speed": round(totals["tokens"] / elapsed, 2) if elapsed > 0 else 0,
+        "items_per_s": round(totals["completed"] / elapsed, 3) if elapsed > 0 else 0,
+        "cancelled": stop_event.is_set(),
+    })
+    return totals
+
+
+def _run_warmup(runtime, cmd_queue, max_new_tokens: int) -> dict:
+    """
+    Run a cold and a warm synthetic generation and time their first token.
+    Stops as soon as a command is waiting so real requests are not delayed.
+    """
+    import openvino_genai as ov_genai
+
+    params = {"max_new_tokens": max_new_tokens}
+    if runtime.prompt_lookup:
+        params.update(num_assistant_tokens=DEFAULT_NUM_ASSISTANT_TOKENS, max_ngram_size=DEFAULT_MAX_NGRAM_SIZE)
+    elif runtime.draft_path:
+        params["num_assistant_tokens"] = DEFAULT_NUM_ASSISTANT_TOKENS
+    gen_cfg = ov_genai.GenerationConfig(**params)
+    prompt = _render_chat_prompt(runtime.tokenizer, [{"role": "user", "content": WARMUP_PROMPT}], True)
+
+    ttfts = []
+    for _ in range(2):
+        if not cmd_queue.empty():
+            break
+        start = time.perf_counter()
+        first = []
+
+        def streamer(_text):
+            if not first:
+                first.append(time.perf_counter() - start)
+            return not cmd_queue.empty()
+
+        runtime.pipe.generate(prompt, generation_config=gen_cfg, streamer=streamer)
+        if not first:
+            break
+        ttfts.append(round(first[0] * 1000, 1))
+
+    stats = {"interrupted": len(ttfts) < 2}
+    if ttfts:
+        stats["cold_ttft_ms"] = ttfts[0]
+    if len(ttfts) > 1:
+        stats["warm_ttft_ms"] = ttfts[1]
+    return stats
+
 
 def llm_process_entry(cmd_queue, res_queue, stop_event):
     """
@@ -288,21 +914,61 @@ def llm_process_entry(cmd_queue, res_queue, stop_event):
         res_queue.put({"type": "error", "msg": f"Init Error: {str(e)}"})
         return
 
+    # A shared-memory channel stops waiting for room once the backend is gone.
+    watch = getattr(res_queue, "watch", None)
+    parent = multiprocessing.parent_process()
+    if watch is not None and parent is not None:
+        watch(parent.is_alive)
+
     runtime = RuntimeState()
     ov_genai = None
+    server = None
+    chat_cache = ChatKVCache()
+    image_cache = ImageTensorCache(VLM_IMAGE_CACHE_MB * 1024 * 1024)
+    vision_limits = None
 
     while True:
         try:
-            cmd = cmd_queue.get()
+            if server is not None and server.has_work():
+                if stop_event.is_set():
+                    server.cancel_all()
+                    stop_event.clear()
+                try:
+                    cmd = cmd_queue.get_nowait()
+                except queue.Empty:
+                    server.step()
+                    continue
+            else:
+                cmd = cmd_queue.get()
 
             if cmd is None:
                 break
 
             cmd_type = cmd.get("type")
 
+            if cmd_type == "ping":
+                res_queue.put({"type": "pong"})
+                continue
+
+            if cmd_type == "cancel":
+                if server is not None:
+                    server.cancel(cmd.get("job_id"))
+                continue
+
+            if cmd_type == "chat_reset":
+                if chat_cache.matches(cmd.get("session_id")):
+                    _end_chat(runtime.pipe, chat_cache)
+                continue
+
             if cmd_type == "load":
+                if server is not None:
+                    server.cancel_all()
+                    server = None
+                _end_chat(runtime.pipe, chat_cache)
+                chat_cache.disabled = False
                 try:
                     src, mid, path, dev, max_prompt_len = cmd["args"]
+                    options = cmd.get("options") or {}
 
                     def progress(stage: str, message: str) -> None:
                         res_queue.put({"type": "load_stage", "stage": stage, "message": message})
@@ -315,14 +981,77 @@ def llm_process_entry(cmd_queue, res_queue, stop_event):
                         dev,
                         max_prompt_len=max_prompt_len,
                         progress_cb=progress,
+                        serving=options.get("serving"),
+                        draft=options.get("draft"),
+                        prompt_lookup=bool(options.get("prompt_lookup")),
                     )
-                    res_queue.put({"type": "loaded", "mid": mid, "dev": final_dev, "kind": model_kind})
+                    if runtime.serving_mode:
+                        server = ContinuousBatchingServer(runtime.pipe, runtime.tokenizer, res_queue.put)
+                    # Cached tensors were sized for the previous model's encoder.
+                    image_cache.clear()
+                    vision_limits = _infer_vision_limits(runtime.model_path) if model_kind == "vlm" else None
+                    res_queue.put({
+                        "type": "loaded",
+                        "mid": mid,
+                        "dev": final_dev,
+                        "kind": model_kind,
+                        "serving": runtime.serving_mode,
+                        "concurrency": runtime.serving_concurrency if runtime.serving_mode else 1,
+                        "draft": runtime.draft_path,
+                    })
                 except Exception as e:
                     res_queue.put({"type": "error", "msg": f"Load Error: {str(e)}"})
+                    continue
+
+                warmup = options.get("warmup")
+                warmup_tokens = MODEL_WARMUP_TOKENS
+                if warmup is not None:
+                    warmup_tokens = (MODEL_WARMUP_TOKENS or DEFAULT_WARMUP_TOKENS) if warmup else 0
+                if warmup_tokens and model_kind in ("llm", "vlm") and not runtime.serving_mode:
+                    res_queue.put({"type": "load_stage", "stage": "warmup", "message": "Warming up"})
+                    try:
+                        warmup_stats = _run_warmup(runtime, cmd_queue, warmup_tokens)
+                    except Exception as e:
+                        warmup_stats = {"error": str(e)}
+                    res_queue.put({"type": "warmup", "stats": warmup_stats})
+
+            elif cmd_type == "batch":
+                job_id = cmd.get("job_id")
+
+                def send(payload):
+                    payload["job_id"] = job_id
+                    res_queue.put(payload)
+
+                if not runtime.pipe or runtime.model_kind != "llm" or server is not None:
+                    send({"type": "error", "msg": "Batch inference needs a text model loaded without serving mode"})
+                    continue
+                if ov_genai is None:
+                    try:
+                        import openvino_genai as ov_genai
+                    except Exception as e:
+                        send({"type": "error", "msg": f"Init Error: {str(e)}"})
+                        continue
+                stop_event.clear()
+                # Batched calls cannot run on top of a chat-mode KV cache.
+                _end_chat(runtime.pipe, chat_cache)
+                try:
+                    stats = _run_batch(runtime, ov_genai, cmd.get("items") or [], stop_event, send)
+                except Exception as e:
+                    send({"type": "error", "msg": f"Gen Error: {str(e)}"})
+                    continue
+                send({"type": "finished", "stats": stats})
 
             elif cmd_type == "generate":
+                job_id = cmd.get("job_id")
+                session_id = cmd.get("session_id")
+
+                def send(payload):
+                    if job_id:
+                        payload["job_id"] = job_id
+                    res_queue.put(payload)
+
                 if not runtime.pipe:
-                    res_queue.put({"type": "error", "msg": "Model not loaded in process"})
+                    send({"type": "error", "msg": "Model not loaded in process"})
                     continue
 
                 messages = cmd["messages"]
@@ -330,39 +1059,29 @@ def llm_process_entry(cmd_queue, res_queue, stop_event):
 
                 stop_event.clear()
 
-                gen_params = DEFAULT_CONFIG.copy()
-                if ui_config:
-                    gen_params.update(ui_config)
-
-                add_gen_prompt = gen_params.pop("add_generation_prompt", True)
-                _ = gen_params.pop("enable_thinking", True)
-
-                for k in ["system_prompt", "max_history_turns", "skip_special_tokens"]:
-                    if k in gen_params:
-                        gen_params.pop(k)
-
-                supported_keys = None
-                if runtime.model_kind in ("image", "asr"):
-                    supported_keys = runtime.supported_keys
-                if not supported_keys:
-                    supported_keys = resolve_supported_setting_keys(
-                        model_name=runtime.model_path.name if runtime.model_path else None,
-                        model_path=str(runtime.model_path) if runtime.model_path else None,
-                    )
-                if supported_keys:
-                    gen_params = {k: v for k, v in gen_params.items() if k in supported_keys}
+                gen_params, options = _generation_params(runtime, ui_config)
+                add_gen_prompt = options["add_generation_prompt"]
+                reuse_kv_cache = options["reuse_kv_cache"]
+                prompt_lookup = options["prompt_lookup"]
 
                 if ov_genai is None:
                     try:
                         import openvino_genai as ov_genai
                     except Exception as e:
-                        res_queue.put({"type": "error", "msg": f"Init Error: {str(e)}"})
+                        send({"type": "error", "msg": f"Init Error: {str(e)}"})
                         continue
 
+                # Prompt lookup is a pipeline construction flag, chosen when the model is
+                # loaded: rebuilding the pipeline here could recompile for minutes.
+                prompt_lookup_ignored = (
+                    runtime.model_kind == "llm" and prompt_lookup and not runtime.prompt_lookup_requested
+                )
+                _apply_assistant_params(runtime, gen_params, options["assistant"])
+
                 if runtime.model_kind == "image":
                     prompt = _extract_last_user_prompt(messages)
                     if not prompt:
-                        res_queue.put({"type": "error", "msg": "Gen Error: Empty prompt"})
+                        send({"type": "error", "msg": "Gen Error: Empty prompt"})
                         continue
                     if isinstance(gen_params.get("negative_prompt"), str) and not gen_params["negative_prompt"].strip():
                         gen_params.pop("negative_prompt", None)
@@ -385,9 +1104,10 @@ def llm_process_entry(cmd_queue, res_queue, stop_event):
                                     runtime.device,
                                     max_prompt_len=runtime.max_prompt_len or 16384,
                                     image_max_sequence_length=max_seq,
+                                    **runtime.load_options,
                                 )
                             except Exception as e:
-                                res_queue.put({"type": "error", "msg": f"Gen Error: Failed to reload image pipeline: {str(e)}"})
+                                send({"type": "error", "msg": f"Gen Error: Failed to reload image pipeline: {str(e)}"})
                                 continue
                         gen_params["max_sequence_length"] = max_seq
                     start_time = time.time()
@@ -395,9 +1115,11 @@ def llm_process_entry(cmd_queue, res_queue, stop_event):
                     retry_on_mismatch = True
                     try:
                         image_tensor = runtime.pipe.generate(prompt, **gen_params)
-                        attachments = _image_tensor_to_attachments(image_tensor, MAX_IMAGE_BYTES)
+                        attachments = _image_tensor_to_attachments(
+                            image_tensor, MAX_IMAGE_BYTES, options["image_format"], options["image_quality"]
+                        )
                         if attachments:
-                            res_queue.put({"type": "image", "attachments": attachments})
+                            send({"type": "image", "attachments": attachments})
                     except Exception as e:
                         if retry_on_mismatch and _is_image_seq_mismatch(e) and isinstance(max_seq, int) and max_seq > 0:
                             retry_on_mismatch = False
@@ -409,19 +1131,22 @@ def llm_process_entry(cmd_queue, res_queue, stop_event):
                                     runtime.device,
                                     max_prompt_len=runtime.max_prompt_len or 16384,
                                     image_max_sequence_length=max_seq,
+                                    **runtime.load_options,
                                     cache_bust=f"retry{int(time.time())}",
                                 )
                                 image_tensor = runtime.pipe.generate(prompt, **gen_params)
-                                attachments = _image_tensor_to_attachments(image_tensor, MAX_IMAGE_BYTES)
+                                attachments = _image_tensor_to_attachments(
+                                    image_tensor, MAX_IMAGE_BYTES, options["image_format"], options["image_quality"]
+                                )
                                 if attachments:
-                                    res_queue.put({"type": "image", "attachments": attachments})
+                                    send({"type": "image", "attachments": attachments})
                             except Exception as retry_err:
-                                res_queue.put({"type": "error", "msg": f"Gen Error: {str(retry_err)}"})
+                                send({"type": "error", "msg": f"Gen Error: {str(retry_err)}"})
                         else:
-                            res_queue.put({"type": "error", "msg": f"Gen Error: {str(e)}"})
+                            send({"type": "error", "msg": f"Gen Error: {str(e)}"})
                     finally:
                         elapsed = time.time() - start_time
-                        res_queue.put({
+                        send({
                             "type": "finished",
                             "stats": {
                                 "tokens": 0,
@@ -435,34 +1160,34 @@ def llm_process_entry(cmd_queue, res_queue, stop_event):
                 if runtime.model_kind == "asr":
                     audio_payload = _extract_asr_audio(messages)
                     if not audio_payload:
-                        res_queue.put({"type": "error", "msg": "Gen Error: Please attach an audio file (WAV, 16kHz)."})
+                        send({"type": "error", "msg": "Gen Error: Please attach an audio file (WAV, 16kHz)."})
                         continue
                     decoded = None
                     try:
-                        decoded = _decode_wav_bytes(audio_payload["bytes"])
+                        decoded = _decode_wav_bytes(audio_payload.get("bytes") or audio_payload.get("path"))
                     except Exception:
                         decoded = None
                     if not decoded:
-                        res_queue.put({"type": "error", "msg": "Gen Error: Unsupported audio format. Please upload WAV audio."})
+                        send({"type": "error", "msg": "Gen Error: Unsupported audio format. Please upload WAV audio."})
                         continue
                     audio, sr = decoded
                     if audio is None:
-                        res_queue.put({"type": "error", "msg": "Gen Error: Failed to decode audio."})
+                        send({"type": "error", "msg": "Gen Error: Failed to decode audio."})
                         continue
-                    audio = _resample_audio(audio, sr, 16000)
                     try:
-                        audio_list = [float(x) for x in audio]
+                        audio = _resample_audio(audio, sr, 16000)
                     except Exception:
-                        try:
-                            audio_list = list(audio)
-                        except Exception:
-                            res_queue.put({"type": "error", "msg": "Gen Error: Failed to prepare audio for inference."})
-                            continue
+                        send({"type": "error", "msg": "Gen Error: Failed to prepare audio for inference."})
+                        continue
 
                     token_count = 0
                     start_time = time.time()
+                    timer = GenerationTimer()
+                    result = None
 
                     streamed = False
+                    generated_any = False
+                    coalescer = TimedCoalescer(lambda frame: send({"type": "token", "token": frame}))
 
                     def asr_streamer(chunk: str):
                         nonlocal token_count
@@ -471,95 +1196,251 @@ def llm_process_entry(cmd_queue, res_queue, stop_event):
                             return True
                         if chunk:
                             token_count += 1
+                            timer.mark()
                             streamed = True
-                            res_queue.put({"type": "token", "token": chunk})
+                            coalescer.push(chunk)
                         return False
 
+                    def flush_tokens():
+                        coalescer.flush()
+
+                    audio_s = len(audio) / 16000.0
+                    if ASR_LONG_AUDIO_S and audio_s > ASR_LONG_AUDIO_S:
+                        segments = _vad_segments(audio, 16000, ASR_SEGMENT_S)
+                    else:
+                        segments = [(0, len(audio))]
+                    timestamps = []
+                    output_tokens = 0
+
                     try:
-                        result = runtime.pipe.generate(audio_list, streamer=asr_streamer, **gen_params)
-                        text = ""
-                        try:
-                            texts = getattr(result, "texts", None)
-                            if texts:
-                                text = str(texts[0])
-                        except Exception:
-                            text = str(result) if result is not None else ""
-                        if text and not streamed:
-                            res_queue.put({"type": "token", "token": text})
+                        for index, (seg_start, seg_end) in enumerate(segments):
+                            if stop_event.is_set():
+                                break
+                            streamed = False
+                            if index and generated_any:
+                                # Partial text of the previous segment is already on screen.
+                                send({"type": "token", "token": " "})
+                            result = _whisper_generate(runtime.pipe, audio[seg_start:seg_end], asr_streamer, gen_params)
+                            text = ""
+                            try:
+                                texts = getattr(result, "texts", None)
+                                if texts:
+                                    text = str(texts[0])
+                            except Exception:
+                                text = str(result) if result is not None else ""
+                            flush_tokens()
+                            if text and not streamed:
+                                send({"type": "token", "token": text})
+                            generated_any = generated_any or bool(text) or streamed
+                            timestamps.extend(_whisper_chunks(result, seg_start / 16000.0))
+                            metrics = perf_metrics(result)
+                            if metrics is not None:
+                                try:
+                                    output_tokens += int(metrics.get_num_generated_tokens())
+                                except Exception:
+                                    pass
                     except Exception as e:
-                        res_queue.put({"type": "error", "msg": f"Gen Error: {str(e)}"})
+                        flush_tokens()
+                        send({"type": "error", "msg": f"Gen Error: {str(e)}"})
                     finally:
+                        flush_tokens()
                         elapsed = time.time() - start_time
-                        speed = token_count / elapsed if elapsed > 0 else 0
-                        res_queue.put({
-                            "type": "finished",
-                            "stats": {
-                                "tokens": token_count,
-                                "time": round(elapsed, 2),
-                                "speed": round(speed, 2),
-                            },
-                        })
+                        if len(segments) > 1:
+                            # A result's PerfMetrics cover one segment; time the whole clip.
+                            latency = timer.stats(output_tokens=output_tokens or token_count)
+                        else:
+                            latency = timer.stats(result)
+                        tokens = latency.get("output_tokens", token_count)
+                        speed = tokens / elapsed if elapsed > 0 else 0
+                        stats = {
+                            "tokens": tokens,
+                            "chunks": token_count,
+                            "time": round(elapsed, 2),
+                            "speed": round(speed, 2),
+                            "ipc_frames_saved": coalescer.frames_saved,
+                            "audio_s": round(audio_s, 2),
+                            "segments": len(segments),
+                        }
+                        stats.update(latency)
+                        if timestamps:
+                            stats["timestamps"] = timestamps
+                        send({"type": "finished", "stats": stats})
+                    continue
+
+                if server is not None:
+                    try:
+                        gen_cfg = ov_genai.GenerationConfig(**gen_params)
+                        prompt = _render_chat_prompt(runtime.tokenizer, messages, add_gen_prompt)
+                        server.add(job_id, prompt, gen_cfg)
+                    except Exception as e:
+                        send({"type": "error", "msg": f"Gen Error: {str(e)}"})
+                        send({"type": "finished", "stats": {"tokens": 0, "time": 0, "speed": 0}})
                     continue
 
                 token_count = 0
                 start_time = time.time()
                 prompt = ""
+                generated = []
+                kv_stats = {}
+                spec_stats = {}
+                results = []
+                context_trims = 0
+                timer = GenerationTimer()
+                coalescer = TimedCoalescer(lambda frame: send({"type": "token", "token": frame}))
+                use_chat_cache = (
+                    reuse_kv_cache
+                    and bool(session_id)
+                    and runtime.model_kind == "llm"
+                    and not chat_cache.disabled
+                )
 
                 def streamer_cb(sub_text):
                     nonlocal token_count
                     if stop_event.is_set():
                         return True
                     token_count += 1
-                    res_queue.put({"type": "token", "token": sub_text})
+                    timer.mark()
+                    generated.append(sub_text)
+                    coalescer.push(sub_text)
                     return False
 
+                def flush_tokens():
+                    coalescer.flush()
+
+                def decoding_stats(result):
+                    if runtime.prompt_lookup:
+                        return {"prompt_lookup": True, **_prompt_lookup_stats(result)}
+                    return _speculative_stats(result)
+
                 try:
                     gen_cfg = ov_genai.GenerationConfig(**gen_params)
                     streamer = ov_genai.TextStreamer(runtime.tokenizer, streamer_cb)
 
+                    def run_cached_generate():
+                        # Chat mode keeps the KV cache between turns; feed only
+                        # the tokens the cache has not seen yet. The whole prompt
+                        # is tokenized and compared id by id with what the cache
+                        # holds, so a template that re-renders earlier turns
+                        # differently is a miss rather than a wrong context.
+                        inputs = runtime.tokenizer.encode(prompt, add_special_tokens=False)
+                        prompt_ids = _token_ids(inputs)
+                        delta = chat_cache.delta(session_id, prompt_ids) if prompt_ids is not None else None
+                        cached_tokens = chat_cache.tokens if delta is not None else 0
+                        if delta is None:
+                            _end_chat(runtime.pipe, chat_cache)
+                            runtime.pipe.start_chat()
+                            chat_cache.active = True
+                            chat_cache.session_id = session_id
+                            chat_cache.misses += 1
+                        else:
+                            chat_cache.hits += 1
+                            inputs = _tokenized(delta)
+                        kv_stats.update({
+                            "kv_cache": "hit" if delta is not None else "miss",
+                            "prefill_tokens": len(delta) if delta is not None else _token_len(inputs),
+                            "cached_tokens": cached_tokens,
+                        })
+                        result = runtime.pipe.generate(inputs, generation_config=gen_cfg, streamer=streamer)
+                        results.append(result)
+                        spec_stats.update(decoding_stats(result))
+                        return prompt_ids, _generated_ids(result)
+
                     def run_generate(msgs):
                         nonlocal token_count, start_time, prompt
-                        try:
-                            prompt = runtime.tokenizer.apply_chat_template(
-                                msgs,
-                                add_generation_prompt=add_gen_prompt,
-                            )
-                        except Exception:
-                            prompt = ""
-                            for msg in msgs:
-                                prompt += f"<|im_start|>{msg['role']}\n{msg['content']}<|im_end|>\n"
-                            if add_gen_prompt:
-                                prompt += "<|im_start|>assistant\n"
+                        prompt = _render_chat_prompt(runtime.tokenizer, msgs, add_gen_prompt)
                         token_count = 0
                         start_time = time.time()
+                        timer.restart()
                         if runtime.model_kind == "vlm":
-                            images = _extract_vlm_images(msgs)
+                            hits = image_cache.hits
+                            images = _extract_vlm_images(msgs, image_cache, vision_limits)
                             if images:
-                                runtime.pipe.generate(prompt, images=images, generation_config=gen_cfg, streamer=streamer)
+                                kv_stats["image_cache_hits"] = image_cache.hits - hits
+                            if images:
+                                result = runtime.pipe.generate(prompt, images=images, generation_config=gen_cfg, streamer=streamer)
                             else:
-                                runtime.pipe.generate(prompt, generation_config=gen_cfg, streamer=streamer)
-                        else:
-                            runtime.pipe.generate(prompt, generation_config=gen_cfg, streamer=streamer)
+                                result = runtime.pipe.generate(prompt, generation_config=gen_cfg, streamer=streamer)
+                            results.append(result)
+                            return
+                        if use_chat_cache:
+                            try:
+                                prompt_ids, generated_ids = run_cached_generate()
+                            except Exception as e:
+                                _end_chat(runtime.pipe, chat_cache)
+                                if generated or _is_prompt_too_long(e):
+                                    raise
+                                # The pipeline cannot run chat mode on token inputs
+                                # (e.g. some NPU builds): stop trying for this model.
+                                chat_cache.disabled = True
+                                kv_stats.clear()
+                                kv_stats["kv_cache"] = "off"
+                            else:
+                                if stop_event.is_set() or prompt_ids is None or generated_ids is None:
+                                    # Cancelled, or the cache contents cannot be checked next turn.
+                                    _end_chat(runtime.pipe, chat_cache)
+                                else:
+                                    chat_cache.commit(session_id, prompt_ids, generated_ids)
+                                return
+                        elif chat_cache.active:
+                            _end_chat(runtime.pipe, chat_cache)
+                        result = runtime.pipe.generate(prompt, generation_config=gen_cfg, streamer=streamer)
+                        results.append(result)
+                        spec_stats.update(decoding_stats(result))
 
-                    run_generate(messages)
+                    attempt = messages
+                    while True:
+                        try:
+                            run_generate(attempt)
+                            break
+                        except Exception as e:
+                            if generated or context_trims >= MAX_TRIM_RETRIES or not _is_prompt_too_long(e):
+                                raise
+                            trimmed = _trim_for_retry(attempt)
+                            if trimmed is None:
+                                raise
+                            # The prompt does not fit MAX_PROMPT_LEN: retry with less context.
+                            attempt = trimmed
+                            context_trims += 1
                 except Exception as e:
+                    flush_tokens()
                     limit = getattr(runtime, "max_prompt_len", None)
                     if runtime.model_kind == "vlm" and _is_prompt_too_long(e):
                         hint = f"VLM prompt too long (limit {limit or 1024}). Reduce history or shorten input."
-                        res_queue.put({"type": "error", "msg": f"Gen Error: {hint}"})
+                        send({"type": "error", "msg": f"Gen Error: {hint}"})
                     else:
-                        res_queue.put({"type": "error", "msg": f"Gen Error: {str(e)}"})
+                        send({"type": "error", "msg": f"Gen Error: {str(e)}"})
                 finally:
+                    flush_tokens()
                     elapsed = time.time() - start_time
-                    speed = token_count / elapsed if elapsed > 0 else 0
-                    res_queue.put({
-                        "type": "finished",
-                        "stats": {
-                            "tokens": token_count,
-                            "time": round(elapsed, 2),
-                            "speed": round(speed, 2),
-                        },
-                    })
+                    result = results[-1] if results else None
+                    if perf_metrics(result) is not None:
+                        latency = timer.stats(result)
+                    else:
+                        input_tokens = kv_stats.get("prefill_tokens")
+                        if input_tokens is None:
+                            input_tokens = _count_tokens(runtime.tokenizer, prompt)
+                        latency = timer.stats(
+                            input_tokens=input_tokens,
+                            output_tokens=_count_tokens(runtime.tokenizer, "".join(generated)),
+                        )
+                    tokens = latency.get("output_tokens", token_count)
+                    speed = tokens / elapsed if elapsed > 0 else 0
+                    stats = {
+                        "tokens": tokens,
+                        "chunks": token_count,
+                        "time": round(elapsed, 2),
+                        "speed": round(speed, 2),
+                        "ipc_frames_saved": coalescer.frames_saved,
+                    }
+                    stats.update(kv_stats)
+                    stats.update(spec_stats)
+                    stats.update(latency)
+                    if context_trims:
+                        stats["context_trims"] = context_trims
+                    if prompt_lookup_ignored:
+                        stats["prompt_lookup_ignored"] = True
+                        stats["prompt_lookup_hint"] = "prompt_lookup is a load option; reload the model to change it"
+                    send({"type": "finished", "stats": stats})
 
         except Exception as e:
             res_queue.put({"type": "error", "msg": f"Process Crash: {str(e)}"})
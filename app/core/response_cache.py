@@ -0,0 +1,286 @@
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, Optional, Sequence, Tuple
+
+from app.config import DEFAULT_CONFIG
+
+# UI and decoding-strategy options that do not change what a request generates.
+_NEUTRAL_KEYS = {
+    "system_prompt", "max_history_turns", "reuse_kv_cache", "prompt_lookup", "max_ngram_size",
+    "num_assistant_tokens", "assistant_confidence_threshold",
+}
+_SAMPLING_KEYS = {"temperature", "top_p", "top_k", "rng_seed"}
+
+
+def model_fingerprint(path: Optional[str]) -> Optional[str]:
+    """
+    Digest of the names, sizes and modification times of the files under a
+    model directory, so that a model replaced at the same path (re-download,
+    re-export) does not hit entries of the old one. Costs one stat per file.
+    """
+    if not path:
+        return None
+    root = Path(path)
+    entries = []
+    try:
+        if root.is_file():
+            stat = root.stat()
+            entries.append((root.name, stat.st_size, stat.st_mtime_ns))
+        else:
+            for dirpath, dirnames, filenames in os.walk(root):
+                dirnames.sort()
+                for name in sorted(filenames):
+                    file_path = Path(dirpath) / name
+                    stat = file_path.stat()
+                    entries.append((file_path.relative_to(root).as_posix(), stat.st_size, stat.st_mtime_ns))
+    except OSError:
+        return None
+    if not entries:
+        return None
+    return hashlib.sha256(json.dumps(entries).encode("utf-8")).hexdigest()
+
+
+def _last_user(messages: Sequence[dict]) -> dict:
+    for msg in reversed(messages or []):
+        if msg.get("role") == "user":
+            return msg
+    return messages[-1] if messages else {}
+
+
+def _request_input(kind: str, messages: Sequence[dict]):
+    """The part of a request the model actually reads."""
+    if kind == "image":
+        # Only the last prompt is rendered; attached files are ignored.
+        return str(_last_user(messages).get("content") or "").split("\n\n[File]", 1)[0].strip()
+    if kind == "asr":
+        # Stored audio is already addressed by the digest of its bytes.
+        audio = [
+            att.get("blob") or hashlib.sha256(str(att.get("content") or "").encode("utf-8")).hexdigest()
+            for att in _last_user(messages).get("attachments") or []
+            if (att.get("kind") or "").lower() == "audio" or str(att.get("content") or "").startswith("data:audio/")
+        ]
+        return audio or None
+    return [
+        {"role": msg.get("role"), "content": msg.get("content"), "attachments": msg.get("attachments") or []}
+        for msg in messages or []
+    ]
+
+
+class ResponseCache:
+    """
+    Results of deterministic requests, keyed by the content that produced them.
+
+    A request is cacheable when its output depends only on its input: greedy
+    text generation (``do_sample`` off), image generation with a fixed
+    ``rng_seed``, and transcription (Whisper decodes greedily). Entries hold
+    the streamed events and the final stats. The memory tier is an LRU bounded
+    by bytes; the disk tier keeps one JSON file per key and drops the least
+    recently used files once it outgrows its budget.
+    """
+
+    def __init__(self, directory: Optional[Path], memory_bytes: int, disk_bytes: int) -> None:
+        self.directory = Path(directory) if directory and disk_bytes > 0 else None
+        self.memory_bytes = max(0, int(memory_bytes))
+        self.disk_bytes = max(0, int(disk_bytes)) if self.directory else 0
+        self._lock = threading.Lock()
+        self._memory: "OrderedDict[str, Tuple[Dict[str, Any], int]]" = OrderedDict()
+        self._memory_used = 0
+        self._disk: Optional["OrderedDict[str, int]"] = None
+        self._disk_used = 0
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.stores = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.memory_bytes > 0 or self.disk_bytes > 0
+
+    def key_for(
+        self,
+        worker_key: Tuple[str, str, str],
+        messages,
+        config: Optional[Dict[str, Any]],
+        load_options: Optional[Dict[str, Any]] = None,
+    ) -> Optional[str]:
+        """
+        Cache key of a request on the model ``worker_key``, or None when it is
+        not deterministic. ``load_options`` are the options the model was
+        loaded with (prompt length limit, draft model, serving scheduler):
+        they change how a prompt is truncated and decoded. The files of the
+        model and of its draft are fingerprinted; None when they cannot be read.
+        """
+        if not self.enabled:
+            return None
+        model_path, device, kind = worker_key
+        params = DEFAULT_CONFIG.copy()
+        params.update(config or {})
+        params = {k: v for k, v in params.items() if k not in _NEUTRAL_KEYS}
+        if kind == "image":
+            seed = params.get("rng_seed")
+            if not isinstance(seed, int) or isinstance(seed, bool) or seed < 0:
+                return None
+        elif kind in ("llm", "vlm"):
+            if params.get("do_sample"):
+                return None
+            params = {k: v for k, v in params.items() if k not in _SAMPLING_KEYS}
+        elif kind != "asr":
+            return None
+        request_input = _request_input(kind, messages)
+        if request_input is None:
+            return None
+        load_options = dict(load_options or {})
+        draft_path = (load_options.get("draft") or {}).get("path")
+        fingerprint = model_fingerprint(model_path)
+        draft_fingerprint = model_fingerprint(draft_path) if draft_path else None
+        if fingerprint is None or (draft_path and draft_fingerprint is None):
+            return None
+        material = json.dumps(
+            {
+                "model": model_path,
+                "device": device,
+                "kind": kind,
+                "load": load_options,
+                "fingerprint": [fingerprint, draft_fingerprint],
+                "params": params,
+                "input": request_input,
+            },
+            sort_keys=True,
+            ensure_ascii=False,
+            default=str,
+        )
+        return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+    def _path(self, key: str) -> Path:
+        return self.directory / f"{key}.json"
+
+    def _scan_disk(self) -> None:
+        """Index the disk tier, least recently used first. Lock held."""
+        if self._disk is not None:
+            return
+        self._disk = OrderedDict()
+        self._disk_used = 0
+        if self.directory is None:
+            return
+        try:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            files = sorted(self.directory.glob("*.json"), key=lambda p: p.stat().st_mtime)
+        except OSError:
+            return
+        for path in files:
+            try:
+                size = path.stat().st_size
+            except OSError:
+                continue
+            self._disk[path.stem] = size
+            self._disk_used += size
+
+    def _remember(self, key: str, entry: Dict[str, Any], size: int) -> None:
+        """Insert into the memory tier. Lock held."""
+        if size > self.memory_bytes:
+            return
+        old = self._memory.pop(key, None)
+        if old is not None:
+            self._memory_used -= old[1]
+        self._memory[key] = (entry, size)
+        self._memory_used += size
+        while self._memory_used > self.memory_bytes and self._memory:
+            _, (_, dropped) = self._memory.popitem(last=False)
+            self._memory_used -= dropped
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            cached = self._memory.get(key)
+            if cached is not None:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                return cached[0]
+            if self.directory is not None:
+                self._scan_disk()
+                on_disk = key in self._disk
+            else:
+                on_disk = False
+            if not on_disk:
+                self.misses += 1
+                return None
+
+        try:
+            raw = self._path(key).read_bytes()
+            entry = json.loads(raw.decode("utf-8"))
+            os.utime(self._path(key))
+        except (OSError, ValueError):
+            with self._lock:
+                self._forget_disk(key)
+                self.misses += 1
+            return None
+        with self._lock:
+            if key in self._disk:
+                self._disk.move_to_end(key)
+            self._remember(key, entry, len(raw))
+            self.hits += 1
+            self.disk_hits += 1
+        return entry
+
+    def put(self, key: str, entry: Dict[str, Any]) -> None:
+        """Store ``entry``; the disk copy is written in the background."""
+        raw = json.dumps(entry, ensure_ascii=False).encode("utf-8")
+        with self._lock:
+            self._remember(key, entry, len(raw))
+            self.stores += 1
+        if self.directory is not None and len(raw) <= self.disk_bytes:
+            threading.Thread(target=self._write, args=(key, raw), daemon=True).start()
+
+    def _forget_disk(self, key: str) -> None:
+        """Lock held."""
+        size = self._disk.pop(key, None) if self._disk is not None else None
+        if size is not None:
+            self._disk_used -= size
+
+    def _write(self, key: str, raw: bytes) -> None:
+        path = self._path(key)
+        tmp = path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+        try:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            tmp.write_bytes(raw)
+            os.replace(tmp, path)
+        except OSError:
+            try:
+                tmp.unlink()
+            except OSError:
+                pass
+            return
+        evicted = []
+        with self._lock:
+            self._scan_disk()
+            self._forget_disk(key)
+            self._disk[key] = len(raw)
+            self._disk_used += len(raw)
+            while self._disk_used > self.disk_bytes and len(self._disk) > 1:
+                old_key, size = self._disk.popitem(last=False)
+                self._disk_used -= size
+                evicted.append(old_key)
+        for old_key in evicted:
+            try:
+                self._path(old_key).unlink()
+            except OSError:
+                pass
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "enabled": self.enabled,
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+                "stores": self.stores,
+                "memory_entries": len(self._memory),
+                "memory_bytes": self._memory_used,
+                "disk_entries": len(self._disk) if self._disk is not None else None,
+                "disk_bytes": self._disk_used if self._disk is not None else None,
+            }
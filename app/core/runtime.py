@@ -5,7 +5,7 @@ import re
 import time
 import sys
 from pathlib import Path
-from typing import Optional, Tuple, Callable, Any, TYPE_CHECKING
+from typing import Optional, Tuple, Callable, Any, Dict, TYPE_CHECKING
 from app.config import MODELS_DIR, OV_CACHE_DIR, LOGS_DIR
 
 if TYPE_CHECKING:
@@ -127,6 +127,35 @@ def _build_flux_pipeline(ov_genai, model_path: Path, dev: str, device_props: dic
 
     return ov_genai.Text2ImagePipeline.flux(scheduler, clip, t5, transformer, vae)
 
+def _supports_continuous_batching(dev: str) -> bool:
+    return dev == "CPU" or dev.startswith("GPU")
+
+def _build_scheduler_config(ov_genai, serving: dict) -> Any:
+    cfg = ov_genai.SchedulerConfig()
+    cache_size = serving.get("kv_cache_size_gb")
+    if isinstance(cache_size, (int, float)) and cache_size > 0:
+        cfg.cache_size = max(1, int(round(cache_size)))
+    max_batched = serving.get("max_num_batched_tokens")
+    if isinstance(max_batched, int) and max_batched > 0:
+        cfg.max_num_batched_tokens = max_batched
+    max_seqs = serving.get("max_num_seqs")
+    if isinstance(max_seqs, int) and max_seqs > 0:
+        cfg.max_num_seqs = max_seqs
+    for name in ("enable_prefix_caching", "dynamic_split_fuse"):
+        if hasattr(cfg, name):
+            setattr(cfg, name, True)
+    return cfg
+
+def _serving_key(serving: Optional[dict]) -> Optional[tuple]:
+    if not serving:
+        return None
+    return tuple(sorted((k, v) for k, v in serving.items() if v is not None))
+
+def _draft_key(draft: Optional[dict]) -> Optional[tuple]:
+    if not draft or not draft.get("path"):
+        return None
+    return (str(Path(draft["path"]).resolve()), (draft.get("device") or "").upper())
+
 def _infer_image_supported_keys() -> Optional[set]:
     try:
         import openvino_genai as ov_genai
@@ -196,6 +225,16 @@ class RuntimeState:
         self.max_prompt_len: Optional[int] = None
         self.supported_keys: Optional[set] = None
         self.image_max_sequence_length: Optional[int] = None
+        self.serving_mode = False
+        self.serving_concurrency = 1
+        self._serving_key: Optional[tuple] = None
+        self.draft_path: Optional[str] = None
+        self.draft_device: Optional[str] = None
+        self._draft_key: Optional[tuple] = None
+        self.prompt_lookup = False
+        self.prompt_lookup_requested = False
+        # serving / draft / prompt_lookup as requested, for reloads of the same model
+        self.load_options: Dict[str, Any] = {}
 
     def _get_ov_genai(self):
         if self._ov_genai is None:
@@ -220,6 +259,15 @@ class RuntimeState:
         self.max_prompt_len = None
         self.supported_keys = None
         self.image_max_sequence_length = None
+        self.serving_mode = False
+        self.serving_concurrency = 1
+        self._serving_key = None
+        self.draft_path = None
+        self.draft_device = None
+        self._draft_key = None
+        self.prompt_lookup = False
+        self.prompt_lookup_requested = False
+        self.load_options = {}
         
         gc.collect()
         gc.collect()
@@ -232,6 +280,46 @@ class RuntimeState:
             raise RuntimeError(f"本地模型目录不存在: {path}")
         return path
 
+    def _draft_kwargs(self, ov_genai, draft: Optional[dict], dev: str) -> dict:
+        """LLMPipeline kwargs enabling speculative decoding with ``draft``."""
+        self.draft_path = None
+        self.draft_device = None
+        if not draft or not draft.get("path"):
+            return {}
+        draft_path = self._load_local(Path(draft["path"]).resolve())
+        draft_dev = (draft.get("device") or dev).upper()
+        if draft_dev not in AVAILABLE_DEVICES:
+            draft_dev = dev
+        draft_props = _build_device_props(draft_dev, draft_path)
+        log_to_file(f"Using draft model {draft_path} on {draft_dev}")
+        self.draft_path = str(draft_path)
+        self.draft_device = draft_dev
+        return {"draft_model": ov_genai.draft_model(str(draft_path), draft_dev, **draft_props)}
+
+    def _create_llm_pipeline(self, ov_genai, str_path: str, dev: str, device_props: dict,
+                             draft: Optional[dict], prompt_lookup: bool = False, **kwargs):
+        draft_kwargs = self._draft_kwargs(ov_genai, draft, dev)
+        self.prompt_lookup = False
+        if not draft_kwargs and prompt_lookup:
+            try:
+                pipe = ov_genai.LLMPipeline(str_path, device=dev, **kwargs, **device_props, prompt_lookup=True)
+                self.prompt_lookup = True
+                log_to_file("Prompt lookup decoding enabled")
+                return pipe
+            except Exception as e:
+                log_to_file(f"WARN: Prompt lookup decoding unavailable on {dev}, loading without it: {e}")
+        elif draft_kwargs and prompt_lookup:
+            log_to_file("WARN: Prompt lookup is ignored when a draft model is loaded")
+        if not draft_kwargs:
+            return ov_genai.LLMPipeline(str_path, device=dev, **kwargs, **device_props)
+        try:
+            return ov_genai.LLMPipeline(str_path, device=dev, **kwargs, **device_props, **draft_kwargs)
+        except Exception as e:
+            log_to_file(f"WARN: Speculative decoding unavailable on {dev}, loading without draft: {e}")
+            self.draft_path = None
+            self.draft_device = None
+            return ov_genai.LLMPipeline(str_path, device=dev, **kwargs, **device_props)
+
     def ensure_loaded(
         self,
         model_source: Optional[str] = None,
@@ -242,6 +330,9 @@ class RuntimeState:
         image_max_sequence_length: Optional[int] = None,
         cache_bust: Optional[str] = None,
         progress_cb: Optional[Callable[[str, str], None]] = None,
+        serving: Optional[dict] = None,
+        draft: Optional[dict] = None,
+        prompt_lookup: bool = False,
     ) -> Tuple[str, str, str]:
 
         want_source = model_source or self.model_source
@@ -260,6 +351,9 @@ class RuntimeState:
             (want_device != self.device) or
             (self.pipe is None) or
             (want_image_seq is not None and self.model_kind == "image" and want_image_seq != self.image_max_sequence_length) or
+            (_serving_key(serving) != self._serving_key) or
+            (_draft_key(draft) != self._draft_key) or
+            (bool(prompt_lookup) != self.prompt_lookup_requested) or
             (cache_bust is not None)
         )
         
@@ -274,6 +368,9 @@ class RuntimeState:
         else:
             raise RuntimeError(f"只支持 local 模式")
 
+        if draft and draft.get("path"):
+            self._load_local(Path(draft["path"]).resolve())
+
         str_path = str(model_path)
         try:
             from app.utils.model_type import detect_model_kind
@@ -368,23 +465,39 @@ class RuntimeState:
                     pipe = ov_genai.VLMPipeline(str_path, device=dev, **device_props)
                     self.max_prompt_len = max_prompt_len
                     log_to_file("VLMPipeline created successfully.")
+            elif serving and _supports_continuous_batching(dev):
+                if draft or prompt_lookup:
+                    log_to_file("WARN: Speculative decoding is ignored in serving mode")
+                self.supported_keys = None
+                scheduler_config = _build_scheduler_config(ov_genai, serving)
+                pipe = ov_genai.ContinuousBatchingPipeline(str_path, scheduler_config, dev, device_props)
+                self.max_prompt_len = max_prompt_len
+                self.serving_mode = True
+                self.serving_concurrency = int(serving.get("max_num_seqs") or 8)
+                log_to_file(
+                    f"ContinuousBatchingPipeline created (cache_size={scheduler_config.cache_size}GB, "
+                    f"max_num_batched_tokens={scheduler_config.max_num_batched_tokens})"
+                )
             else:
                 # NPU needs MAX_PROMPT_LEN for longer conversations
+                if serving:
+                    log_to_file(f"WARN: Serving mode is not supported on {dev}, using LLMPipeline")
                 self.supported_keys = None
                 if dev == "NPU" or (dev == "AUTO" and "NPU" in AVAILABLE_DEVICES):
                     try:
-                        pipe = ov_genai.LLMPipeline(
-                            str_path, device=dev, MAX_PROMPT_LEN=max_prompt_len, **device_props
+                        pipe = self._create_llm_pipeline(
+                            ov_genai, str_path, dev, device_props, draft, prompt_lookup,
+                            MAX_PROMPT_LEN=max_prompt_len
                         )
                         self.max_prompt_len = max_prompt_len
                         log_to_file(f"LLMPipeline created with MAX_PROMPT_LEN={max_prompt_len}")
                     except Exception as e:
                         log_to_file(f"WARN: MAX_PROMPT_LEN unsupported, retry without it: {e}")
-                        pipe = ov_genai.LLMPipeline(str_path, device=dev, **device_props)
+                        pipe = self._create_llm_pipeline(ov_genai, str_path, dev, device_props, draft, prompt_lookup)
                         self.max_prompt_len = max_prompt_len
                         log_to_file("LLMPipeline created successfully.")
                 else:
-                    pipe = ov_genai.LLMPipeline(str_path, device=dev, **device_props)
+                    pipe = self._create_llm_pipeline(ov_genai, str_path, dev, device_props, draft, prompt_lookup)
                     self.max_prompt_len = max_prompt_len
                     log_to_file("LLMPipeline created successfully.")
         except Exception as e:
@@ -425,11 +538,15 @@ class RuntimeState:
                 self.max_prompt_len = max_prompt_len
                 self.supported_keys = None
             else:
-                pipe = ov_genai.LLMPipeline(str_path, device=dev, **device_props)
+                pipe = self._create_llm_pipeline(ov_genai, str_path, dev, device_props, draft, prompt_lookup)
                 self.max_prompt_len = max_prompt_len
                 self.supported_keys = None
             log_to_file("Fallback to CPU successful.")
 
+        self._serving_key = _serving_key(serving)
+        self._draft_key = _draft_key(draft)
+        self.prompt_lookup_requested = bool(prompt_lookup)
+        self.load_options = {"serving": serving, "draft": draft, "prompt_lookup": bool(prompt_lookup)}
         self.model_source = want_source
         self.model_id = want_id
         self.model_dir = str(model_path)
@@ -1,11 +1,36 @@
+import base64
+import bisect
+import itertools
 import json
 import sqlite3
+import threading
 import time
 import uuid
+from collections import OrderedDict
 from pathlib import Path
-from typing import Dict, List, Optional, Any
-
-from app.config import DATA_DIR, SESSIONS_DB_PATH
+from typing import Dict, List, Optional, Any, Tuple
+
+from app.config import (
+    BLOB_FALLBACK_DIRS,
+    BLOB_GC_GRACE_S,
+    BLOB_GC_SWEEP_S,
+    BLOBS_DIR,
+    DATA_DIR,
+    SESSIONS_DB_PATH,
+    SESSION_CACHE_MB,
+)
+from app.core.blob_store import BlobStore
+
+# 以 blob 形式存储的附件类型 (其余为文本，直接存 content 列)
+_BLOB_KINDS = ("image", "audio")
+# 估算缓存占用时每条消息的固定开销 (字典、键名等)
+_MESSAGE_OVERHEAD_BYTES = 256
+# SQLite 连接参数：每个线程一条持久连接，以下 PRAGMA 只在打开时设置一次
+_DB_STATEMENT_CACHE = 256  # 每条连接缓存的预编译语句数
+_DB_CACHE_KIB = 2 * 1024  # 页缓存 (每条连接；线程池中可能同时有几十条连接)
+_DB_MMAP_BYTES = 256 * 1024 * 1024
+_WAL_AUTOCHECKPOINT_PAGES = 1000
+_WAL_SIZE_LIMIT_BYTES = 64 * 1024 * 1024  # 检查点后 WAL 文件截断到此大小以内
 
 
 class SessionManager:
@@ -13,19 +38,93 @@ class SessionManager:
         self.sessions: Dict[str, dict] = {}
         self.current_session_id: Optional[str] = None
         self.temp_sessions: Dict[str, dict] = {}  # 临时会话存储
+        # 临时会话消息的 id (与 history 一一对应)，截断、编辑后仍指向同一条消息
+        self._temp_ids: Dict[str, List[int]] = {}
+        self._temp_seq = itertools.count(1)
 
         self.db_path = Path(SESSIONS_DB_PATH)
+        self.blobs = BlobStore(BLOBS_DIR, BLOB_FALLBACK_DIRS)
+        self._blob_gc_lock = threading.Lock()
+        self._last_blob_sweep: Optional[float] = None
+
+        # 线程 -> 持久连接；线程退出后其连接在下次打开新连接时关闭
+        self._local = threading.local()
+        self._conns_lock = threading.Lock()
+        self._conns: Dict[threading.Thread, sqlite3.Connection] = {}
+
+        # 已解码历史的 LRU 缓存 (写穿)：sid -> {"ids", "history", "size"}
+        self._cache_lock = threading.RLock()
+        self._history_cache: "OrderedDict[str, dict]" = OrderedDict()
+        self._history_cache_bytes = 0
+        self._history_cache_limit = SESSION_CACHE_MB * 1024 * 1024
+        self._history_gen: Dict[str, int] = {}
+        self.cache_hits = 0
+        self.cache_misses = 0
         self._init_db()
         self._migrate_from_json()
         self._load_sessions()
 
     def _connect(self) -> sqlite3.Connection:
-        conn = sqlite3.connect(self.db_path)
+        """
+        当前线程的持久连接，首次使用时打开。
+        以 `with self._connect() as conn:` 使用：退出时提交 (异常时回滚)，连接不关闭。
+        """
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            return conn
+        # check_same_thread=False 仅为了让 close() 能在其他线程关闭连接
+        conn = sqlite3.connect(
+            self.db_path, check_same_thread=False, cached_statements=_DB_STATEMENT_CACHE
+        )
         conn.row_factory = sqlite3.Row
         conn.execute("PRAGMA foreign_keys = ON")
         conn.execute("PRAGMA journal_mode = WAL")
+        # WAL 模式下 NORMAL 只在检查点时 fsync：断电可能丢失最近的提交，但不会损坏数据库
+        conn.execute("PRAGMA synchronous = NORMAL")
+        conn.execute(f"PRAGMA cache_size = -{_DB_CACHE_KIB}")
+        conn.execute(f"PRAGMA mmap_size = {_DB_MMAP_BYTES}")
+        conn.execute(f"PRAGMA wal_autocheckpoint = {_WAL_AUTOCHECKPOINT_PAGES}")
+        conn.execute(f"PRAGMA journal_size_limit = {_WAL_SIZE_LIMIT_BYTES}")
+        self._local.conn = conn
+        self._close_dead_connections()
+        with self._conns_lock:
+            self._conns[threading.current_thread()] = conn
         return conn
 
+    def _close_dead_connections(self) -> None:
+        """关闭已退出线程遗留的连接 (其页缓存与文件句柄不会自行释放)"""
+        with self._conns_lock:
+            dead = [self._conns.pop(t) for t in list(self._conns) if not t.is_alive()]
+        for conn in dead:
+            try:
+                conn.close()
+            except sqlite3.Error:
+                pass
+
+    def checkpoint(self, mode: str = "PASSIVE") -> None:
+        """
+        把 WAL 写回数据库。PASSIVE 不等待读写者；TRUNCATE 会等待并清空 WAL 文件。
+        平时由 wal_autocheckpoint 自动进行，这里用于大量删除后和退出时。
+        """
+        self._close_dead_connections()
+        try:
+            self._connect().execute(f"PRAGMA wal_checkpoint({mode})").fetchall()
+        except sqlite3.Error:
+            pass
+
+    def close(self) -> None:
+        """检查点后关闭所有线程的连接 (退出时调用)"""
+        self.checkpoint("TRUNCATE")
+        with self._conns_lock:
+            conns = list(self._conns.values())
+            self._conns.clear()
+        for conn in conns:
+            try:
+                conn.close()
+            except sqlite3.Error:
+                pass
+        self._local = threading.local()
+
     def _init_db(self) -> None:
         self.db_path.parent.mkdir(parents=True, exist_ok=True)
         with self._connect() as conn:
@@ -63,8 +162,120 @@ class SessionManager:
                     key TEXT PRIMARY KEY,
                     value TEXT
                 );
+                CREATE INDEX IF NOT EXISTS idx_messages_session ON messages(session_id, id);
+                CREATE INDEX IF NOT EXISTS idx_attachments_message ON attachments(message_id);
                 """
             )
+            # 二进制附件 (生成的图片) 只保存 blob 存储中的摘要
+            columns = {row["name"] for row in conn.execute("PRAGMA table_info(attachments)")}
+            for column in ("blob", "thumb"):
+                if column not in columns:
+                    conn.execute(f"ALTER TABLE attachments ADD COLUMN {column} TEXT")
+            self._init_blob_refs(conn)
+
+    def _init_blob_refs(self, conn: sqlite3.Connection) -> None:
+        """
+        blob 引用计数：附件行的 blob / thumb 列由触发器计数，
+        级联删除 (会话、消息) 同样会触发。计数归零的文件由 collect_blobs 清理。
+        """
+        exists = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'blob_refs'"
+        ).fetchone()
+        conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS blob_refs (
+                digest TEXT PRIMARY KEY,
+                refs INTEGER NOT NULL DEFAULT 0
+            );
+            CREATE TRIGGER IF NOT EXISTS attachments_blob_insert AFTER INSERT ON attachments BEGIN
+                INSERT INTO blob_refs(digest, refs) SELECT NEW.blob, 1 WHERE NEW.blob IS NOT NULL
+                    ON CONFLICT(digest) DO UPDATE SET refs = refs + 1;
+                INSERT INTO blob_refs(digest, refs) SELECT NEW.thumb, 1 WHERE NEW.thumb IS NOT NULL
+                    ON CONFLICT(digest) DO UPDATE SET refs = refs + 1;
+            END;
+            CREATE TRIGGER IF NOT EXISTS attachments_blob_delete AFTER DELETE ON attachments BEGIN
+                UPDATE blob_refs SET refs = refs - 1 WHERE digest = OLD.blob;
+                UPDATE blob_refs SET refs = refs - 1 WHERE digest = OLD.thumb;
+            END;
+            CREATE TRIGGER IF NOT EXISTS attachments_blob_update AFTER UPDATE OF blob, thumb ON attachments BEGIN
+                UPDATE blob_refs SET refs = refs - 1 WHERE digest = OLD.blob;
+                UPDATE blob_refs SET refs = refs - 1 WHERE digest = OLD.thumb;
+                INSERT INTO blob_refs(digest, refs) SELECT NEW.blob, 1 WHERE NEW.blob IS NOT NULL
+                    ON CONFLICT(digest) DO UPDATE SET refs = refs + 1;
+                INSERT INTO blob_refs(digest, refs) SELECT NEW.thumb, 1 WHERE NEW.thumb IS NOT NULL
+                    ON CONFLICT(digest) DO UPDATE SET refs = refs + 1;
+            END;
+            """
+        )
+        if not exists:
+            # 触发器创建前写入的 blob 补记引用
+            conn.execute(
+                """
+                INSERT INTO blob_refs(digest, refs)
+                SELECT digest, COUNT(*) FROM (
+                    SELECT blob AS digest FROM attachments WHERE blob IS NOT NULL
+                    UNION ALL
+                    SELECT thumb FROM attachments WHERE thumb IS NOT NULL
+                ) GROUP BY digest
+                """
+            )
+
+    def _temp_blob_refs(self) -> set:
+        """临时会话不写数据库，其附件引用的 blob 不在 blob_refs 中"""
+        digests = set()
+        for session in list(self.temp_sessions.values()):
+            for msg in list(session.get("history") or []):
+                for att in msg.get("attachments") or []:
+                    for key in ("blob", "thumb"):
+                        if att.get(key):
+                            digests.add(att[key])
+        return digests
+
+    def collect_blobs(self, grace_s: Optional[float] = None, sweep: Optional[bool] = None) -> int:
+        """
+        删除不再被任何附件引用的 blob 文件，返回删除数量。
+        最近 grace_s 秒内写入的文件 (刚上传、尚未挂到消息上的) 和临时会话引用的文件保留。
+        sweep 时另外扫描整个 blob 目录，回收从未被引用过的文件 (上传后未发送、生成后未保存)；
+        默认每 BLOB_GC_SWEEP_S 秒扫描一次。
+        """
+        grace_s = BLOB_GC_GRACE_S if grace_s is None else grace_s
+        with self._blob_gc_lock:
+            now = time.time()
+            if sweep is None:
+                sweep = self._last_blob_sweep is None or now - self._last_blob_sweep >= BLOB_GC_SWEEP_S
+            with self._connect() as conn:
+                rows = conn.execute("SELECT digest FROM blob_refs WHERE refs <= 0").fetchall()
+            candidates = {row["digest"] for row in rows}
+            if sweep:
+                self._last_blob_sweep = now
+                with self._connect() as conn:
+                    rows = conn.execute("SELECT digest FROM blob_refs WHERE refs > 0").fetchall()
+                referenced = {row["digest"] for row in rows}
+                candidates.update(d for d in self.blobs.digests() if d not in referenced)
+            candidates -= self._temp_blob_refs()
+
+            cutoff = now - grace_s
+            removed = 0
+            for digest in sorted(candidates):
+                path = self.blobs.path(digest)
+                try:
+                    if path is not None and path.stat().st_mtime >= cutoff:
+                        continue
+                except OSError:
+                    pass
+                with self._connect() as conn:
+                    row = conn.execute(
+                        "SELECT refs FROM blob_refs WHERE digest = ?", (digest,)
+                    ).fetchone()
+                    if row is not None and row["refs"] > 0:
+                        continue
+                    conn.execute("DELETE FROM blob_refs WHERE refs <= 0 AND digest = ?", (digest,))
+                # 删除前再检查一次修改时间：期间重新写入相同内容会刷新 mtime
+                if self.blobs.delete(digest, before=cutoff):
+                    removed += 1
+        # 删除会话或截断历史之后，顺便回收 WAL
+        self.checkpoint()
+        return removed
 
     def _get_state(self, conn: sqlite3.Connection, key: str) -> Optional[str]:
         row = conn.execute("SELECT value FROM app_state WHERE key = ?", (key,)).fetchone()
@@ -87,6 +298,8 @@ class SessionManager:
             content = str(attachment.get("content") or "")
             if mime.startswith("image/") or content.startswith("data:image/"):
                 kind = "image"
+            elif mime.startswith("audio/") or content.startswith("data:audio/"):
+                kind = "audio"
             else:
                 kind = "text"
         return kind
@@ -105,6 +318,21 @@ class SessionManager:
                 return len(content.encode("utf-8", errors="ignore"))
         return len(content.encode("utf-8", errors="ignore"))
 
+    def _store_data_url(self, content: str) -> Optional[Tuple[str, int, str]]:
+        """把 base64 data URL 写入 blob 存储，返回 (摘要, 字节数, MIME)"""
+        if not content.startswith("data:"):
+            return None
+        try:
+            header, b64 = content.split(",", 1)
+            if ";base64" not in header:
+                return None
+            raw = base64.b64decode(b64, validate=False)
+            digest = self.blobs.put(raw)
+        except Exception:
+            return None
+        mime = header[5:].split(";", 1)[0]
+        return digest, len(raw), mime
+
     def _insert_message(
         self,
         conn: sqlite3.Connection,
@@ -113,7 +341,7 @@ class SessionManager:
         content: str,
         meta: Optional[dict],
         attachments: Optional[List[dict]],
-    ) -> None:
+    ) -> int:
         created_at = time.time()
         meta_json = json.dumps(meta, ensure_ascii=False) if meta else None
         cursor = conn.execute(
@@ -121,54 +349,125 @@ class SessionManager:
             (session_id, role, content, created_at, meta_json),
         )
         message_id = cursor.lastrowid
-        if attachments:
-            for att in attachments:
-                name = str(att.get("name") or "").strip()
-                content_val = str(att.get("content") or "")
-                if not name or not content_val:
-                    continue
-                kind = self._infer_attachment_kind(att)
-                mime = str(att.get("mime") or "")
-                truncated = 1 if att.get("truncated") else 0
-                size = self._attachment_size(content_val, kind)
-                conn.execute(
-                    """
-                    INSERT INTO attachments(message_id, session_id, name, kind, mime, content, truncated, size)
-                    VALUES(?, ?, ?, ?, ?, ?, ?, ?)
-                    """,
-                    (message_id, session_id, name[:200], kind, mime, content_val, truncated, size),
-                )
+        self._insert_attachments(conn, message_id, session_id, attachments)
         conn.execute(
             "UPDATE sessions SET updated_at = ? WHERE id = ?",
             (created_at, session_id),
         )
+        return message_id
+
+    def _insert_attachments(
+        self,
+        conn: sqlite3.Connection,
+        message_id: int,
+        session_id: str,
+        attachments: Optional[List[dict]],
+    ) -> None:
+        for att in attachments or []:
+            name = str(att.get("name") or "").strip()
+            content_val = str(att.get("content") or "")
+            blob = att.get("blob") or None
+            if not name or not (content_val or blob):
+                continue
+            kind = self._infer_attachment_kind(att)
+            mime = str(att.get("mime") or "")
+            truncated = 1 if att.get("truncated") else 0
+            size = int(att.get("size") or 0) if blob else 0
+            if not blob and kind in _BLOB_KINDS:
+                stored = self._store_data_url(content_val)
+                if stored:
+                    blob, size, data_mime = stored
+                    mime = mime or data_mime
+                    content_val = ""
+            if not blob:
+                size = self._attachment_size(content_val, kind)
+            conn.execute(
+                """
+                INSERT INTO attachments(message_id, session_id, name, kind, mime, content, truncated, size, blob, thumb)
+                VALUES(?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                """,
+                (message_id, session_id, name[:200], kind, mime, content_val, truncated, size,
+                 blob, att.get("thumb") or None),
+            )
 
     def _load_messages(self, conn: sqlite3.Connection, sid: str) -> List[dict]:
+        return [msg for _, msg in self._load_rows(conn, sid)]
+
+    def _load_rows(
+        self, conn: sqlite3.Connection, sid: str, message_id: Optional[int] = None
+    ) -> List[Tuple[int, dict]]:
+        """按顺序返回 (消息 id, 消息)；指定 message_id 时只读取这一条"""
+        only = " AND id = ?" if message_id is not None else ""
+        only_att = " AND message_id = ?" if message_id is not None else ""
+        params = (sid, message_id) if message_id is not None else (sid,)
         rows = conn.execute(
-            "SELECT id, role, content, meta FROM messages WHERE session_id = ? ORDER BY id ASC",
-            (sid,),
+            f"SELECT id, role, content, meta FROM messages WHERE session_id = ?{only} ORDER BY id ASC",
+            params,
         ).fetchall()
         attachments_rows = conn.execute(
+            f"""
+            SELECT id, message_id, name, kind, mime, content, truncated, size, blob, thumb
+            FROM attachments WHERE session_id = ?{only_att}
+            ORDER BY id ASC
+            """,
+            params,
+        ).fetchall()
+        return self._decode_rows(conn, rows, attachments_rows)
+
+    def _load_page(
+        self, conn: sqlite3.Connection, sid: str, before_id: Optional[int], limit: Optional[int]
+    ) -> List[Tuple[int, dict]]:
+        """id 小于 before_id 的最新 limit 条 (按时间顺序)，只读取这一页"""
+        rows = conn.execute(
             """
-            SELECT message_id, name, kind, mime, content, truncated
-            FROM attachments WHERE session_id = ?
+            SELECT id, role, content, meta FROM messages
+            WHERE session_id = ? AND id < ? ORDER BY id DESC LIMIT ?
+            """,
+            (sid, before_id if before_id is not None else 2 ** 63 - 1, limit if limit else -1),
+        ).fetchall()[::-1]
+        if not rows:
+            return []
+        attachments_rows = conn.execute(
+            """
+            SELECT id, message_id, name, kind, mime, content, truncated, size, blob, thumb
+            FROM attachments WHERE session_id = ? AND message_id BETWEEN ? AND ?
             ORDER BY id ASC
             """,
-            (sid,),
+            (sid, rows[0]["id"], rows[-1]["id"]),
         ).fetchall()
+        return self._decode_rows(conn, rows, attachments_rows)
+
+    def _decode_rows(
+        self, conn: sqlite3.Connection, rows: List[sqlite3.Row], attachments_rows: List[sqlite3.Row]
+    ) -> List[Tuple[int, dict]]:
         attachments_map: Dict[int, List[dict]] = {}
         for row in attachments_rows:
-            attachments_map.setdefault(row["message_id"], []).append(
-                {
-                    "name": row["name"] or "",
-                    "content": row["content"] or "",
-                    "truncated": bool(row["truncated"]),
-                    "kind": row["kind"] or "",
-                    "mime": row["mime"] or "",
-                }
-            )
+            att = {
+                "name": row["name"] or "",
+                "content": row["content"] or "",
+                "truncated": bool(row["truncated"]),
+                "kind": row["kind"] or "",
+                "mime": row["mime"] or "",
+            }
+            blob, size = row["blob"], row["size"] or 0
+            if not blob and att["kind"] in _BLOB_KINDS:
+                # 旧版本以 data URL 存储的图片/音频，首次读取时迁移到 blob 存储
+                stored = self._store_data_url(att["content"])
+                if stored:
+                    blob, size, data_mime = stored
+                    att["mime"] = att["mime"] or data_mime
+                    att["content"] = ""
+                    conn.execute(
+                        "UPDATE attachments SET blob = ?, content = '', size = ?, mime = ? WHERE id = ?",
+                        (blob, size, att["mime"], row["id"]),
+                    )
+            if blob:
+                att.update({"blob": blob, "size": size})
+                if row["thumb"]:
+                    att["thumb"] = row["thumb"]
+            attachments_map.setdefault(row["message_id"], []).append(att)
 
-        history: List[dict] = []
+        history: List[Tuple[int, dict]] = []
         for row in rows:
             msg = {"role": row["role"], "content": row["content"]}
             if row["meta"]:
@@ -180,9 +479,99 @@ class SessionManager:
                     pass
             if row["id"] in attachments_map:
                 msg["attachments"] = attachments_map[row["id"]]
-            history.append(msg)
+            history.append((row["id"], msg))
         return history
 
+    @staticmethod
+    def _message_bytes(msg: dict) -> int:
+        size = _MESSAGE_OVERHEAD_BYTES + len(str(msg.get("content") or ""))
+        for att in msg.get("attachments") or []:
+            size += _MESSAGE_OVERHEAD_BYTES + len(str(att.get("content") or ""))
+        return size
+
+    def _cached_history(self, sid: str) -> List[dict]:
+        """
+        会话历史 (写穿缓存)。返回新的列表，但其中的消息字典与缓存共享，调用方不应修改；
+        缓存的更新总是替换字典而不是原地修改。
+        """
+        return self._cached_rows(sid)[1]
+
+    def _cached_rows(self, sid: str) -> Tuple[List[int], List[dict]]:
+        """(消息 id 列表, 历史) 的副本，见 _cached_history"""
+        with self._cache_lock:
+            entry = self._history_cache.get(sid)
+            if entry is not None:
+                self._history_cache.move_to_end(sid)
+                self.cache_hits += 1
+                return list(entry["ids"]), list(entry["history"])
+            self.cache_misses += 1
+            gen = self._history_gen.get(sid, 0)
+        with self._connect() as conn:
+            rows = self._load_rows(conn, sid)
+        ids = [mid for mid, _ in rows]
+        history = [msg for _, msg in rows]
+        with self._cache_lock:
+            # 读取期间有写入则不缓存，避免存入旧数据
+            if self._history_gen.get(sid, 0) == gen and sid in self.sessions:
+                self._cache_put(sid, list(ids), list(history))
+        return ids, history
+
+    def _cache_put(self, sid: str, ids: List[int], history: List[dict]) -> None:
+        """持有 _cache_lock 时调用"""
+        self._cache_drop(sid)
+        size = sum(self._message_bytes(msg) for msg in history)
+        if size > self._history_cache_limit:
+            return
+        self._history_cache[sid] = {"ids": ids, "history": history, "size": size}
+        self._history_cache_bytes += size
+        while self._history_cache_bytes > self._history_cache_limit and self._history_cache:
+            _, dropped = self._history_cache.popitem(last=False)
+            self._history_cache_bytes -= dropped["size"]
+
+    def _cache_drop(self, sid: str) -> None:
+        """持有 _cache_lock 时调用"""
+        entry = self._history_cache.pop(sid, None)
+        if entry is not None:
+            self._history_cache_bytes -= entry["size"]
+
+    def _cache_write(self, sid: str, update) -> None:
+        """
+        写入数据库后更新缓存：update(entry) 原地修改缓存条目，返回 False 表示无法
+        增量更新 (条目随即丢弃，下次读取时重新加载)
+        """
+        with self._cache_lock:
+            self._history_gen[sid] = self._history_gen.get(sid, 0) + 1
+            entry = self._history_cache.get(sid)
+            if entry is None:
+                return
+            try:
+                ok = update(entry) is not False
+            except Exception:
+                ok = False
+            if not ok:
+                self._cache_drop(sid)
+                return
+            old_size = entry["size"]
+            entry["size"] = sum(self._message_bytes(msg) for msg in entry["history"])
+            self._history_cache_bytes += entry["size"] - old_size
+            if entry["size"] > self._history_cache_limit:
+                self._cache_drop(sid)
+            while self._history_cache_bytes > self._history_cache_limit and self._history_cache:
+                _, dropped = self._history_cache.popitem(last=False)
+                self._history_cache_bytes -= dropped["size"]
+
+    def cache_stats(self) -> Dict[str, Any]:
+        with self._cache_lock:
+            lookups = self.cache_hits + self.cache_misses
+            return {
+                "hits": self.cache_hits,
+                "misses": self.cache_misses,
+                "hit_rate": round(self.cache_hits / lookups, 3) if lookups else 0.0,
+                "sessions": len(self._history_cache),
+                "bytes": self._history_cache_bytes,
+                "limit_bytes": self._history_cache_limit,
+            }
+
     def _migrate_from_json(self) -> None:
         legacy_path = Path(DATA_DIR) / "sessions.json"
         if not legacy_path.exists():
@@ -236,12 +625,31 @@ class SessionManager:
         with self._connect() as conn:
             self._set_state(conn, "current_session_id", self.current_session_id)
 
+    def get_last_model(self) -> Optional[dict]:
+        """最近一次成功加载的模型 (path, device, max_prompt_len 及 serving / draft / prompt_lookup 等加载选项)"""
+        with self._connect() as conn:
+            raw = self._get_state(conn, "last_model")
+        if not raw:
+            return None
+        try:
+            data = json.loads(raw)
+        except Exception:
+            return None
+        if not isinstance(data, dict) or not data.get("path"):
+            return None
+        return data
+
+    def set_last_model(self, model: Optional[dict]) -> None:
+        with self._connect() as conn:
+            self._set_state(conn, "last_model", json.dumps(model, ensure_ascii=False) if model else None)
+
     def create_session(self, title="New Chat", is_temporary=False) -> str:
         sid = str(uuid.uuid4())
         session_data = {"title": title, "history": [], "is_temporary": is_temporary}
 
         if is_temporary:
             self.temp_sessions[sid] = session_data
+            self._temp_ids[sid] = []
         else:
             now = time.time()
             with self._connect() as conn:
@@ -263,6 +671,7 @@ class SessionManager:
     def delete_session(self, sid: str):
         if sid in self.temp_sessions:
             del self.temp_sessions[sid]
+            self._temp_ids.pop(sid, None)
             if self.current_session_id == sid:
                 self.current_session_id = None
             return
@@ -270,6 +679,8 @@ class SessionManager:
         if sid in self.sessions:
             with self._connect() as conn:
                 conn.execute("DELETE FROM sessions WHERE id = ?", (sid,))
+            self._cache_write(sid, lambda entry: False)
+            self.collect_blobs()
             del self.sessions[sid]
             if self.current_session_id == sid:
                 self.current_session_id = None
@@ -280,29 +691,72 @@ class SessionManager:
             return self.temp_sessions.get(sid)
         if sid not in self.sessions:
             return None
-        with self._connect() as conn:
-            history = self._load_messages(conn, sid)
+        history = self._cached_history(sid)
         data = dict(self.sessions.get(sid, {}))
         data["history"] = history
         return data
 
+    def get_messages_page(
+        self, sid: str, before_id: Optional[int] = None, limit: Optional[int] = None
+    ) -> Optional[dict]:
+        """
+        按游标分页读取历史：返回 id 小于 before_id 的最新 limit 条 (按时间顺序)。
+        每项为 (消息 id, 在完整历史中的下标, 消息)。
+        """
+        if sid in self.temp_sessions:
+            history = list(self.temp_sessions[sid].get("history", []))
+            ids = list(self._temp_ids.get(sid, []))
+        elif sid in self.sessions:
+            with self._cache_lock:
+                entry = self._history_cache.get(sid)
+                if entry is not None:
+                    ids, history = list(entry["ids"]), list(entry["history"])
+            if entry is None:
+                # 未缓存时只从数据库读取这一页，不为此加载 (和缓存) 整个历史
+                return self._messages_page_from_db(sid, before_id, limit)
+        else:
+            return None
+        end = bisect.bisect_left(ids, before_id) if before_id is not None else len(ids)
+        start = max(0, end - limit) if limit else 0
+        return {
+            "items": [(ids[i], i, history[i]) for i in range(start, end)],
+            "total": len(ids),
+            "next_before_id": ids[start] if start > 0 else None,
+        }
+
+    def _messages_page_from_db(self, sid: str, before_id: Optional[int], limit: Optional[int]) -> dict:
+        with self._connect() as conn:
+            rows = self._load_page(conn, sid, before_id, limit)
+            total = conn.execute(
+                "SELECT COUNT(*) AS cnt FROM messages WHERE session_id = ?", (sid,)
+            ).fetchone()["cnt"]
+            first = rows[0][0] if rows else None
+            offset = conn.execute(
+                "SELECT COUNT(*) AS cnt FROM messages WHERE session_id = ? AND id < ?", (sid, first)
+            ).fetchone()["cnt"] if rows else 0
+        return {
+            "items": [(message_id, offset + i, msg) for i, (message_id, msg) in enumerate(rows)],
+            "total": total,
+            "next_before_id": first if offset > 0 else None,
+        }
+
     def get_current_history(self) -> List[dict]:
         if self.current_session_id:
             if self.current_session_id in self.temp_sessions:
                 return self.temp_sessions[self.current_session_id]["history"]
             if self.current_session_id in self.sessions:
-                with self._connect() as conn:
-                    return self._load_messages(conn, self.current_session_id)
+                return self._cached_history(self.current_session_id)
         return []
 
-    def add_message(self, role: str, content: str, sid: str = None, **kwargs):
+    def add_message(self, role: str, content: str, sid: str = None, **kwargs) -> Optional[int]:
         """
         添加消息到历史记录
         :param kwargs: 用于存储额外信息，如 think_duration
+        :return: 供 update_message 使用的消息 id (临时会话为内存中分配的 id)
         """
         target_sid = sid or self.current_session_id
         if not target_sid:
-            return
+            return None
 
         msg = {"role": role, "content": content}
         if kwargs:
@@ -312,10 +766,64 @@ class SessionManager:
         meta = {k: v for k, v in msg.items() if k not in ("role", "content", "attachments")}
 
         if target_sid in self.temp_sessions:
+            message_id = next(self._temp_seq)
             self.temp_sessions[target_sid]["history"].append(msg)
+            self._temp_ids.setdefault(target_sid, []).append(message_id)
+            return message_id
+        elif target_sid in self.sessions:
+            with self._connect() as conn:
+                message_id = self._insert_message(conn, target_sid, role, content, meta, attachments)
+                stored = self._load_rows(conn, target_sid, message_id)
+
+            def append(entry):
+                entry["ids"].append(message_id)
+                entry["history"].append(stored[0][1])
+
+            self._cache_write(target_sid, append)
+            return message_id
+        return None
+
+    def update_message(self, key: int, content: str, sid: str = None, attachments=None, **kwargs) -> bool:
+        """
+        更新 add_message 返回的消息: 替换内容和额外信息，追加附件
+        消息已被删除 (如截断历史) 时返回 False
+        """
+        target_sid = sid or self.current_session_id
+        if not target_sid:
+            return False
+
+        if target_sid in self.temp_sessions:
+            history = self.temp_sessions[target_sid]["history"]
+            ids = self._temp_ids.get(target_sid, [])
+            if key not in ids:
+                return False
+            position = ids.index(key)
+            msg = {"role": history[position].get("role"), "content": content}
+            existing = list(history[position].get("attachments") or []) + list(attachments or [])
+            if existing:
+                msg["attachments"] = existing
+            msg.update(kwargs)
+            history[position] = msg
+            return True
         elif target_sid in self.sessions:
+            meta_json = json.dumps(kwargs, ensure_ascii=False) if kwargs else None
             with self._connect() as conn:
-                self._insert_message(conn, target_sid, role, content, meta, attachments)
+                cursor = conn.execute(
+                    "UPDATE messages SET content = ?, meta = ? WHERE id = ? AND session_id = ?",
+                    (content, meta_json, key, target_sid),
+                )
+                if cursor.rowcount == 0:
+                    return False
+                self._insert_attachments(conn, key, target_sid, attachments)
+                conn.execute("UPDATE sessions SET updated_at = ? WHERE id = ?", (time.time(), target_sid))
+                stored = self._load_rows(conn, target_sid, key)
+
+            def replace(entry):
+                entry["history"][entry["ids"].index(key)] = stored[0][1]
+
+            self._cache_write(target_sid, replace)
+            return True
+        return False
 
     def update_title(self, title: str, sid: str = None) -> str:
         target_sid = sid or self.current_session_id
@@ -366,6 +874,12 @@ class SessionManager:
                 if msg_id is None:
                     return False
                 conn.execute("UPDATE messages SET content = ? WHERE id = ?", (content, msg_id))
+
+            def replace(entry):
+                position = entry["ids"].index(msg_id)
+                entry["history"][position] = dict(entry["history"][position], content=content)
+
+            self._cache_write(target_sid, replace)
             return True
         return False
 
@@ -382,6 +896,7 @@ class SessionManager:
             if end_index > len(history):
                 end_index = len(history)
             self.temp_sessions[target_sid]["history"] = history[:end_index]
+            self._temp_ids[target_sid] = self._temp_ids.get(target_sid, [])[:end_index]
             return True
         elif target_sid in self.sessions:
             with self._connect() as conn:
@@ -394,11 +909,22 @@ class SessionManager:
                     end_index = len(ids)
                 ids_to_delete = ids[end_index:]
                 if ids_to_delete:
-                    placeholders = ",".join("?" for _ in ids_to_delete)
+                    # 固定的语句文本，可命中语句缓存
                     conn.execute(
-                        f"DELETE FROM messages WHERE id IN ({placeholders})",
-                        ids_to_delete,
+                        "DELETE FROM messages WHERE session_id = ? AND id >= ?",
+                        (target_sid, ids_to_delete[0]),
                     )
+            if ids_to_delete:
+                keep = ids[:end_index]
+
+                def truncate(entry):
+                    if entry["ids"][:end_index] != keep:
+                        return False
+                    del entry["ids"][end_index:]
+                    del entry["history"][end_index:]
+
+                self._cache_write(target_sid, truncate)
+                self.collect_blobs()
             return True
         return False
 
@@ -429,6 +955,9 @@ class SessionManager:
             total += len(str(content).encode("utf-8", errors="ignore"))
             attachments = msg.get("attachments") or []
             for att in attachments:
+                if att.get("blob"):
+                    total += int(att.get("size") or 0)
+                    continue
                 kind = self._infer_attachment_kind(att)
                 total += self._attachment_size(str(att.get("content") or ""), kind)
         return total
@@ -0,0 +1,301 @@
+import pickle
+import queue
+import struct
+import threading
+import time
+from multiprocessing import shared_memory
+from typing import Any, Callable, Optional
+
+# Ring header: head (u64, consumer position), tail (u64, producer position),
+# waiting (u32, consumer is parked on the doorbell). Positions only grow.
+_HEADER_SIZE = 64
+_HEAD = struct.Struct("<Q")
+_TAIL = struct.Struct("<Q")
+_FLAG = struct.Struct("<I")
+_HEAD_OFFSET = 0
+_TAIL_OFFSET = 8
+_WAITING_OFFSET = 16
+
+# Frame: payload length (u32) + kind (u8), followed by the payload. Blob frames
+# have an empty payload: the data sits in the payload region.
+_FRAME = struct.Struct("<IB")
+_KIND_INLINE = 0
+_KIND_BLOB_PART = 1
+_KIND_BLOB_LAST = 2
+
+# Payload region header: busy (u32, set by the producer, cleared by the
+# consumer) and the size of the part currently held (u32).
+_BLOB_HEADER_SIZE = 64
+_BLOB_BUSY_OFFSET = 0
+_BLOB_SIZE_OFFSET = 4
+
+DEFAULT_RING_BYTES = 1024 * 1024
+DEFAULT_BLOB_BYTES = 8 * 1024 * 1024
+DEFAULT_INLINE_MAX = 64 * 1024
+
+
+def _attach(name: str) -> shared_memory.SharedMemory:
+    return shared_memory.SharedMemory(name=name, create=False)
+
+
+def _backoff(spins: int) -> int:
+    if spins < 64:
+        time.sleep(0)
+    else:
+        time.sleep(0.0005 if spins < 512 else 0.002)
+    return spins + 1
+
+
+class ShmQueue:
+    """
+    Single-producer/single-consumer channel over ``multiprocessing.shared_memory``.
+
+    Small messages are framed into a lock-free byte ring; large ones (chat
+    history with images, generated attachments) go through a separate payload
+    region in chunks. Only one process may ``put`` and one process may ``get``;
+    threads inside each side are serialized locally. The consumer parks on a
+    semaphore doorbell that the producer rings only when the consumer is idle.
+
+    Exposes the subset of ``multiprocessing.Queue`` used by the model process
+    (``put``, ``get``, ``get_nowait``, ``empty``) and can be passed to a spawned
+    process as an argument. A full channel makes ``put`` wait like
+    ``queue.Queue.put``; call ``watch`` with the consumer's liveness check so
+    that it fails with ``BrokenPipeError`` instead of waiting on a dead process.
+    """
+
+    def __init__(
+        self,
+        ctx,
+        ring_bytes: int = DEFAULT_RING_BYTES,
+        blob_bytes: int = DEFAULT_BLOB_BYTES,
+        inline_max: int = DEFAULT_INLINE_MAX,
+    ) -> None:
+        self._ring = shared_memory.SharedMemory(create=True, size=_HEADER_SIZE + ring_bytes)
+        self._blob = shared_memory.SharedMemory(create=True, size=_BLOB_HEADER_SIZE + blob_bytes)
+        self._ring.buf[:_HEADER_SIZE] = bytes(_HEADER_SIZE)
+        self._blob.buf[:_BLOB_HEADER_SIZE] = bytes(_BLOB_HEADER_SIZE)
+        self._capacity = ring_bytes
+        self._blob_capacity = blob_bytes
+        self._inline_max = min(inline_max, ring_bytes - _FRAME.size)
+        self._doorbell = ctx.Semaphore(0)
+        self._owner = True
+        self._init_local()
+
+    def _init_local(self) -> None:
+        self._put_lock = threading.Lock()
+        self._get_lock = threading.Lock()
+        self._pending = bytearray()
+        self._closed = False
+        self._peer_alive: Optional[Callable[[], bool]] = None
+
+    def watch(self, peer_alive: Optional[Callable[[], bool]]) -> None:
+        """Make a blocked ``put`` give up once ``peer_alive()`` returns False. Local to this process."""
+        self._peer_alive = peer_alive
+
+    def __getstate__(self):
+        return {
+            "ring": self._ring.name,
+            "blob": self._blob.name,
+            "capacity": self._capacity,
+            "blob_capacity": self._blob_capacity,
+            "inline_max": self._inline_max,
+            "doorbell": self._doorbell,
+        }
+
+    def __setstate__(self, state) -> None:
+        self._ring = _attach(state["ring"])
+        self._blob = _attach(state["blob"])
+        self._capacity = state["capacity"]
+        self._blob_capacity = state["blob_capacity"]
+        self._inline_max = state["inline_max"]
+        self._doorbell = state["doorbell"]
+        self._owner = False
+        self._init_local()
+
+    # -- shared counters -------------------------------------------------
+
+    def _load(self, fmt: struct.Struct, offset: int) -> int:
+        return fmt.unpack_from(self._ring.buf, offset)[0]
+
+    def _store(self, fmt: struct.Struct, offset: int, value: int) -> None:
+        fmt.pack_into(self._ring.buf, offset, value)
+
+    def _copy_in(self, pos: int, data) -> None:
+        start = pos % self._capacity
+        first = min(len(data), self._capacity - start)
+        base = _HEADER_SIZE
+        self._ring.buf[base + start:base + start + first] = data[:first]
+        if first < len(data):
+            rest = len(data) - first
+            self._ring.buf[base:base + rest] = data[first:]
+
+    def _copy_out(self, pos: int, size: int) -> bytes:
+        start = pos % self._capacity
+        first = min(size, self._capacity - start)
+        base = _HEADER_SIZE
+        data = bytes(self._ring.buf[base + start:base + start + first])
+        if first < size:
+            data += bytes(self._ring.buf[base:base + size - first])
+        return data
+
+    # -- producer ----------------------------------------------------------
+
+    def _wait(self, ready: Callable[[], bool], deadline: Optional[float]) -> None:
+        """
+        Back off until ``ready()``. Raises queue.Full past ``deadline`` and
+        BrokenPipeError once the channel is closed or the consumer is gone.
+        """
+        spins = 0
+        while not ready():
+            if self._closed:
+                raise BrokenPipeError("channel closed")
+            if deadline is not None and time.monotonic() >= deadline:
+                raise queue.Full
+            # is_alive() is a syscall; check it every few milliseconds at most.
+            if self._peer_alive is not None and spins >= 64 and spins % 16 == 0 and not self._peer_alive():
+                raise BrokenPipeError("consumer process exited")
+            spins = _backoff(spins)
+
+    def _ring_free(self, size: int) -> bool:
+        return self._capacity - (self._load(_TAIL, _TAIL_OFFSET) - self._load(_HEAD, _HEAD_OFFSET)) >= size
+
+    def _blob_free(self) -> bool:
+        return not _FLAG.unpack_from(self._blob.buf, _BLOB_BUSY_OFFSET)[0]
+
+    def _write_frame(self, kind: int, payload: bytes = b"", deadline: Optional[float] = None) -> None:
+        frame = _FRAME.pack(len(payload), kind) + payload
+        self._wait(lambda: self._ring_free(len(frame)), deadline)
+        tail = self._load(_TAIL, _TAIL_OFFSET)
+        self._copy_in(tail, frame)
+        self._store(_TAIL, _TAIL_OFFSET, tail + len(frame))
+        if self._load(_FLAG, _WAITING_OFFSET):
+            self._store(_FLAG, _WAITING_OFFSET, 0)
+            self._doorbell.release()
+
+    def _write_blob(self, data: bytes, deadline: Optional[float] = None) -> None:
+        """
+        ``deadline`` only bounds the wait for the first part. Once the consumer
+        holds part of a message the rest has to follow, or the stream would be
+        torn; from there on only a closed channel or a dead consumer stop it.
+        """
+        view = memoryview(data)
+        offset = 0
+        while offset < len(data):
+            self._wait(self._blob_free, deadline if offset == 0 else None)
+            if offset == 0:
+                # The frame of the first part must fit too, or it would be
+                # written after the deadline has already passed.
+                self._wait(lambda: self._ring_free(_FRAME.size), deadline)
+            part = view[offset:offset + self._blob_capacity]
+            self._blob.buf[_BLOB_HEADER_SIZE:_BLOB_HEADER_SIZE + len(part)] = part
+            _FLAG.pack_into(self._blob.buf, _BLOB_SIZE_OFFSET, len(part))
+            _FLAG.pack_into(self._blob.buf, _BLOB_BUSY_OFFSET, 1)
+            offset += len(part)
+            self._write_frame(_KIND_BLOB_LAST if offset >= len(data) else _KIND_BLOB_PART)
+
+    def put(self, obj: Any, block: bool = True, timeout: Optional[float] = None) -> None:
+        """
+        Raises queue.Full when there is no room within ``timeout`` (at once
+        when not ``block``), and BrokenPipeError when the channel is closed or
+        the watched consumer exits while waiting.
+        """
+        data = pickle.dumps(obj, protocol=pickle.HIGHEST_PROTOCOL)
+        if not block:
+            timeout = 0
+        start = time.monotonic()
+        if not self._put_lock.acquire(timeout=-1 if timeout is None else max(0.0, timeout)):
+            raise queue.Full
+        try:
+            if self._closed:
+                raise BrokenPipeError("channel closed")
+            deadline = None if timeout is None else start + timeout
+            if len(data) <= self._inline_max:
+                self._write_frame(_KIND_INLINE, data, deadline)
+            else:
+                self._write_blob(data, deadline)
+        finally:
+            self._put_lock.release()
+
+    # -- consumer ----------------------------------------------------------
+
+    def _read_frame(self):
+        head = self._load(_HEAD, _HEAD_OFFSET)
+        tail = self._load(_TAIL, _TAIL_OFFSET)
+        if tail == head:
+            return None
+        size, kind = _FRAME.unpack(self._copy_out(head, _FRAME.size))
+        pos = head + _FRAME.size
+        payload = b""
+        if kind == _KIND_INLINE:
+            payload = self._copy_out(pos, size)
+            pos += size
+        self._store(_HEAD, _HEAD_OFFSET, pos)
+        return kind, payload
+
+    def _try_get(self):
+        while True:
+            frame = self._read_frame()
+            if frame is None:
+                return None, False
+            kind, payload = frame
+            if kind == _KIND_INLINE:
+                return pickle.loads(payload), True
+            size = _FLAG.unpack_from(self._blob.buf, _BLOB_SIZE_OFFSET)[0]
+            self._pending += self._blob.buf[_BLOB_HEADER_SIZE:_BLOB_HEADER_SIZE + size]
+            _FLAG.pack_into(self._blob.buf, _BLOB_BUSY_OFFSET, 0)
+            if kind == _KIND_BLOB_LAST:
+                data = bytes(self._pending)
+                self._pending = bytearray()
+                return pickle.loads(data), True
+
+    def get(self, block: bool = True, timeout: Optional[float] = None) -> Any:
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._get_lock:
+            while True:
+                if self._closed:
+                    raise EOFError("channel closed")
+                obj, ok = self._try_get()
+                if ok:
+                    return obj
+                if not block:
+                    raise queue.Empty
+                self._store(_FLAG, _WAITING_OFFSET, 1)
+                obj, ok = self._try_get()
+                if ok:
+                    self._store(_FLAG, _WAITING_OFFSET, 0)
+                    return obj
+                if deadline is None:
+                    wait = 0.5
+                else:
+                    wait = deadline - time.monotonic()
+                    if wait <= 0:
+                        self._store(_FLAG, _WAITING_OFFSET, 0)
+                        raise queue.Empty
+                self._doorbell.acquire(timeout=min(wait, 0.5))
+                self._store(_FLAG, _WAITING_OFFSET, 0)
+
+    def get_nowait(self) -> Any:
+        return self.get(block=False)
+
+    def empty(self) -> bool:
+        return self._load(_HEAD, _HEAD_OFFSET) == self._load(_TAIL, _TAIL_OFFSET)
+
+    def close(self) -> None:
+        self._closed = True
+        # Let a consumer parked on the doorbell notice the close.
+        try:
+            self._doorbell.release()
+        except Exception:
+            pass
+        with self._get_lock, self._put_lock:
+            pass
+        for shm in (self._ring, self._blob):
+            try:
+                shm.close()
+            except Exception:
+                pass
+            if self._owner:
+                try:
+                    shm.unlink()
+                except Exception:
+                    pass
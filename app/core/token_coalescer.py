@@ -0,0 +1,157 @@
+import threading
+import time
+from typing import Callable, List, Optional
+
+from app.config import STREAM_COALESCE_CHARS, STREAM_COALESCE_MS
+
+
+class TokenCoalescer:
+    """
+    Merge streamed text pieces into fewer frames.
+
+    A frame is released once its oldest piece is ``flush_ms`` old or it holds
+    ``max_chars`` characters. When pieces arrive slower than ``flush_ms`` apart
+    (slow decode) buffering would only add latency, so every piece is released
+    immediately; the first piece of a stream is never held.
+    """
+
+    _EMA_ALPHA = 0.3
+
+    def __init__(
+        self,
+        flush_ms: Optional[int] = None,
+        max_chars: Optional[int] = None,
+        clock: Callable[[], float] = time.perf_counter,
+    ) -> None:
+        flush_ms = STREAM_COALESCE_MS if flush_ms is None else flush_ms
+        max_chars = STREAM_COALESCE_CHARS if max_chars is None else max_chars
+        self.flush_interval = max(0.0, float(flush_ms) / 1000.0)
+        self.max_chars = max(0, int(max_chars))
+        self._clock = clock
+        self._parts: List[str] = []
+        self._chars = 0
+        self._first_at: Optional[float] = None
+        self._last_push: Optional[float] = None
+        self._gap_ema: Optional[float] = None
+        self.pushed = 0
+        self.frames = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.flush_interval > 0
+
+    @property
+    def frames_saved(self) -> int:
+        return max(0, self.pushed - self.frames)
+
+    def _passthrough(self) -> bool:
+        # The first piece goes out at once so time-to-first-token is unaffected.
+        if not self.enabled or self._gap_ema is None:
+            return True
+        return self._gap_ema >= self.flush_interval
+
+    def _take(self) -> Optional[str]:
+        if not self._parts:
+            return None
+        text = "".join(self._parts)
+        self._parts = []
+        self._chars = 0
+        self._first_at = None
+        self.frames += 1
+        return text
+
+    def push(self, text: str) -> Optional[str]:
+        """Buffer ``text``; return a frame when one is due, else None."""
+        if not text:
+            return None
+        now = self._clock()
+        if self._last_push is not None:
+            gap = now - self._last_push
+            if self._gap_ema is None:
+                self._gap_ema = gap
+            else:
+                self._gap_ema += self._EMA_ALPHA * (gap - self._gap_ema)
+        self._last_push = now
+        self.pushed += 1
+
+        self._parts.append(text)
+        self._chars += len(text)
+        if self._first_at is None:
+            self._first_at = now
+
+        if self._passthrough():
+            return self._take()
+        if self.max_chars and self._chars >= self.max_chars:
+            return self._take()
+        if now - self._first_at >= self.flush_interval:
+            return self._take()
+        return None
+
+    def poll(self) -> Optional[str]:
+        """Return the buffered frame if its deadline has passed."""
+        if self._first_at is None:
+            return None
+        if self._clock() - self._first_at >= self.flush_interval:
+            return self._take()
+        return None
+
+    def time_to_flush(self) -> Optional[float]:
+        """Seconds until the buffered frame is due, or None when empty."""
+        if self._first_at is None:
+            return None
+        return max(0.0, self.flush_interval - (self._clock() - self._first_at))
+
+    def flush(self) -> Optional[str]:
+        return self._take()
+
+
+class TimedCoalescer:
+    """
+    A TokenCoalescer that releases due frames on its own.
+
+    ``push`` is called from a pipeline's streamer callback, which can go quiet
+    for seconds (NPU stalls, gaps between Whisper windows). While a frame is
+    buffered a helper thread waits for its deadline and hands it to ``emit``,
+    so text never waits for the next token. Frames are emitted under a lock,
+    in order; the thread exits whenever the buffer is empty.
+    """
+
+    def __init__(self, emit: Callable[[str], None], coalescer: Optional[TokenCoalescer] = None) -> None:
+        self.coalescer = coalescer or TokenCoalescer()
+        self._emit = emit
+        self._cond = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def frames_saved(self) -> int:
+        return self.coalescer.frames_saved
+
+    def push(self, text: str) -> None:
+        with self._cond:
+            frame = self.coalescer.push(text)
+            if frame:
+                self._emit(frame)
+            elif self.coalescer.time_to_flush() is not None and self._thread is None:
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+
+    def flush(self) -> None:
+        with self._cond:
+            frame = self.coalescer.flush()
+            if frame:
+                self._emit(frame)
+            self._cond.notify()
+
+    def _run(self) -> None:
+        with self._cond:
+            while True:
+                wait = self.coalescer.time_to_flush()
+                if wait is None:
+                    self._thread = None
+                    return
+                if wait > 0:
+                    self._cond.wait(wait)
+                    continue
+                frame = self.coalescer.poll()
+                if frame:
+                    self._emit(frame)
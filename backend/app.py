@@ -1,14 +1,15 @@
+import asyncio
 import json
 import os
-import queue
 import shutil
 import sys
 import threading
 import time
 from pathlib import Path
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, List, Optional, Tuple
 
-from fastapi import FastAPI, HTTPException, Query, Response
+from fastapi import FastAPI, Header, HTTPException, Query, Request, Response
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import FileResponse, StreamingResponse
 from fastapi.staticfiles import StaticFiles
@@ -26,12 +27,15 @@ if bad_app and getattr(bad_app, "__file__", None) == str(Path(__file__).resolve(
 
 from app.config import (
     APP_VERSION,
+    BLOBS_DIR,
+    BLOB_FALLBACK_DIRS,
     DEFAULT_CONFIG,
     CONFIG_GROUPS,
     MODELS_DIR,
     DOWNLOAD_CACHE_DIR,
     DATA_DIR,
     CONFIG_DIR,
+    JOB_CHECKPOINT_S,
     LOGS_DIR,
     OV_CACHE_DIR,
     SESSIONS_DB_PATH,
@@ -40,8 +44,12 @@ from app.config import (
     MAX_FILE_BYTES,
     MAX_IMAGE_BYTES,
     MAX_AUDIO_BYTES,
+    MAX_AUDIO_UPLOAD_BYTES,
 )
+from app.core.blob_store import BlobStore
+from app.core.context_builder import MESSAGE_OVERHEAD_TOKENS, ContextBuilder
 from app.core.runtime import AVAILABLE_DEVICES
+from app.core.token_coalescer import TokenCoalescer
 from app.core.session import SessionManager
 from app.model_configs import (
     PRESET_MODELS,
@@ -52,7 +60,7 @@ from app.model_configs import (
 from app.utils.config_loader import load_model_json_configs, resolve_supported_setting_keys
 from app.utils.scanner import scan_dirs
 from backend.download_service import DownloadService
-from backend.llm_service import LLMService
+from backend.llm_service import DEFAULT_PRIORITY, LLMService
 from backend.npu_monitor import get_npu_monitor
 from backend.system_status import get_memory_status, get_process_memory
 
@@ -73,11 +81,27 @@ app.add_middleware(
 
 session_lock = threading.Lock()
 session_mgr = SessionManager()
+blob_store = BlobStore(BLOBS_DIR, BLOB_FALLBACK_DIRS)
 llm_service = LLMService()
 download_service = DownloadService(
     str(DOWNLOAD_SCRIPT), str(DOWNLOAD_CACHE_DIR), str(MODELS_DIR)
 )
 npu_monitor = get_npu_monitor()
+context_builder = ContextBuilder()
+restore_lock = threading.Lock()
+restore_state: Dict[str, Any] = {"state": "idle", "path": "", "error": ""}
+# Cleared while the last model is being restored; user loads wait for it.
+restore_done = threading.Event()
+restore_done.set()
+_UPLOAD_WRITE_BYTES = 1024 * 1024
+_RANGE_CHUNK_BYTES = 64 * 1024
+# Content types /api/blobs may serve. Anyone can upload bytes, so nothing that
+# a browser would render as a document (SVG, HTML, XML) is ever allowed.
+_BLOB_MEDIA_TYPES = frozenset({
+    "image/png", "image/jpeg", "image/webp", "image/gif",
+    "audio/wav", "audio/x-wav", "audio/mpeg", "audio/ogg", "audio/webm", "audio/mp4",
+    "audio/flac", "audio/aac",
+})
 
 
 class SessionCreateRequest(BaseModel):
@@ -95,6 +119,15 @@ class ModelLoadRequest(BaseModel):
     path: str
     device: str = "AUTO"
     max_prompt_len: int = 16384
+    serving_mode: bool = False
+    kv_cache_size_gb: Optional[float] = Field(default=None, gt=0)
+    max_num_batched_tokens: Optional[int] = Field(default=None, gt=0)
+    max_num_seqs: Optional[int] = Field(default=None, gt=0)
+    draft_path: Optional[str] = None
+    draft_device: Optional[str] = None
+    # Prompt lookup decoding is built into the pipeline, so it is chosen at load time.
+    prompt_lookup: bool = False
+    warmup: Optional[bool] = None
 
 
 class ModelDeleteRequest(BaseModel):
@@ -103,10 +136,12 @@ class ModelDeleteRequest(BaseModel):
 
 class FileAttachment(BaseModel):
     name: str = Field(..., min_length=1)
-    content: str
+    content: str = ""
     truncated: Optional[bool] = None
     kind: Optional[str] = None
     mime: Optional[str] = None
+    blob: Optional[str] = None
+    size: Optional[int] = None
 
 
 class ChatStreamRequest(BaseModel):
@@ -114,11 +149,17 @@ class ChatStreamRequest(BaseModel):
     text: str
     config: Optional[Dict[str, Any]] = None
     attachments: Optional[List[FileAttachment]] = None
+    priority: Optional[str] = None
 
 
 class ChatRegenerateRequest(BaseModel):
     session_id: str
     config: Optional[Dict[str, Any]] = None
+    priority: Optional[str] = None
+
+
+class ChatStopRequest(BaseModel):
+    job_id: Optional[str] = None
 
 
 class MessageEditRequest(BaseModel):
@@ -141,10 +182,12 @@ class AppPathsRequest(BaseModel):
     sessions_db: Optional[str] = None
     config_dir: Optional[str] = None
     logs_dir: Optional[str] = None
+    blobs_dir: Optional[str] = None
     attachments_dir: Optional[str] = None
 
-def _sse(payload: Dict[str, Any]) -> str:
-    return f"data: {json.dumps(payload, ensure_ascii=False)}\n\n"
+def _sse(payload: Dict[str, Any], event_id: Optional[int] = None) -> str:
+    data = f"data: {json.dumps(payload, ensure_ascii=False)}\n\n"
+    return data if event_id is None else f"id: {event_id}\n{data}"
 
 
 def _sanitize_attachments(attachments: Optional[List[FileAttachment]]) -> List[Dict[str, Any]]:
@@ -157,7 +200,7 @@ def _sanitize_attachments(attachments: Optional[List[FileAttachment]]) -> List[D
         content = str(data.get("content", ""))
         kind = str(data.get("kind", "") or "").strip().lower()
         mime = str(data.get("mime", "") or "").strip().lower()
-        if not name or not content:
+        if not name or not (content or data.get("blob")):
             continue
         if not kind:
             if mime.startswith("image/") or content.startswith("data:image/"):
@@ -167,6 +210,21 @@ def _sanitize_attachments(attachments: Optional[List[FileAttachment]]) -> List[D
             else:
                 kind = "text"
         truncated = False
+        blob = data.get("blob")
+        if kind in ("image", "audio") and blob:
+            # Already in the blob store (generated, or uploaded via /api/uploads): pass the reference on.
+            path = blob_store.path(blob)
+            if path is None:
+                continue
+            size = path.stat().st_size
+            if size > (MAX_IMAGE_BYTES if kind == "image" else MAX_AUDIO_UPLOAD_BYTES):
+                continue
+            ref = {"name": name[:200], "content": "", "truncated": False, "kind": kind, "mime": mime,
+                   "blob": blob, "size": size}
+            if blob_store.path(data.get("thumb") or "") is not None:
+                ref["thumb"] = data["thumb"]
+            safe.append(ref)
+            continue
         if kind == "image":
             data_url = content
             if not data_url.startswith("data:"):
@@ -249,6 +307,65 @@ def _safe_filename(name: str) -> str:
     return name[:200]
 
 
+def _parse_range(header: str, size: int) -> Optional[Tuple[int, int]]:
+    """Inclusive byte span of a single ``bytes=`` range; None to serve the whole file."""
+    unit, _, spec = (header or "").partition("=")
+    if unit.strip().lower() != "bytes" or "," in spec:
+        return None
+    first, _, last = spec.strip().partition("-")
+    try:
+        if first:
+            start = int(first)
+            end = int(last) if last else size - 1
+        else:
+            start = max(0, size - int(last))
+            end = size - 1
+    except ValueError:
+        return None
+    end = min(end, size - 1)
+    if start < 0 or start > end:
+        raise HTTPException(status_code=416, detail="Range not satisfiable",
+                            headers={"Content-Range": f"bytes */{size}"})
+    return start, end
+
+
+def _file_response(
+    request: Request,
+    path: Path,
+    media_type: str,
+    filename: Optional[str] = None,
+    headers: Optional[Dict[str, str]] = None,
+) -> Response:
+    """Serve a stored file, answering ``Range`` requests (audio seeking, resumed downloads) with 206."""
+    headers = dict(headers or {})
+    headers["Accept-Ranges"] = "bytes"
+    size = path.stat().st_size
+    span = _parse_range(request.headers.get("range", ""), size) if request.headers.get("range") and size else None
+    if span is None:
+        return FileResponse(path, media_type=media_type, filename=filename, headers=headers)
+    start, end = span
+    headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+    headers["Content-Length"] = str(end - start + 1)
+    if filename:
+        headers["Content-Disposition"] = f'attachment; filename="{filename}"'
+    return StreamingResponse(
+        _read_span(path, start, end), status_code=206, media_type=media_type, headers=headers,
+    )
+
+
+def _read_span(path: Path, start: int, end: int):
+    """Bytes ``start``..``end`` (inclusive) of ``path`` in _RANGE_CHUNK_BYTES pieces."""
+    with open(path, "rb") as fh:
+        fh.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            chunk = fh.read(min(_RANGE_CHUNK_BYTES, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+
 def _format_attachments(attachments: List[Dict[str, Any]]) -> str:
     if not attachments:
         return ""
@@ -286,18 +403,239 @@ def _build_messages(history, config: Dict[str, Any]):
     except (TypeError, ValueError):
         max_turns = 10
 
+    # Checkpoints of replies still being generated are not part of the conversation yet.
+    indices = [index for index, msg in enumerate(history) if not _reply_in_progress(msg)]
     if max_turns > 0:
-        sliced_history = history[-(max_turns * 2) :]
+        indices = indices[-(max_turns * 2) :]
     else:
-        sliced_history = history[-1:] if history else []
+        indices = indices[-1:]
+
+    merged = [_merge_message_attachments(history[index]) for index in indices]
+    limits = llm_service.get_context_limits()
+    if limits and merged:
+        # Keep the newest turns that fit the loaded model's prompt budget.
+        _, max_prompt_len = limits
+        try:
+            max_new_tokens = int(config.get("max_new_tokens", 1024))
+        except (TypeError, ValueError):
+            max_new_tokens = 1024
+        counts = [context_builder.count(msg.get("content", "")) for msg in merged]
+        reserved = context_builder.count(sys_prompt) + MESSAGE_OVERHEAD_TOKENS if sys_prompt else 0
+        merged, _ = context_builder.select(
+            merged, counts, ContextBuilder.budget(max_prompt_len, max_new_tokens), reserved
+        )
 
     messages = []
     if sys_prompt:
         messages.append({"role": "system", "content": sys_prompt})
-    messages.extend(_merge_message_attachments(msg) for msg in sliced_history)
+    messages.extend(merged)
     return messages
 
 
+async def _relay_generation(events: "asyncio.Queue[Dict[str, Any]]", recorder: Optional["_ReplyRecorder"] = None):
+    """SSE frames for job events; each frame's id is the ``seq`` of the last event it covers."""
+    coalescer = TokenCoalescer()
+    token_seq: Optional[int] = None
+
+    while True:
+        wait = coalescer.time_to_flush()
+        try:
+            if wait is None:
+                item = await events.get()
+            else:
+                item = await asyncio.wait_for(events.get(), timeout=wait)
+        except asyncio.TimeoutError:
+            frame = coalescer.poll()
+            if frame:
+                yield _sse({"type": "token", "token": frame}, token_seq)
+            continue
+
+        msg_type = item.get("type")
+        seq = item.get("seq")
+        if msg_type == "token":
+            token_seq = seq
+            frame = coalescer.push(item.get("token", ""))
+            if frame:
+                yield _sse({"type": "token", "token": frame}, token_seq)
+            continue
+
+        frame = coalescer.flush()
+        if frame:
+            yield _sse({"type": "token", "token": frame}, token_seq)
+        if msg_type in ("job", "queued", "started"):
+            yield _sse(item, seq)
+        elif msg_type == "image":
+            safe_attachments = _sanitize_attachments(item.get("attachments") or [])
+            if safe_attachments:
+                yield _sse({"type": "image", "attachments": safe_attachments}, seq)
+        elif msg_type in ("error", "done"):
+            if recorder is not None:
+                # The client usually reloads the session on "done"; let the reply land first.
+                await run_in_threadpool(recorder.saved.wait, 5)
+            if msg_type == "error":
+                error = {"type": "error", "message": item.get("msg", "Error")}
+                if item.get("code"):
+                    error["code"] = item["code"]
+                yield _sse(error, seq)
+            else:
+                stats = dict(item.get("stats") or {})
+                stats["sse_frames_saved"] = coalescer.frames_saved
+                stats["frames_saved"] = int(stats.get("ipc_frames_saved") or 0) + coalescer.frames_saved
+                yield _sse({"type": "done", "stats": stats}, seq)
+            break
+
+
+class _ReplyRecorder:
+    """
+    Saves the reply of a generation job to its session, independently of the
+    client stream. While the job runs the text so far is checkpointed every
+    ``JOB_CHECKPOINT_S`` as an assistant message flagged ``partial``; the
+    final event rewrites it as a normal message.
+    """
+
+    def __init__(self, job_id: str, session_id: str) -> None:
+        self.job_id = job_id
+        self.session_id = session_id
+        self.saved = threading.Event()
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock()
+        self._parts: List[str] = []
+        self._attachments: List[Dict[str, Any]] = []
+        self._saved_attachments = 0
+        self._dirty = False
+        self._finished = False
+        self._key: Optional[int] = None
+        self._dropped = False
+
+    def on_event(self, event: Dict[str, Any]) -> None:
+        # Runs on LLMService threads; database work is left to flush().
+        msg_type = event.get("type")
+        with self._lock:
+            if msg_type == "token":
+                self._parts.append(event.get("token", ""))
+                self._dirty = True
+            elif msg_type == "image":
+                self._attachments.extend(_sanitize_attachments(event.get("attachments") or []))
+                self._dirty = True
+            elif msg_type in ("done", "error"):
+                self._finished = True
+        if msg_type in ("done", "error"):
+            threading.Thread(target=self.flush, daemon=True).start()
+
+    def drop(self) -> None:
+        """Stop saving: the history this reply belonged to was rewritten."""
+        with self._lock:
+            self._dropped = True
+
+    def flush(self) -> None:
+        with self._save_lock:
+            with self._lock:
+                finished = self._finished
+                if self.saved.is_set() or not (self._dirty or finished):
+                    return
+                text = "".join(self._parts)
+                attachments = self._attachments[self._saved_attachments:]
+                self._dirty = False
+            meta = {} if finished else {"partial": True, "job_id": self.job_id}
+            try:
+                if not self._dropped and (self._key is not None or text or attachments):
+                    with session_lock:
+                        if self._key is None:
+                            self._key = session_mgr.add_message(
+                                "assistant", text, sid=self.session_id, attachments=attachments, **meta
+                            )
+                        elif not session_mgr.update_message(
+                            self._key, text, sid=self.session_id, attachments=attachments, **meta
+                        ):
+                            # The history was edited or cleared meanwhile.
+                            self._dropped = True
+                    self._saved_attachments += len(attachments)
+            finally:
+                if finished:
+                    self.saved.set()
+
+
+recorders_lock = threading.Lock()
+_recorders: Dict[str, _ReplyRecorder] = {}
+_checkpointer: Optional[threading.Thread] = None
+
+
+def _checkpoint_loop() -> None:
+    while True:
+        time.sleep(JOB_CHECKPOINT_S)
+        with recorders_lock:
+            for job_id in [key for key, rec in _recorders.items() if rec.saved.is_set()]:
+                del _recorders[job_id]
+            pending = list(_recorders.values())
+        for recorder in pending:
+            try:
+                recorder.flush()
+            except Exception:
+                pass
+
+
+def _stop_session_jobs(sid: str) -> None:
+    """Cancel the session's jobs and drop their replies before its history is rewritten."""
+    with recorders_lock:
+        recorders = [rec for rec in _recorders.values() if rec.session_id == sid]
+    for recorder in recorders:
+        recorder.drop()
+    for job in llm_service.list_jobs(session_id=sid):
+        llm_service.cancel(job["job_id"])
+
+
+def _reply_in_progress(msg: Dict[str, Any]) -> bool:
+    """A checkpoint of a reply that is still being generated."""
+    if not msg.get("partial"):
+        return False
+    job = llm_service.get_job(str(msg.get("job_id") or ""))
+    return job is not None and not job.done.is_set()
+
+
+def _record_reply(job, session_id: str) -> _ReplyRecorder:
+    global _checkpointer
+    recorder = _ReplyRecorder(job.id, session_id)
+    with recorders_lock:
+        _recorders[job.id] = recorder
+        if _checkpointer is None:
+            _checkpointer = threading.Thread(target=_checkpoint_loop, daemon=True)
+            _checkpointer.start()
+    job.subscribe(recorder.on_event)
+    return recorder
+
+
+async def _follow_job(job, after: int = 0, recorder: Optional[_ReplyRecorder] = None):
+    """SSE frames of ``job`` from event ``after`` on; events are pushed from LLMService threads, never polled."""
+    loop = asyncio.get_running_loop()
+    events: "asyncio.Queue[Dict[str, Any]]" = asyncio.Queue()
+
+    def listener(event: Dict[str, Any]) -> None:
+        loop.call_soon_threadsafe(events.put_nowait, event)
+
+    job.subscribe(listener, after=after)
+    if job.done.is_set() and after >= len(job.events):
+        # Reconnect after the final event: nothing to replay and nothing will follow.
+        return
+    try:
+        async for frame in _relay_generation(events, recorder):
+            yield frame
+    finally:
+        # A client going away leaves the job running; it can reattach later.
+        job.unsubscribe(listener)
+
+
+async def _stream_generation(messages, config: Dict[str, Any], priority: str, session_id: str):
+    try:
+        job = llm_service.generate(messages, config, priority=priority, session_id=session_id)
+    except Exception as exc:
+        yield _sse({"type": "error", "message": str(exc)})
+        return
+
+    recorder = _record_reply(job, session_id)
+    async for frame in _follow_job(job, recorder=recorder):
+        yield frame
+
+
 @app.get("/api/health")
 def api_health():
     return {"status": "ok"}
@@ -318,6 +656,7 @@ def api_config():
         "max_file_bytes": MAX_FILE_BYTES,
         "max_image_bytes": MAX_IMAGE_BYTES,
         "max_audio_bytes": MAX_AUDIO_BYTES,
+        "max_audio_upload_bytes": MAX_AUDIO_UPLOAD_BYTES,
         "app_paths": {
             "models_dir": str(MODELS_DIR),
             "download_cache_dir": str(DOWNLOAD_CACHE_DIR),
@@ -325,6 +664,7 @@ def api_config():
             "sessions_db": str(SESSIONS_DB_PATH),
             "config_dir": str(CONFIG_DIR),
             "logs_dir": str(LOGS_DIR),
+            "blobs_dir": str(BLOBS_DIR),
             "attachments_dir": get_path_overrides().get("attachments_dir", ""),
         },
     }
@@ -340,6 +680,7 @@ def api_app_paths():
             "sessions_db": str(SESSIONS_DB_PATH),
             "config_dir": str(CONFIG_DIR),
             "logs_dir": str(LOGS_DIR),
+            "blobs_dir": str(BLOBS_DIR),
             "attachments_dir": "",
         },
         "overrides": get_path_overrides(),
@@ -449,18 +790,94 @@ def api_models_config(path: str = Query(..., min_length=1)):
 
 @app.post("/api/models/load")
 def api_models_load(req: ModelLoadRequest):
+    serving = None
+    if req.serving_mode:
+        serving = {
+            "kv_cache_size_gb": req.kv_cache_size_gb,
+            "max_num_batched_tokens": req.max_num_batched_tokens,
+            "max_num_seqs": req.max_num_seqs,
+        }
+    draft = None
+    if req.draft_path:
+        draft = {"path": req.draft_path, "device": req.draft_device or req.device}
+    # Both loads would race for the same worker; the user's choice wins once
+    # the restore has finished (a pool hit if it is the same model).
+    restore_done.wait()
     try:
         model_path, device, kind = llm_service.load_model(
-            req.source, req.model_id, req.path, req.device, req.max_prompt_len
+            req.source, req.model_id, req.path, req.device, req.max_prompt_len, serving=serving, draft=draft,
+            warmup=req.warmup, prompt_lookup=req.prompt_lookup,
         )
     except Exception as exc:
         raise HTTPException(status_code=400, detail=str(exc))
+    _remember_model({
+        "source": req.source,
+        "model_id": req.model_id,
+        "path": req.path,
+        "device": req.device,
+        "max_prompt_len": req.max_prompt_len,
+        "serving": serving,
+        "draft": draft,
+        "prompt_lookup": req.prompt_lookup,
+    })
     return {"path": model_path, "device": device, "kind": kind}
 
 
+def _remember_model(model: Dict[str, Any]) -> None:
+    try:
+        with session_lock:
+            session_mgr.set_last_model(model)
+    except Exception:
+        pass
+
+
+def _restore_last_model(last: Dict[str, Any]) -> None:
+    try:
+        llm_service.load_model(
+            last.get("source") or "local",
+            last.get("model_id") or "",
+            last["path"],
+            last.get("device") or "AUTO",
+            int(last.get("max_prompt_len") or 16384),
+            serving=last.get("serving"),
+            draft=last.get("draft"),
+            prompt_lookup=bool(last.get("prompt_lookup")),
+        )
+    except Exception as exc:
+        # Not retried on later starts until the user loads a model again.
+        with session_lock:
+            if session_mgr.get_last_model() == last:
+                session_mgr.set_last_model({**last, "restore_error": str(exc)})
+        with restore_lock:
+            restore_state.update(state="error", error=str(exc))
+    else:
+        with restore_lock:
+            restore_state["state"] = "done"
+    finally:
+        restore_done.set()
+
+
+def restore_last_model() -> bool:
+    """Start loading the last successfully loaded model in the background."""
+    with session_lock:
+        last = session_mgr.get_last_model()
+    if not last or last.get("restore_error") or not Path(last["path"]).is_dir():
+        return False
+    with restore_lock:
+        if restore_state["state"] == "loading":
+            return False
+        restore_state.update(state="loading", path=last["path"], error="")
+        restore_done.clear()
+    threading.Thread(target=_restore_last_model, args=(last,), daemon=True).start()
+    return True
+
+
 @app.get("/api/models/status")
 def api_models_status():
-    return llm_service.get_status()
+    status = llm_service.get_status()
+    with restore_lock:
+        status["restore"] = dict(restore_state)
+    return status
 
 
 @app.post("/api/models/delete")
@@ -478,14 +895,10 @@ def api_models_delete(req: ModelDeleteRequest):
     if not target.is_dir():
         raise HTTPException(status_code=400, detail="Invalid model path")
 
-    status = llm_service.get_status()
-    loaded_path = status.get("path") if isinstance(status, dict) else ""
-    if status.get("loaded") and loaded_path:
-        if Path(str(loaded_path)).resolve() == target:
-            try:
-                llm_service.unload_model()
-            except RuntimeError as exc:
-                raise HTTPException(status_code=409, detail=str(exc))
+    try:
+        llm_service.unload_model(str(target))
+    except RuntimeError as exc:
+        raise HTTPException(status_code=409, detail=str(exc))
 
     try:
         shutil.rmtree(target)
@@ -545,24 +958,70 @@ def api_sessions_rename(sid: str, req: SessionRenameRequest):
 
 @app.delete("/api/sessions/{sid}")
 def api_sessions_delete(sid: str):
+    _stop_session_jobs(sid)
     with session_lock:
         if sid not in session_mgr.sessions and sid not in session_mgr.temp_sessions:
             raise HTTPException(status_code=404, detail="Session not found")
         session_mgr.delete_session(sid)
+        llm_service.invalidate_session(sid)
         return {"ok": True, "current_session_id": session_mgr.current_session_id}
 
 
+def _attachment_summary(sid: str, index: int, att_index: int, att: Dict[str, Any]) -> Dict[str, Any]:
+    """Attachment metadata for the message list; bytes are fetched from ``url`` (or the blob) on demand."""
+    kind = session_mgr._infer_attachment_kind(att)
+    summary = {
+        "name": att.get("name") or "",
+        "kind": kind,
+        "mime": att.get("mime") or "",
+        "truncated": bool(att.get("truncated")),
+        "size": int(att.get("size") or 0) or session_mgr._attachment_size(str(att.get("content") or ""), kind),
+    }
+    if att.get("blob"):
+        summary["blob"] = att["blob"]
+        if att.get("thumb"):
+            summary["thumb"] = att["thumb"]
+    else:
+        summary["url"] = f"/api/sessions/{sid}/attachments/{index}/{att_index}"
+    return summary
+
+
 @app.get("/api/sessions/{sid}/messages")
-def api_sessions_messages(sid: str):
+def api_sessions_messages(
+    sid: str,
+    before_id: Optional[int] = None,
+    limit: Optional[int] = Query(default=None, ge=1, le=1000),
+):
+    """
+    Messages oldest first, each with its ``id`` and its ``index`` in the whole
+    history. With ``limit`` only the newest page before ``before_id`` is
+    returned; pass ``next_before_id`` back to get the page before it.
+    Attachment contents are left out (see ``_attachment_summary``).
+    """
     with session_lock:
-        session = session_mgr.get_session(sid)
-        if not session:
-            raise HTTPException(status_code=404, detail="Session not found")
-        return {"messages": session.get("history", [])}
+        page = session_mgr.get_messages_page(sid, before_id=before_id, limit=limit)
+    if page is None:
+        raise HTTPException(status_code=404, detail="Session not found")
+    messages = []
+    for message_id, index, msg in page["items"]:
+        item = {k: v for k, v in msg.items() if k != "attachments"}
+        item.update({"id": message_id, "index": index})
+        if msg.get("attachments"):
+            item["attachments"] = [
+                _attachment_summary(sid, index, att_index, att)
+                for att_index, att in enumerate(msg["attachments"])
+            ]
+        messages.append(item)
+    return {
+        "messages": messages,
+        "total": page["total"],
+        "has_more": page["next_before_id"] is not None,
+        "next_before_id": page["next_before_id"],
+    }
 
 
 @app.get("/api/sessions/{sid}/attachments/{msg_index}/{att_index}")
-def api_sessions_attachment(sid: str, msg_index: int, att_index: int):
+def api_sessions_attachment(sid: str, msg_index: int, att_index: int, request: Request):
     with session_lock:
         session = session_mgr.get_session(sid)
         if not session:
@@ -578,7 +1037,10 @@ def api_sessions_attachment(sid: str, msg_index: int, att_index: int):
         kind = str(att.get("kind") or "").lower()
         mime = str(att.get("mime") or "")
         content = att.get("content") or ""
+        blob_path = blob_store.path(att.get("blob") or "")
 
+        if blob_path is not None:
+            return _file_response(request, blob_path, mime or "application/octet-stream", filename=name)
         raw = None
         media_type = mime or "application/octet-stream"
         if kind in ("image", "audio") and isinstance(content, str) and content.startswith("data:"):
@@ -598,6 +1060,63 @@ def api_sessions_attachment(sid: str, msg_index: int, att_index: int):
         return Response(content=raw, media_type=media_type, headers=headers)
 
 
+@app.post("/api/uploads")
+async def api_upload(request: Request, mime: Optional[str] = None):
+    """
+    Spool a raw request body (an audio recording) into the blob store and
+    return the reference to attach to a message. Unlike a data URL the file
+    is never base64-encoded or held in memory, so it may be much larger.
+    Images stay inline: they are capped at MAX_IMAGE_BYTES anyway.
+    """
+    mime = (mime or request.headers.get("content-type") or "").split(";", 1)[0].strip().lower()
+    if mime.split("/", 1)[0] != "audio":
+        raise HTTPException(status_code=415, detail="Only audio uploads are supported")
+    writer = blob_store.writer(MAX_AUDIO_UPLOAD_BYTES)
+    # Hashing and file writes run in the threadpool, in pieces of about
+    # _UPLOAD_WRITE_BYTES, so a large upload does not stall other streams.
+    pending = bytearray()
+    try:
+        async for chunk in request.stream():
+            pending += chunk
+            if len(pending) >= _UPLOAD_WRITE_BYTES:
+                await run_in_threadpool(writer.write, bytes(pending))
+                pending.clear()
+        if pending:
+            await run_in_threadpool(writer.write, bytes(pending))
+    except ValueError:
+        raise HTTPException(status_code=413, detail="File too large")
+    except BaseException:
+        # Includes the client going away mid-upload (cancellation).
+        writer.abort()
+        raise
+    if not writer.size:
+        writer.abort()
+        raise HTTPException(status_code=400, detail="Empty upload")
+    digest = await run_in_threadpool(writer.commit)
+    return {"blob": digest, "size": writer.size, "mime": mime}
+
+
+@app.get("/api/blobs/{digest}")
+def api_blob(digest: str, request: Request, mime: Optional[str] = None):
+    """Content-addressed bytes; the digest never changes meaning, so clients may cache forever."""
+    path = blob_store.path(digest)
+    if path is None:
+        raise HTTPException(status_code=404, detail="Blob not found")
+    media_type = (mime or "").split(";", 1)[0].strip().lower()
+    if media_type not in _BLOB_MEDIA_TYPES:
+        media_type = "application/octet-stream"
+    return _file_response(
+        request,
+        path,
+        media_type,
+        headers={
+            "Cache-Control": "public, max-age=31536000, immutable",
+            "X-Content-Type-Options": "nosniff",
+            "Content-Security-Policy": "sandbox",
+        },
+    )
+
+
 @app.get("/api/sessions/{sid}/size")
 def api_sessions_size(sid: str):
     with session_lock:
@@ -609,16 +1128,19 @@ def api_sessions_size(sid: str):
 
 @app.post("/api/sessions/{sid}/clear")
 def api_sessions_clear(sid: str):
+    _stop_session_jobs(sid)
     with session_lock:
         if not session_mgr.get_session(sid):
             raise HTTPException(status_code=404, detail="Session not found")
         ok = session_mgr.clear_session(sid)
         session_mgr._save_sessions()
+        llm_service.invalidate_session(sid)
         return {"ok": bool(ok)}
 
 
 @app.post("/api/sessions/{sid}/messages/edit")
 def api_sessions_messages_edit(sid: str, req: MessageEditRequest):
+    _stop_session_jobs(sid)
     with session_lock:
         session = session_mgr.get_session(sid)
         if not session:
@@ -630,18 +1152,20 @@ def api_sessions_messages_edit(sid: str, req: MessageEditRequest):
         if history[req.index].get("role") != "user":
             raise HTTPException(status_code=400, detail="Only user messages can be edited")
 
-        history[req.index]["content"] = req.content
-        session["history"] = history[: req.index + 1]
+        session_mgr.edit_message(req.index, req.content, sid=sid)
+        session_mgr.truncate_history(req.index + 1, sid=sid)
         if req.index == 0:
             session_mgr.update_title(req.content, sid=sid)
         else:
             session_mgr._save_sessions()
 
+    llm_service.invalidate_session(sid)
     return {"ok": True}
 
 
 @app.post("/api/sessions/{sid}/messages/retry")
 def api_sessions_messages_retry(sid: str, req: MessageRetryRequest):
+    _stop_session_jobs(sid)
     with session_lock:
         session = session_mgr.get_session(sid)
         if not session:
@@ -653,14 +1177,14 @@ def api_sessions_messages_retry(sid: str, req: MessageRetryRequest):
         if history[req.index].get("role") != "assistant":
             raise HTTPException(status_code=400, detail="Only assistant messages can be retried")
 
-        session["history"] = history[: req.index]
+        session_mgr.truncate_history(req.index, sid=sid)
         session_mgr._save_sessions()
 
+    llm_service.invalidate_session(sid)
     return {"ok": True}
 
 
-@app.post("/api/chat/stream")
-def api_chat_stream(req: ChatStreamRequest):
+def _add_user_message(req: ChatStreamRequest) -> List[Dict[str, Any]]:
     with session_lock:
         session = session_mgr.get_session(req.session_id)
         if not session:
@@ -677,71 +1201,27 @@ def api_chat_stream(req: ChatStreamRequest):
         session_mgr.current_session_id = req.session_id
         session_mgr._save_sessions()
         session = session_mgr.get_session(req.session_id)
-        history = list(session.get("history", [])) if session else []
+        return list(session.get("history", [])) if session else []
+
+
+@app.post("/api/chat/stream")
+async def api_chat_stream(req: ChatStreamRequest):
+    # Database and tokenizer work runs in the threadpool; the stream itself does not.
+    history = await run_in_threadpool(_add_user_message, req)
 
     config = DEFAULT_CONFIG.copy()
     if req.config:
         config.update(req.config)
 
-    messages = _build_messages(history, config)
-    assistant_text = ""
-    assistant_attachments: List[Dict[str, Any]] = []
-
-    def event_stream():
-        nonlocal assistant_text
-        try:
-            res_queue, done_event = llm_service.generate(messages, config)
-        except Exception as exc:
-            yield _sse({"type": "error", "message": str(exc)})
-            return
-
-        try:
-            while True:
-                try:
-                    item = res_queue.get(timeout=0.1)
-                except queue.Empty:
-                    if done_event.is_set():
-                        break
-                    continue
-
-                msg_type = item.get("type")
-                if msg_type == "token":
-                    token = item.get("token", "")
-                    assistant_text += token
-                    yield _sse({"type": "token", "token": token})
-                elif msg_type == "image":
-                    raw_attachments = item.get("attachments") or []
-                    safe_attachments = _sanitize_attachments(raw_attachments)
-                    if safe_attachments:
-                        assistant_attachments.extend(safe_attachments)
-                        yield _sse({"type": "image", "attachments": safe_attachments})
-                elif msg_type == "error":
-                    yield _sse({"type": "error", "message": item.get("msg", "Error")})
-                    break
-                elif msg_type == "done":
-                    stats = item.get("stats", {})
-                    yield _sse({"type": "done", "stats": stats})
-                    break
-        finally:
-            llm_service.finish_generation()
-            if assistant_text or assistant_attachments:
-                with session_lock:
-                    session_mgr.add_message(
-                        "assistant",
-                        assistant_text,
-                        sid=req.session_id,
-                        attachments=assistant_attachments
-                    )
-
+    messages = await run_in_threadpool(_build_messages, history, config)
     return StreamingResponse(
-        event_stream(),
+        _stream_generation(messages, config, req.priority or DEFAULT_PRIORITY, req.session_id),
         media_type="text/event-stream",
         headers={"Cache-Control": "no-cache", "Connection": "keep-alive"},
     )
 
 
-@app.post("/api/chat/regenerate")
-def api_chat_regenerate(req: ChatRegenerateRequest):
+def _regenerate_history(req: ChatRegenerateRequest) -> List[Dict[str, Any]]:
     with session_lock:
         session = session_mgr.get_session(req.session_id)
         if not session:
@@ -752,72 +1232,129 @@ def api_chat_regenerate(req: ChatRegenerateRequest):
         raise HTTPException(status_code=400, detail="No messages to regenerate")
     if history[-1].get("role") != "user":
         raise HTTPException(status_code=400, detail="Last message must be a user message")
+    return history
+
+
+@app.post("/api/chat/regenerate")
+async def api_chat_regenerate(req: ChatRegenerateRequest):
+    history = await run_in_threadpool(_regenerate_history, req)
 
     config = DEFAULT_CONFIG.copy()
     if req.config:
         config.update(req.config)
 
-    messages = _build_messages(history, config)
-    assistant_text = ""
-    assistant_attachments: List[Dict[str, Any]] = []
+    messages = await run_in_threadpool(_build_messages, history, config)
+    return StreamingResponse(
+        _stream_generation(messages, config, req.priority or DEFAULT_PRIORITY, req.session_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "Connection": "keep-alive"},
+    )
 
-    def event_stream():
-        nonlocal assistant_text
-        try:
-            res_queue, done_event = llm_service.generate(messages, config)
-        except Exception as exc:
-            yield _sse({"type": "error", "message": str(exc)})
-            return
 
+def _parse_batch_items(body: bytes) -> List[Dict[str, Any]]:
+    """JSONL lines of {"id"?, "prompt" | "messages", "config"?} -> batch items."""
+    items: List[Dict[str, Any]] = []
+    for number, line in enumerate(body.decode("utf-8", errors="replace").splitlines(), start=1):
+        if not line.strip():
+            continue
         try:
-            while True:
-                try:
-                    item = res_queue.get(timeout=0.1)
-                except queue.Empty:
-                    if done_event.is_set():
-                        break
-                    continue
-
-                msg_type = item.get("type")
-                if msg_type == "token":
-                    token = item.get("token", "")
-                    assistant_text += token
-                    yield _sse({"type": "token", "token": token})
-                elif msg_type == "image":
-                    raw_attachments = item.get("attachments") or []
-                    safe_attachments = _sanitize_attachments(raw_attachments)
-                    if safe_attachments:
-                        assistant_attachments.extend(safe_attachments)
-                        yield _sse({"type": "image", "attachments": safe_attachments})
-                elif msg_type == "error":
-                    yield _sse({"type": "error", "message": item.get("msg", "Error")})
-                    break
-                elif msg_type == "done":
-                    stats = item.get("stats", {})
-                    yield _sse({"type": "done", "stats": stats})
-                    break
-        finally:
-            llm_service.finish_generation()
-            if assistant_text or assistant_attachments:
-                with session_lock:
-                    session_mgr.add_message(
-                        "assistant",
-                        assistant_text,
-                        sid=req.session_id,
-                        attachments=assistant_attachments
-                    )
+            entry = json.loads(line)
+        except ValueError as exc:
+            raise HTTPException(status_code=400, detail=f"Line {number}: invalid JSON ({exc})")
+        if not isinstance(entry, dict):
+            raise HTTPException(status_code=400, detail=f"Line {number}: expected an object")
+        config = entry.get("config") or {}
+        messages = entry.get("messages")
+        if messages is None and isinstance(entry.get("prompt"), str):
+            messages = [{"role": "user", "content": entry["prompt"]}]
+        if not isinstance(messages, list) or not messages or not isinstance(config, dict):
+            raise HTTPException(status_code=400, detail=f"Line {number}: needs a prompt or messages")
+        sys_prompt = config.get("system_prompt")
+        if sys_prompt and messages[0].get("role") != "system":
+            messages = [{"role": "system", "content": sys_prompt}] + messages
+        items.append({"id": entry.get("id", number), "messages": messages, "config": config})
+    if not items:
+        raise HTTPException(status_code=400, detail="No prompts")
+    return items
+
+
+async def _stream_batch(job):
+    """NDJSON lines: one per finished item (in completion order), then a summary."""
+    loop = asyncio.get_running_loop()
+    events: "asyncio.Queue[Dict[str, Any]]" = asyncio.Queue()
+
+    def listener(event: Dict[str, Any]) -> None:
+        loop.call_soon_threadsafe(events.put_nowait, event)
+
+    job.subscribe(listener)
+    try:
+        while True:
+            item = await events.get()
+            msg_type = item.get("type")
+            if msg_type == "item":
+                line = {k: v for k, v in item.items() if k != "seq"}
+            elif msg_type == "done":
+                line = {"type": "summary", "job_id": job.id, **(item.get("stats") or {})}
+            elif msg_type == "error":
+                line = {"type": "error", "message": item.get("msg", "Error")}
+            else:
+                continue
+            yield json.dumps(line, ensure_ascii=False) + "\n"
+            if msg_type in ("done", "error"):
+                break
+    finally:
+        job.unsubscribe(listener)
+        # Batch results are only delivered on this stream.
+        if not job.done.is_set():
+            llm_service.cancel(job.id)
+
 
+@app.post("/api/batch")
+async def api_batch(request: Request, priority: str = "background", model_path: Optional[str] = None):
+    """Offline generation for a JSONL body of prompts; sessions are not touched."""
+    items = _parse_batch_items(await request.body())
+    try:
+        job = llm_service.generate_batch(items, priority=priority, model_path=model_path)
+    except RuntimeError as exc:
+        raise HTTPException(status_code=409, detail=str(exc))
+    return StreamingResponse(_stream_batch(job), media_type="application/x-ndjson")
+
+
+@app.get("/api/jobs")
+def api_jobs(session_id: Optional[str] = None):
+    return {"jobs": llm_service.list_jobs(session_id)}
+
+
+@app.get("/api/jobs/{job_id}/stream")
+async def api_jobs_stream(
+    job_id: str,
+    last_event_id: Optional[int] = Query(None),
+    last_event_header: Optional[str] = Header(None, alias="Last-Event-ID"),
+):
+    """Reattach to a running or recently finished job, replaying events after Last-Event-ID."""
+    job = llm_service.get_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    after = last_event_id
+    if after is None and last_event_header:
+        try:
+            after = int(last_event_header)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid Last-Event-ID")
+    with recorders_lock:
+        recorder = _recorders.get(job_id)
     return StreamingResponse(
-        event_stream(),
+        _follow_job(job, after=max(0, after or 0), recorder=recorder),
         media_type="text/event-stream",
         headers={"Cache-Control": "no-cache", "Connection": "keep-alive"},
     )
 
 
 @app.post("/api/chat/stop")
-def api_chat_stop():
-    llm_service.stop()
-    return {"ok": True}
+def api_chat_stop(req: Optional[ChatStopRequest] = None):
+    job_id = req.job_id if req else None
+    stopped = llm_service.stop(job_id)
+    return {"ok": True, "stopped": stopped}
 
 
 @app.post("/api/download/stream")
@@ -854,16 +1391,23 @@ def api_status():
         "app": get_process_memory(os.getpid()),
         "download": download_service.get_status(),
         "model": llm_service.get_status(),
+        "scheduler": llm_service.get_scheduler_stats(),
+        "supervisor": llm_service.get_supervisor_stats(),
+        "response_cache": llm_service.get_cache_stats(),
+        "session_cache": session_mgr.cache_stats(),
     }
 
 
+@app.get("/api/perf/recent")
+def api_perf_recent(limit: Optional[int] = Query(default=None, ge=1, le=1000)):
+    return {"items": llm_service.get_recent_perf(limit)}
+
+
 @app.post("/api/app/exit")
 def api_app_exit():
     def _shutdown():
         try:
-            llm_service.shutdown()
-            download_service.stop()
-            npu_monitor.stop()
+            on_shutdown()
         finally:
             time.sleep(0.2)
             os._exit(0)
@@ -937,8 +1481,15 @@ class NoCacheStaticFiles(StaticFiles):
 app.mount("/static", NoCacheStaticFiles(directory=FRONTEND_DIR), name="static")
 
 
+@app.on_event("startup")
+def on_startup():
+    # Blobs left unreferenced by the previous run (uploads never sent, images never saved).
+    threading.Thread(target=session_mgr.collect_blobs, kwargs={"sweep": True}, daemon=True).start()
+
+
 @app.on_event("shutdown")
 def on_shutdown():
     llm_service.shutdown()
     download_service.stop()
     npu_monitor.stop()
+    session_mgr.close()
@@ -1,13 +1,36 @@
+import heapq
+import itertools
 import multiprocessing
 import queue
 import threading
 import time
+import uuid
+from collections import OrderedDict, deque
 from pathlib import Path
-from typing import Dict, Optional, Tuple
+from typing import Any, Callable, Dict, List, Optional, Tuple
 
+from app.core.blob_store import BlobStore
 from app.core.llm_process import llm_process_entry
-from app.config import LOGS_DIR
-from backend.system_status import get_process_memory
+from app.core.response_cache import ResponseCache
+from app.config import (
+    BLOBS_DIR,
+    BLOB_FALLBACK_DIRS,
+    IPC_TRANSPORT,
+    JOB_RETENTION_S,
+    LOGS_DIR,
+    MODEL_GENERATION_TIMEOUT_S,
+    MODEL_HEARTBEAT_S,
+    MODEL_HEARTBEAT_TIMEOUT_S,
+    MODEL_MAX_RESTARTS,
+    MODEL_POOL_MIN_FREE_MB,
+    MODEL_POOL_RAM_MB,
+    MODEL_POOL_SIZE,
+    RESPONSE_CACHE_DIR,
+    RESPONSE_CACHE_DISK_MB,
+    RESPONSE_CACHE_MB,
+)
+from app.utils.model_type import detect_model_kind
+from backend.system_status import get_memory_status, get_process_memory
 
 _LOG_PATH = Path(LOGS_DIR) / "backend.log"
 
@@ -21,163 +44,845 @@ def _log(msg: str) -> None:
         pass
 
 
+PRIORITIES = {"interactive": 0, "background": 1}
+DEFAULT_PRIORITY = "interactive"
+_WAIT_SAMPLES = 200
+_PERF_SAMPLES = 100
+_FINISHED_JOBS = 64
+_RESTART_WINDOW_S = 300
+# A worker's sender thread exits after this long without commands.
+_SENDER_IDLE_S = 5.0
+_MIB = 1024 * 1024
+
+WorkerKey = Tuple[str, str, str]
+
+
+def _worker_key(model_dir: str, device: str) -> WorkerKey:
+    path = Path(model_dir)
+    try:
+        resolved = str(path.resolve())
+    except Exception:
+        resolved = str(path)
+    return (resolved, (device or "AUTO").upper(), detect_model_kind(path))
+
+
+def _estimate_model_bytes(model_dir: str) -> int:
+    """Rough resident size of a model: its OpenVINO weight files."""
+    total = 0
+    try:
+        for item in Path(model_dir).rglob("*.bin"):
+            try:
+                total += item.stat().st_size
+            except OSError:
+                continue
+    except Exception:
+        return 0
+    return total
+
+
+class GenerationJob:
+    def __init__(self, messages, config, priority: str = DEFAULT_PRIORITY,
+                 session_id: Optional[str] = None, worker_key: Optional[WorkerKey] = None,
+                 kind: str = "chat") -> None:
+        self.id = uuid.uuid4().hex
+        # "chat": ``messages`` is one conversation; "batch": a list of
+        # {"id", "messages", "config"} items generated offline.
+        self.kind = kind
+        self.messages = messages
+        self.config = config
+        self.priority = priority if priority in PRIORITIES else DEFAULT_PRIORITY
+        self.session_id = session_id
+        self.worker_key = worker_key
+        # Every event, numbered from 1, so a client can reattach and replay.
+        self.events: List[Dict[str, Any]] = []
+        self.done = threading.Event()
+        self.state = "queued"
+        self.position = 0
+        self.submitted_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.last_event_at = self.submitted_at
+        # Set for deterministic requests; the result is stored under it.
+        self.cache_key: Optional[str] = None
+        self.cancel_requested = False
+        self._listeners: List[Callable[[Dict[str, Any]], None]] = []
+        self._events_lock = threading.Lock()
+
+    @property
+    def wait_time(self) -> float:
+        end = self.started_at or self.finished_at or time.time()
+        return max(0.0, end - self.submitted_at)
+
+    def _deliver(self, event: Dict[str, Any]) -> None:
+        event = dict(event, seq=len(self.events) + 1)
+        self.events.append(event)
+        for listener in self._listeners:
+            listener(event)
+
+    def subscribe(self, listener: Callable[[Dict[str, Any]], None], after: int = 0) -> None:
+        """Replay events with a ``seq`` above ``after`` to ``listener``, then push new ones to it."""
+        with self._events_lock:
+            for event in self.events[max(0, after):]:
+                listener(event)
+            if not self.done.is_set():
+                self._listeners.append(listener)
+
+    def unsubscribe(self, listener: Callable[[Dict[str, Any]], None]) -> None:
+        with self._events_lock:
+            if listener in self._listeners:
+                self._listeners.remove(listener)
+
+    def emit(self, event: Dict[str, Any]) -> None:
+        with self._events_lock:
+            if not self.done.is_set():
+                self.last_event_at = time.time()
+                self._deliver(event)
+
+    def finish(self, event: Dict[str, Any], state: str) -> None:
+        with self._events_lock:
+            if self.done.is_set():
+                return
+            self._deliver(event)
+            self.state = state
+            self.finished_at = time.time()
+            self.done.set()
+            self._listeners = []
+
+
+class ModelWorker:
+    """A model process with its own channels, load state and running jobs."""
+
+    def __init__(self, key: WorkerKey, cmd_queue, res_queue, stop_event) -> None:
+        self.key = key
+        self.cmd_queue = cmd_queue
+        self.res_queue = res_queue
+        self.stop_event = stop_event
+        self.process = None
+        self.monitor_thread = None
+
+        # Commands are put on cmd_queue by a sender thread, so code holding
+        # the service lock never waits on a full channel or a stalled process.
+        self.outbox: "queue.Queue" = queue.Queue()
+        self.outbox_lock = threading.Lock()
+        self.sender_thread: Optional[threading.Thread] = None
+
+        self.load_event = threading.Event()
+        self.load_result: Optional[Dict[str, object]] = None
+        self.load_options: Optional[Dict[str, Any]] = None
+        self.loading = False
+        self.load_stage = ""
+        self.load_message = ""
+        self.load_started_at: Optional[float] = None
+
+        self.loaded = False
+        self.path: Optional[str] = None
+        self.device: Optional[str] = None
+        self.kind: Optional[str] = None
+        self.serving_mode = False
+        self.max_running = 1
+        self.draft_path: Optional[str] = None
+        self.warmup: Dict[str, Any] = {}
+        self.running: Dict[str, GenerationJob] = {}
+        self.last_used = time.time()
+
+        self.last_heartbeat = self.last_used
+        self.ping_sent_at: Optional[float] = None
+        self.restarts = 0
+        self.restart_times: List[float] = []
+
+    @property
+    def alive(self) -> bool:
+        return self.process is not None and self.process.is_alive()
+
+    @property
+    def pid(self) -> Optional[int]:
+        return self.process.pid if self.alive else None
+
+    @property
+    def ready(self) -> bool:
+        return self.loaded and not self.loading and self.alive
+
+    def rss(self) -> int:
+        pid = self.pid
+        return int(get_process_memory(pid).get("rss") or 0) if pid else 0
+
+
 class LLMService:
     def __init__(self) -> None:
         self._ctx = multiprocessing.get_context("spawn")
-        self._cmd_queue = self._ctx.Queue()
-        self._res_queue = self._ctx.Queue()
-        self._stop_event = self._ctx.Event()
+        self._lock = threading.Lock()
 
-        self._process = None
-        self._monitor_thread = None
+        # Pool of model processes in least-recently-used order; the active
+        # worker is the model selected in the UI and the default route.
+        self._workers: "OrderedDict[WorkerKey, ModelWorker]" = OrderedDict()
+        self._active: Optional[ModelWorker] = None
+        self._pool_hits = 0
+        self._pool_loads = 0
+        self._pool_evictions = 0
 
-        self._lock = threading.Lock()
-        self._load_event = threading.Event()
-        self._load_result: Optional[Dict[str, object]] = None
-        self._loading = False
-        self._load_stage = ""
-        self._load_message = ""
-        self._load_started_at: Optional[float] = None
-
-        self._active_generation = False
-        self._generation_queue: Optional[queue.Queue] = None
-        self._generation_done = threading.Event()
-
-        self._model_loaded = False
-        self._model_path: Optional[str] = None
-        self._device: Optional[str] = None
-        self._model_kind: Optional[str] = None
-
-    def _start_process_if_needed(self) -> None:
-        if self._process is None or not self._process.is_alive():
-            _log("Spawning model process")
-            self._process = self._ctx.Process(
+        self._jobs: Dict[str, GenerationJob] = {}
+        # Recently finished jobs, oldest first, kept for reattaching clients.
+        self._finished: "OrderedDict[str, GenerationJob]" = OrderedDict()
+        self._pending: List[Tuple[int, int, GenerationJob]] = []
+        self._job_seq = itertools.count()
+        self._running: Dict[str, GenerationJob] = {}
+        self._jobs_submitted = 0
+        self._jobs_completed = 0
+        self._jobs_cancelled = 0
+        self._wait_times: deque = deque(maxlen=_WAIT_SAMPLES)
+        self._perf_recent: deque = deque(maxlen=_PERF_SAMPLES)
+        self._response_cache = ResponseCache(
+            RESPONSE_CACHE_DIR, RESPONSE_CACHE_MB * _MIB, RESPONSE_CACHE_DISK_MB * _MIB
+        )
+        self._blobs = BlobStore(BLOBS_DIR, BLOB_FALLBACK_DIRS)
+
+        # Supervisor: restarts model processes that die or hang.
+        self._restarts = 0
+        self._recovering = 0
+        self._last_failure: Dict[str, Any] = {}
+        self._last_recovery_s: Optional[float] = None
+        self._supervisor_stop = threading.Event()
+        self._supervisor = threading.Thread(target=self._supervise, daemon=True)
+        self._supervisor.start()
+
+    def _create_channel(self):
+        if IPC_TRANSPORT == "shm":
+            try:
+                from app.core.shm_transport import ShmQueue
+                return ShmQueue(self._ctx)
+            except Exception as exc:
+                _log(f"Shared-memory transport unavailable, using queue: {exc}")
+        return self._ctx.Queue()
+
+    def _create_worker(self, key: WorkerKey) -> ModelWorker:
+        return ModelWorker(key, self._create_channel(), self._create_channel(), self._ctx.Event())
+
+    def _start_process_if_needed(self, worker: ModelWorker) -> None:
+        if not worker.alive:
+            _log(f"Spawning model process for {worker.key[0]} ({worker.key[1]})")
+            worker.loaded = False
+            worker.process = self._ctx.Process(
                 target=llm_process_entry,
-                args=(self._cmd_queue, self._res_queue, self._stop_event),
+                args=(worker.cmd_queue, worker.res_queue, worker.stop_event),
                 daemon=True,
             )
-            self._process.start()
-            _log(f"Model process started pid={self._process.pid}")
-            self._monitor_thread = threading.Thread(target=self._monitor_loop, daemon=True)
-            self._monitor_thread.start()
+            worker.process.start()
+            watch = getattr(worker.cmd_queue, "watch", None)
+            if watch is not None:
+                watch(worker.process.is_alive)
+            _log(f"Model process started pid={worker.process.pid}")
+            worker.monitor_thread = threading.Thread(target=self._monitor_loop, args=(worker,), daemon=True)
+            worker.monitor_thread.start()
+
+    def _send(self, worker: ModelWorker, msg: Dict[str, Any]) -> None:
+        """Queue a command for the worker's process. Never blocks, so the lock may be held."""
+        with worker.outbox_lock:
+            worker.outbox.put(msg)
+            if worker.sender_thread is None:
+                worker.sender_thread = threading.Thread(target=self._sender_loop, args=(worker,), daemon=True)
+                worker.sender_thread.start()
+
+    def _sender_loop(self, worker: ModelWorker) -> None:
+        while True:
+            try:
+                msg = worker.outbox.get(timeout=_SENDER_IDLE_S)
+            except queue.Empty:
+                with worker.outbox_lock:
+                    if worker.outbox.empty():
+                        worker.sender_thread = None
+                        return
+                continue
+            channel = worker.cmd_queue
+            while True:
+                try:
+                    channel.put(msg, timeout=1.0)
+                    break
+                except queue.Full:
+                    # A busy process catches up; a hung one is restarted by the
+                    # supervisor, which replaces or closes this channel.
+                    if channel is worker.cmd_queue and worker.alive:
+                        continue
+                except (BrokenPipeError, EOFError, OSError, ValueError):
+                    pass
+                _log(f"Dropping {msg.get('type') if msg else 'stop'} command for stopped model process")
+                break
+
+    def _stop_worker(self, worker: ModelWorker) -> None:
+        """Terminate a worker's process and release its channels. Lock not held."""
+        # Commands still queued were meant for this process, not a respawned one.
+        while True:
+            try:
+                worker.outbox.get_nowait()
+            except queue.Empty:
+                break
+        process = worker.process
+        if process is not None:
+            try:
+                if process.is_alive():
+                    worker.cmd_queue.put(None, timeout=1.0)
+                    process.join(timeout=1)
+            except Exception:
+                pass
+            finally:
+                if process.is_alive():
+                    process.terminate()
+                    process.join(timeout=1)
+        worker.process = None
+        worker.loaded = False
+        for channel in (worker.cmd_queue, worker.res_queue):
+            close = getattr(channel, "close", None)
+            if close is None:
+                continue
+            try:
+                if IPC_TRANSPORT != "shm" and channel is worker.res_queue:
+                    # Wake the monitor thread parked on the queue.
+                    channel.put(None)
+                close()
+            except Exception:
+                pass
 
-    def _monitor_loop(self) -> None:
+    def _monitor_loop(self, worker: ModelWorker) -> None:
+        # Bound once: a respawned process gets fresh channels and its own monitor.
+        res_queue = worker.res_queue
         while True:
             try:
-                msg = self._res_queue.get()
-            except (EOFError, BrokenPipeError):
+                msg = res_queue.get()
+            except (EOFError, BrokenPipeError, OSError, ValueError):
                 break
             except Exception:
                 continue
+            if msg is None:
+                break
 
             msg_type = msg.get("type")
+            worker.last_heartbeat = time.time()
+
+            if msg_type == "pong":
+                worker.ping_sent_at = None
+                continue
 
             if msg_type == "loaded":
-                _log("Load complete")
+                _log(f"Load complete path={worker.key[0]}")
                 with self._lock:
-                    self._device = msg.get("dev")
-                    self._model_kind = msg.get("kind") or self._model_kind
-                    self._load_result = {"ok": True, "dev": self._device or "AUTO"}
-                    self._loading = False
-                    self._load_stage = "ready"
-                    self._load_message = ""
-                    self._load_event.set()
+                    worker.device = msg.get("dev")
+                    worker.kind = msg.get("kind") or worker.kind
+                    worker.serving_mode = bool(msg.get("serving"))
+                    worker.max_running = max(1, int(msg.get("concurrency") or 1))
+                    worker.draft_path = msg.get("draft")
+                    worker.load_result = {"ok": True, "dev": worker.device or "AUTO"}
+                    worker.loading = False
+                    worker.load_stage = "ready"
+                    worker.load_message = ""
+                    worker.load_event.set()
                 continue
 
             if msg_type == "load_stage":
                 _log(f"Load stage: {msg.get('stage')} msg={msg.get('message')}")
                 with self._lock:
-                    self._loading = True
-                    self._load_stage = msg.get("stage", "") or ""
-                    self._load_message = msg.get("message", "") or ""
+                    # Warm-up runs after "loaded"; the worker already accepts jobs.
+                    if msg.get("stage") != "warmup":
+                        worker.loading = True
+                    worker.load_stage = msg.get("stage", "") or ""
+                    worker.load_message = msg.get("message", "") or ""
                 continue
 
-            if msg_type == "token":
-                if self._generation_queue is not None:
-                    self._generation_queue.put({"type": "token", "token": msg.get("token", "")})
+            if msg_type == "warmup":
+                _log(f"Warm-up finished path={worker.key[0]} stats={msg.get('stats')}")
+                with self._lock:
+                    worker.warmup = msg.get("stats") or {}
+                    if worker.load_stage == "warmup":
+                        worker.load_stage = "ready"
+                        worker.load_message = ""
                 continue
 
-            if msg_type == "image":
-                if self._generation_queue is not None:
-                    self._generation_queue.put({"type": "image", "attachments": msg.get("attachments") or []})
-                continue
+            if msg_type in ("token", "image", "batch_item", "finished", "error"):
+                cache_entry = None
+                with self._lock:
+                    job = self._job_for_message(worker, msg)
+                    if job is None and msg_type == "error" and worker.loading:
+                        _log(f"Load error: {msg.get('msg')}")
+                        worker.load_result = {"ok": False, "error": msg.get("msg", "Unknown error")}
+                        worker.loading = False
+                        worker.load_stage = "error"
+                        worker.load_message = msg.get("msg", "Unknown error")
+                        worker.load_event.set()
+                        continue
+                    if job is None:
+                        continue
+                    if msg_type == "token":
+                        job.emit({"type": "token", "token": msg.get("token", "")})
+                    elif msg_type == "image":
+                        job.emit({"type": "image", "attachments": msg.get("attachments") or []})
+                    elif msg_type == "batch_item":
+                        item = {k: v for k, v in msg.items() if k not in ("type", "job_id")}
+                        job.emit({"type": "item", **item})
+                    elif msg_type == "finished":
+                        stats = dict(msg.get("stats") or {})
+                        stats["queue_wait_ms"] = round(job.wait_time * 1000, 1)
+                        if job.cancel_requested:
+                            # A cancelled running job still ends with a normal "finished".
+                            stats["cancelled"] = True
+                        if job.cache_key:
+                            stats["response_cache"] = "miss"
+                            if not job.cancel_requested:
+                                cache_entry = self._cache_entry(job, stats)
+                        self._record_perf(worker, job, stats)
+                        job.finish({"type": "done", "stats": stats}, "cancelled" if job.cancel_requested else "done")
+                        self._complete_job(job)
+                    else:
+                        job.finish({"type": "error", "msg": msg.get("msg", "Unknown error")}, "error")
+                        self._complete_job(job)
+                if cache_entry is not None:
+                    self._response_cache.put(job.cache_key, cache_entry)
+
+    @staticmethod
+    def _cache_entry(job: GenerationJob, stats: Dict[str, Any]) -> Dict[str, Any]:
+        events = []
+        for event in job.events:
+            if event.get("type") == "token":
+                events.append({"type": "token", "token": event.get("token", "")})
+            elif event.get("type") == "image":
+                events.append({"type": "image", "attachments": event.get("attachments") or []})
+        cached_stats = {k: v for k, v in stats.items() if k not in ("queue_wait_ms", "response_cache")}
+        return {"events": events, "stats": cached_stats, "created_at": time.time()}
 
-            if msg_type == "finished":
-                if self._generation_queue is not None:
-                    stats = msg.get("stats", {})
-                    self._generation_queue.put({"type": "done", "stats": stats})
-                    self._generation_done.set()
+    def _entry_blobs_present(self, entry: Dict[str, Any]) -> bool:
+        """Cached images refer to blobs; a session delete may have collected them since."""
+        for event in entry.get("events") or []:
+            for att in event.get("attachments") or []:
+                for digest in (att.get("blob"), att.get("thumb")):
+                    if digest and self._blobs.path(digest) is None:
+                        return False
+        return True
+
+    def _replay(self, job: GenerationJob, entry: Dict[str, Any]) -> GenerationJob:
+        """Finish ``job`` from a cached result without touching a model process."""
+        start = time.perf_counter()
+        with self._lock:
+            self._jobs_submitted += 1
+            self._jobs_completed += 1
+            job.state = "running"
+            job.started_at = time.time()
+            job.emit({"type": "job", "job_id": job.id, "priority": job.priority})
+            job.emit({"type": "started", "job_id": job.id, "wait": 0.0})
+            for event in entry.get("events") or []:
+                job.emit(dict(event))
+            stats = dict(entry.get("stats") or {})
+            stats.update({
+                "response_cache": "hit",
+                "queue_wait_ms": 0.0,
+                "replay_ms": round((time.perf_counter() - start) * 1000, 2),
+            })
+            job.finish({"type": "done", "stats": stats}, "done")
+            self._retain_finished(job)
+        return job
+
+    def get_cache_stats(self) -> Dict[str, Any]:
+        return self._response_cache.stats()
+
+    def _job_for_message(self, worker: ModelWorker, msg: Dict[str, Any]) -> Optional[GenerationJob]:
+        job_id = msg.get("job_id")
+        if job_id:
+            job = worker.running.get(job_id)
+            if job is None or job.done.is_set():
+                return None
+            return job
+        if len(worker.running) == 1:
+            job = next(iter(worker.running.values()))
+            if not job.done.is_set():
+                return job
+        return None
+
+    def _record_perf(self, worker: ModelWorker, job: GenerationJob, stats: Dict[str, Any]) -> None:
+        """Keep the latency stats of finished jobs for /api/perf/recent. Lock held."""
+        self._perf_recent.append({
+            "job_id": job.id,
+            "finished_at": time.time(),
+            "path": worker.path or worker.key[0],
+            "device": worker.device or worker.key[1],
+            "priority": job.priority,
+            "stats": stats,
+        })
+
+    def _complete_job(self, job: GenerationJob) -> None:
+        """Called with the lock held once a job reached a final state."""
+        self._running.pop(job.id, None)
+        self._jobs.pop(job.id, None)
+        self._retain_finished(job)
+        worker = self._workers.get(job.worker_key)
+        if worker is not None:
+            worker.running.pop(job.id, None)
+            worker.last_used = time.time()
+        if job.state == "cancelled":
+            self._jobs_cancelled += 1
+        else:
+            self._jobs_completed += 1
+        self._dispatch()
+
+    def _retain_finished(self, job: Optional[GenerationJob] = None) -> None:
+        """Keep ``job`` for reattaching clients and expire old ones. Lock held."""
+        if job is not None and JOB_RETENTION_S > 0:
+            self._finished[job.id] = job
+        cutoff = time.time() - JOB_RETENTION_S
+        while self._finished:
+            oldest = next(iter(self._finished.values()))
+            if len(self._finished) <= _FINISHED_JOBS and (oldest.finished_at or 0) >= cutoff:
+                break
+            self._finished.popitem(last=False)
+
+    def _dispatch(self) -> None:
+        """Start queued jobs on workers with free slots. Lock held."""
+        waiting = []
+        while self._pending:
+            item = heapq.heappop(self._pending)
+            job = item[2]
+            if job.done.is_set():
+                continue
+            worker = self._workers.get(job.worker_key)
+            if worker is None:
+                job.finish({"type": "error", "msg": "Model was unloaded"}, "error")
+                self._jobs.pop(job.id, None)
+                self._retain_finished(job)
                 continue
+            if not worker.ready or len(worker.running) >= worker.max_running:
+                waiting.append(item)
+                continue
+            job.state = "running"
+            job.started_at = time.time()
+            job.position = 0
+            self._wait_times.append(job.wait_time)
+            self._running[job.id] = job
+            worker.running[job.id] = job
+            worker.last_used = job.started_at
+            if job.kind == "batch":
+                self._send(worker, {"type": "batch", "job_id": job.id, "items": job.messages})
+            else:
+                self._send(worker, {
+                    "type": "generate",
+                    "job_id": job.id,
+                    "session_id": job.session_id,
+                    "messages": job.messages,
+                    "config": job.config,
+                })
+            job.emit({"type": "started", "job_id": job.id, "wait": round(job.wait_time, 3)})
+        for item in waiting:
+            heapq.heappush(self._pending, item)
+        self._publish_positions()
 
-            if msg_type == "error":
-                if self._generation_queue is not None:
-                    self._generation_queue.put({"type": "error", "msg": msg.get("msg", "Unknown error")})
-                    self._generation_done.set()
-                else:
-                    _log(f"Load error: {msg.get('msg')}")
-                    with self._lock:
-                        self._load_result = {"ok": False, "error": msg.get("msg", "Unknown error")}
-                        self._loading = False
-                        self._load_stage = "error"
-                        self._load_message = msg.get("msg", "Unknown error")
-                        self._load_event.set()
+    def _publish_positions(self) -> None:
+        waiting = sorted(item for item in self._pending if not item[2].done.is_set())
+        for index, (_, _, job) in enumerate(waiting, start=1):
+            position = index
+            if job.position != position:
+                job.position = position
+                job.emit({"type": "queued", "job_id": job.id, "position": position})
+
+    def _worker_busy(self, worker: ModelWorker) -> bool:
+        if worker.running:
+            return True
+        return any(item[2].worker_key == worker.key and not item[2].done.is_set() for item in self._pending)
+
+    # -- pool ----------------------------------------------------------------
+
+    def _ram_budget(self, memory: Dict[str, int]) -> int:
+        if MODEL_POOL_RAM_MB > 0:
+            return MODEL_POOL_RAM_MB * _MIB
+        return int(memory.get("total", 0) * 0.6)
+
+    def _over_budget(self, extra: int = 0) -> bool:
+        memory = get_memory_status()
+        budget = self._ram_budget(memory)
+        if budget and sum(w.rss() for w in self._workers.values()) + extra > budget:
+            return True
+        if memory.get("total") and memory.get("available", 0) - extra < MODEL_POOL_MIN_FREE_MB * _MIB:
+            return True
+        return False
+
+    def _evict_for(self, keep: Optional[ModelWorker], extra: int = 0, reserve_slot: bool = False) -> List[ModelWorker]:
+        """Drop idle workers in LRU order until the pool fits. Lock held; returns the evicted."""
+        evicted = []
+        while True:
+            limit = MODEL_POOL_SIZE - (1 if reserve_slot else 0)
+            if len(self._workers) <= limit and not self._over_budget(extra):
+                break
+            victim = next(
+                (w for w in self._workers.values() if w is not keep and not self._worker_busy(w)),
+                None,
+            )
+            if victim is None:
+                break
+            self._workers.pop(victim.key, None)
+            if self._active is victim:
+                self._active = None
+            self._pool_evictions += 1
+            _log(f"Evicting model process path={victim.key[0]} device={victim.key[1]}")
+            evicted.append(victim)
+        return evicted
 
     def load_model(
-        self, source: str, model_id: str, model_dir: str, device: str, max_prompt_len: int = 16384
+        self, source: str, model_id: str, model_dir: str, device: str, max_prompt_len: int = 16384,
+        serving: Optional[Dict[str, Any]] = None, draft: Optional[Dict[str, Any]] = None,
+        warmup: Optional[bool] = None, prompt_lookup: bool = False,
     ) -> Tuple[str, str, str]:
+        key = _worker_key(model_dir, device)
+        options = {
+            "args": (source, model_id, model_dir, device, max_prompt_len),
+            "serving": serving,
+            "draft": draft,
+            "prompt_lookup": bool(prompt_lookup),
+        }
+        evicted: List[ModelWorker] = []
         with self._lock:
-            if self._active_generation:
+            worker = self._workers.get(key)
+            if worker is not None and worker.ready and worker.load_options == options:
+                self._workers.move_to_end(key)
+                worker.last_used = time.time()
+                self._active = worker
+                self._pool_hits += 1
+                _log(f"Model pool hit path={model_dir} device={device}")
+                self._dispatch()
+                return (worker.path or "", worker.device or "AUTO", worker.kind or "llm")
+            if worker is not None and (worker.loading or self._worker_busy(worker)):
                 raise RuntimeError("Generation in progress")
 
-            self._start_process_if_needed()
-            self._load_event.clear()
-            self._load_result = None
-            self._model_path = model_dir
-            self._loading = True
-            self._load_stage = "start"
-            self._load_message = ""
-            self._load_started_at = time.time()
+            previous = self._active
+            if worker is None:
+                evicted = self._evict_for(None, _estimate_model_bytes(model_dir), reserve_slot=True)
+                # Reuse an evicted process instead of spawning a new one; the
+                # runtime unloads its old model before building the new one.
+                recycled = next((w for w in evicted if w.alive), None)
+                if recycled is not None:
+                    evicted.remove(recycled)
+                    recycled.key = key
+                    worker = recycled
+                else:
+                    worker = self._create_worker(key)
+                self._workers[key] = worker
+            self._workers.move_to_end(key)
+            self._active = worker
+
+            worker.path = model_dir
+            worker.kind = key[2]
+            self._pool_loads += 1
 
             _log(f"Load request path={model_dir} device={device} source={source}")
-            self._cmd_queue.put(
-                {"type": "load", "args": (source, model_id, model_dir, device, max_prompt_len)}
-            )
+            self._begin_load(worker, options, warmup)
+
+        for victim in evicted:
+            self._stop_worker(victim)
 
+        if not self._await_load(worker):
+            error_msg = "Model load failed"
+            if worker.load_result and worker.load_result.get("error"):
+                error_msg = worker.load_result["error"]
+            with self._lock:
+                if self._workers.get(key) is worker:
+                    self._workers.pop(key)
+                # Keep the previous model selected if it is still warm.
+                if self._active is worker:
+                    self._active = previous if previous is not None and previous.key in self._workers else None
+            self._stop_worker(worker)
+            raise RuntimeError(error_msg)
+
+        with self._lock:
+            worker.loaded = True
+            evicted = self._evict_for(worker)
+            self._dispatch()
+            result = (worker.path or "", worker.device or "AUTO", worker.kind or "llm")
+        for victim in evicted:
+            self._stop_worker(victim)
+        return result
+
+    def _begin_load(self, worker: ModelWorker, options: Dict[str, Any], warmup: Optional[bool] = None) -> None:
+        """Spawn the worker's process if needed and send it a load command. Lock held."""
+        self._start_process_if_needed(worker)
+        worker.load_event.clear()
+        worker.load_result = None
+        worker.load_options = options
+        worker.loaded = False
+        worker.loading = True
+        worker.load_stage = "start"
+        worker.load_message = ""
+        worker.warmup = {}
+        worker.load_started_at = time.time()
+        worker.last_used = worker.load_started_at
+        self._send(worker, {
+            "type": "load",
+            "args": options["args"],
+            "options": {
+                "serving": options.get("serving"),
+                "draft": options.get("draft"),
+                "prompt_lookup": options.get("prompt_lookup"),
+                "warmup": warmup,
+            },
+        })
+
+    def _await_load(self, worker: ModelWorker) -> bool:
+        """Wait for the load started by ``_begin_load``. Lock not held."""
         while True:
-            if self._load_event.wait(timeout=0.5):
+            if worker.load_event.wait(timeout=0.5):
                 break
-            if self._process is not None and not self._process.is_alive():
+            if not worker.alive:
                 _log("Model process exited during load")
                 with self._lock:
-                    self._load_result = {"ok": False, "error": "Model process exited"}
-                    self._loading = False
-                    self._load_stage = "error"
-                    self._load_message = "Model process exited"
-                    self._load_event.set()
+                    worker.load_result = {"ok": False, "error": "Model process exited"}
+                    worker.loading = False
+                    worker.load_stage = "error"
+                    worker.load_message = "Model process exited"
+                    worker.load_event.set()
                 break
+        return bool(worker.load_result and worker.load_result.get("ok"))
 
-        if not self._load_result or not self._load_result.get("ok"):
-            error_msg = "Model load failed"
-            if self._load_result and self._load_result.get("error"):
-                error_msg = self._load_result["error"]
-            raise RuntimeError(error_msg)
+    # -- supervisor ----------------------------------------------------------
 
-        self._model_loaded = True
-        return (self._model_path or "", self._device or "AUTO", self._model_kind or "llm")
+    def _supervise(self) -> None:
+        while not self._supervisor_stop.wait(1.0):
+            now = time.time()
+            failures = []
+            with self._lock:
+                for worker in list(self._workers.values()):
+                    if worker.loading or worker.process is None:
+                        continue
+                    if not worker.process.is_alive():
+                        failures.append((worker, f"Model process exited (code {worker.process.exitcode})"))
+                        continue
+                    if MODEL_GENERATION_TIMEOUT_S > 0 and any(
+                        now - job.last_event_at > MODEL_GENERATION_TIMEOUT_S for job in worker.running.values()
+                    ):
+                        failures.append((worker, f"Generation produced no output for {MODEL_GENERATION_TIMEOUT_S}s"))
+                        continue
+                    if MODEL_HEARTBEAT_S <= 0 or worker.running or worker.load_stage == "warmup":
+                        worker.ping_sent_at = None
+                        continue
+                    if worker.ping_sent_at is not None:
+                        if now - worker.ping_sent_at > MODEL_HEARTBEAT_TIMEOUT_S:
+                            failures.append((worker, "Model process stopped answering heartbeats"))
+                    elif now - worker.last_heartbeat >= MODEL_HEARTBEAT_S:
+                        worker.ping_sent_at = now
+                        self._send(worker, {"type": "ping"})
+            for worker, reason in failures:
+                threading.Thread(target=self._recover_worker, args=(worker, reason), daemon=True).start()
+
+    def _recover_worker(self, worker: ModelWorker, reason: str) -> None:
+        """Fail a dead or hung worker's running jobs, respawn its process and reload its model."""
+        failed_at = time.time()
+        with self._lock:
+            if self._workers.get(worker.key) is not worker or worker.loading:
+                return
+            _log(f"Model process failure path={worker.key[0]}: {reason}")
+            self._restarts += 1
+            worker.restarts += 1
+            self._last_failure = {"path": worker.path or worker.key[0], "reason": reason, "at": failed_at}
+            worker.restart_times = [t for t in worker.restart_times if failed_at - t < _RESTART_WINDOW_S]
+            give_up = worker.load_options is None or len(worker.restart_times) >= MODEL_MAX_RESTARTS
+            worker.restart_times.append(failed_at)
+            # Not ready from here on, so nothing is dispatched to the failed process.
+            worker.loaded = False
+            if give_up:
+                self._abort_jobs(f"{reason}. The model was unloaded.", [worker])
+                self._workers.pop(worker.key, None)
+                if self._active is worker:
+                    self._active = None
+            else:
+                worker.loading = True
+                worker.load_stage = "restart"
+                worker.load_message = reason
+                self._recovering += 1
+                for job in list(worker.running.values()):
+                    job.finish({
+                        "type": "error",
+                        "msg": f"{reason}. The model is being restarted.",
+                        "code": "model_process_failed",
+                        "job_id": job.id,
+                    }, "error")
+                    self._complete_job(job)
+
+        self._stop_worker(worker)
+        if give_up:
+            _log(f"Giving up on model process path={worker.key[0]}")
+            return
+
+        worker.cmd_queue = self._create_channel()
+        worker.res_queue = self._create_channel()
+        worker.stop_event.clear()
+        worker.ping_sent_at = None
+        with self._lock:
+            # Compiled blobs in the OpenVINO cache make this much faster than the first load.
+            self._begin_load(worker, worker.load_options)
+        ok = self._await_load(worker)
+        with self._lock:
+            self._recovering -= 1
+            if ok:
+                worker.loaded = True
+                self._last_recovery_s = round(time.time() - failed_at, 2)
+                _log(f"Model process recovered path={worker.key[0]} in {self._last_recovery_s}s")
+                self._dispatch()
+            else:
+                self._abort_jobs("Model failed to reload after a crash", [worker])
+                if self._workers.get(worker.key) is worker:
+                    self._workers.pop(worker.key)
+                if self._active is worker:
+                    self._active = None
+        if not ok:
+            self._stop_worker(worker)
+
+    def get_supervisor_stats(self) -> Dict[str, object]:
+        with self._lock:
+            return {
+                "restarts": self._restarts,
+                "recovering": self._recovering,
+                "last_failure": dict(self._last_failure),
+                "last_recovery_s": self._last_recovery_s,
+            }
 
     def get_status(self) -> Dict[str, object]:
         with self._lock:
-            process_alive = self._process is not None and self._process.is_alive()
-            loaded = bool(self._model_loaded and process_alive)
-            pid = self._process.pid if process_alive and self._process else None
-            path = self._model_path or ""
-            device = self._device or "AUTO"
-            kind = self._model_kind or "llm"
-            loading = self._loading
-            load_stage = self._load_stage
-            load_message = self._load_message
-            load_started_at = self._load_started_at
+            worker = self._active
+            workers = list(self._workers.values())
+            if worker is not None:
+                loaded = bool(worker.loaded and worker.alive)
+                pid = worker.pid
+                path = worker.path or ""
+                device = worker.device or "AUTO"
+                kind = worker.kind or "llm"
+                loading = worker.loading
+                load_stage = worker.load_stage
+                load_message = worker.load_message
+                load_started_at = worker.load_started_at
+                serving_mode = worker.serving_mode
+                draft_path = worker.draft_path or ""
+                warmup = dict(worker.warmup)
+            else:
+                loaded = False
+                pid = None
+                path = ""
+                device = "AUTO"
+                kind = "llm"
+                loading = False
+                load_stage = ""
+                load_message = ""
+                load_started_at = None
+                serving_mode = False
+                draft_path = ""
+                warmup = {}
+            pool = [
+                {
+                    "path": w.path or w.key[0],
+                    "device": w.device or w.key[1],
+                    "kind": w.kind or w.key[2],
+                    "pid": w.pid or 0,
+                    "loaded": bool(w.loaded and w.alive),
+                    "active": w is worker,
+                    "running": len(w.running),
+                    "last_used": w.last_used,
+                    "restarts": w.restarts,
+                }
+                for w in workers
+            ]
+            pool_stats = {"hits": self._pool_hits, "loads": self._pool_loads, "evictions": self._pool_evictions}
         memory = get_process_memory(pid) if loaded else {"rss": 0, "private": 0}
+        for entry in pool:
+            entry["memory"] = get_process_memory(entry["pid"]) if entry["pid"] else {"rss": 0, "private": 0}
         return {
             "loaded": loaded,
             "path": path,
@@ -189,72 +894,217 @@ class LLMService:
             "load_stage": load_stage,
             "load_message": load_message,
             "load_started_at": load_started_at or 0,
+            "serving_mode": serving_mode,
+            "draft_path": draft_path,
+            "warmup": warmup,
+            "pool": pool,
+            "pool_size": MODEL_POOL_SIZE,
+            "pool_stats": pool_stats,
         }
 
-    def generate(self, messages, config):
+    def get_scheduler_stats(self) -> Dict[str, object]:
         with self._lock:
-            if not self._model_loaded:
+            waiting = [item[2] for item in self._pending if not item[2].done.is_set()]
+            running = list(self._running)
+            waits = list(self._wait_times)
+            active = self._active
+            stats = {
+                "queue_depth": len(waiting),
+                "queue_depth_by_priority": {
+                    name: sum(1 for job in waiting if job.priority == name) for name in PRIORITIES
+                },
+                "running_jobs": running,
+                "max_concurrency": active.max_running if active is not None else 1,
+                "serving_mode": active.serving_mode if active is not None else False,
+                "oldest_wait": round(max((job.wait_time for job in waiting), default=0.0), 3),
+                "submitted": self._jobs_submitted,
+                "completed": self._jobs_completed,
+                "cancelled": self._jobs_cancelled,
+            }
+        waits.sort()
+        stats["wait_avg"] = round(sum(waits) / len(waits), 3) if waits else 0
+        stats["wait_p95"] = round(waits[min(len(waits) - 1, int(len(waits) * 0.95))], 3) if waits else 0
+        stats["wait_max"] = round(waits[-1], 3) if waits else 0
+        return stats
+
+    def get_context_limits(self) -> Optional[Tuple[str, int]]:
+        """Model dir and MAX_PROMPT_LEN of the active text model, if one is loaded."""
+        with self._lock:
+            worker = self._active
+            if worker is None or not worker.loaded or worker.kind not in ("llm", "vlm"):
+                return None
+            args = (worker.load_options or {}).get("args") or ()
+            max_prompt_len = int(args[4]) if len(args) > 4 and args[4] else 16384
+            return (worker.path or worker.key[0], max_prompt_len)
+
+    def get_recent_perf(self, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Stats of the most recently finished jobs, newest first."""
+        with self._lock:
+            recent = list(self._perf_recent)
+        recent.reverse()
+        return recent[:limit] if limit else recent
+
+    def _resolve_worker(self, model_path: Optional[str]) -> Optional[ModelWorker]:
+        """The active worker, or the warm worker holding ``model_path``. Lock held."""
+        if not model_path:
+            return self._active
+        try:
+            target = str(Path(model_path).resolve())
+        except Exception:
+            target = str(model_path)
+        if self._active is not None and self._active.key[0] == target:
+            return self._active
+        for worker in reversed(self._workers.values()):
+            if worker.key[0] == target and worker.loaded:
+                return worker
+        return None
+
+    def generate(self, messages, config, priority: str = DEFAULT_PRIORITY,
+                 session_id: Optional[str] = None, model_path: Optional[str] = None) -> GenerationJob:
+        job = GenerationJob(messages, config, priority=priority, session_id=session_id)
+        with self._lock:
+            worker = self._resolve_worker(model_path)
+            worker_key = worker.key if worker is not None and worker.loaded else None
+            load_options = dict(worker.load_options or {}) if worker_key is not None else None
+        if worker_key is not None:
+            # Hashing, the model fingerprint and the disk tier are kept outside the service lock.
+            job.cache_key = self._response_cache.key_for(worker_key, messages, config, load_options)
+            entry = self._response_cache.get(job.cache_key) if job.cache_key else None
+            if entry is not None and self._entry_blobs_present(entry):
+                job.worker_key = worker_key
+                return self._replay(job, entry)
+        return self._submit(job, model_path)
+
+    def generate_batch(self, items: List[Dict[str, Any]], priority: str = "background",
+                       model_path: Optional[str] = None) -> GenerationJob:
+        """Queue offline generation of ``items``; results arrive as ``item`` events."""
+        return self._submit(GenerationJob(items, {}, priority=priority, kind="batch"), model_path)
+
+    def _submit(self, job: GenerationJob, model_path: Optional[str]) -> GenerationJob:
+        with self._lock:
+            worker = self._resolve_worker(model_path)
+            if worker is None or not worker.loaded:
                 raise RuntimeError("Model not loaded")
-            if self._active_generation:
-                raise RuntimeError("Generation already running")
 
-            self._start_process_if_needed()
-            self._active_generation = True
-            self._generation_queue = queue.Queue()
-            self._generation_done.clear()
+            job.worker_key = worker.key
+            self._jobs[job.id] = job
+            self._jobs_submitted += 1
+            job.emit({"type": "job", "job_id": job.id, "priority": job.priority})
+            heapq.heappush(self._pending, (PRIORITIES[job.priority], next(self._job_seq), job))
+            self._dispatch()
+        return job
 
-            self._cmd_queue.put(
-                {"type": "generate", "messages": messages, "config": config}
-            )
+    def invalidate_session(self, session_id: Optional[str] = None) -> None:
+        """Drop cached chat state for ``session_id`` (all sessions if None) in every warm model."""
+        with self._lock:
+            for worker in self._workers.values():
+                if worker.loaded and worker.alive:
+                    self._send(worker, {"type": "chat_reset", "session_id": session_id})
 
-        return self._generation_queue, self._generation_done
+    def cancel(self, job_id: Optional[str] = None) -> bool:
+        with self._lock:
+            if job_id is None:
+                jobs = list(self._running.values())
+            else:
+                job = self._jobs.get(job_id)
+                jobs = [job] if job is not None else []
+            cancelled = False
+            for job in jobs:
+                if job.done.is_set():
+                    continue
+                cancelled = True
+                job.cancel_requested = True
+                if job.id in self._running:
+                    # The model process ends the job with a normal "finished" event.
+                    worker = self._workers.get(job.worker_key)
+                    if worker is None:
+                        continue
+                    if worker.serving_mode:
+                        self._send(worker, {"type": "cancel", "job_id": job.id})
+                    else:
+                        worker.stop_event.set()
+                    continue
+                job.finish(
+                    {"type": "done", "stats": {"tokens": 0, "time": 0, "speed": 0, "cancelled": True}},
+                    "cancelled",
+                )
+                self._pending = [item for item in self._pending if item[2] is not job]
+                heapq.heapify(self._pending)
+                self._complete_job(job)
+            return cancelled
+
+    def get_job(self, job_id: str) -> Optional[GenerationJob]:
+        """A queued, running or recently finished job."""
+        with self._lock:
+            self._retain_finished()
+            return self._jobs.get(job_id) or self._finished.get(job_id)
 
-    def finish_generation(self) -> None:
+    def list_jobs(self, session_id: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Jobs that have not finished yet, oldest first."""
         with self._lock:
-            self._active_generation = False
-            self._generation_queue = None
-            self._generation_done.clear()
+            jobs = sorted(self._jobs.values(), key=lambda job: job.submitted_at)
+        return [
+            {
+                "job_id": job.id,
+                "kind": job.kind,
+                "session_id": job.session_id,
+                "state": job.state,
+                "position": job.position,
+                "priority": job.priority,
+                "last_event_id": len(job.events),
+            }
+            for job in jobs
+            if not job.done.is_set() and (session_id is None or job.session_id == session_id)
+        ]
+
+    def stop(self, job_id: Optional[str] = None) -> bool:
+        return self.cancel(job_id)
 
-    def stop(self) -> None:
-        self._stop_event.set()
+    def _abort_jobs(self, reason: str, workers: Optional[List[ModelWorker]] = None) -> None:
+        """Fail queued and running jobs (of ``workers``, or all). Lock held."""
+        keys = None if workers is None else {w.key for w in workers}
+        jobs = [
+            job for job in [item[2] for item in self._pending] + list(self._running.values())
+            if keys is None or job.worker_key in keys
+        ]
+        self._pending = [item for item in self._pending if item[2] not in jobs]
+        heapq.heapify(self._pending)
+        for job in jobs:
+            job.finish({"type": "error", "msg": reason}, "error")
+            self._running.pop(job.id, None)
+            self._jobs.pop(job.id, None)
+            self._retain_finished(job)
+            worker = self._workers.get(job.worker_key)
+            if worker is not None:
+                worker.running.pop(job.id, None)
 
-    def unload_model(self) -> None:
+    def unload_model(self, model_dir: Optional[str] = None) -> None:
+        """Unload the warm models holding ``model_dir`` (every model if None)."""
+        target = None
+        if model_dir:
+            try:
+                target = str(Path(model_dir).resolve())
+            except Exception:
+                target = str(model_dir)
         with self._lock:
-            if self._active_generation:
+            workers = [w for w in self._workers.values() if target is None or w.key[0] == target]
+            if any(w.loading or self._worker_busy(w) for w in workers):
                 raise RuntimeError("Generation in progress")
-            self._active_generation = False
-            self._generation_queue = None
-            self._generation_done.clear()
-            self._model_loaded = False
-            self._model_path = None
-            self._device = None
-            self._model_kind = None
-            self._loading = False
-            self._load_stage = ""
-            self._load_message = ""
-            self._load_started_at = None
-
-        if self._process and self._process.is_alive():
-            try:
-                self._cmd_queue.put(None)
-                self._process.join(timeout=1)
-            finally:
-                if self._process.is_alive():
-                    self._process.terminate()
-                    self._process.join(timeout=1)
-        self._process = None
-        self._stop_event.set()
+            for worker in workers:
+                self._workers.pop(worker.key, None)
+                if self._active is worker:
+                    self._active = None
+
+        for worker in workers:
+            self._stop_worker(worker)
 
     def shutdown(self) -> None:
+        self._supervisor_stop.set()
         with self._lock:
-            self._active_generation = False
-            self._generation_queue = None
-            self._generation_done.clear()
+            self._abort_jobs("Service shutting down")
+            workers = list(self._workers.values())
+            self._workers.clear()
+            self._active = None
 
-        if self._process:
-            try:
-                self._cmd_queue.put(None)
-                self._process.join(timeout=1)
-            finally:
-                if self._process.is_alive():
-                    self._process.terminate()
+        for worker in workers:
+            self._stop_worker(worker)
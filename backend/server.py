@@ -1,5 +1,7 @@
 import os
 import sys
+import threading
+import time
 from pathlib import Path
 
 import uvicorn
@@ -30,19 +32,33 @@ if uvicorn.logging.sys.stderr is None:
     uvicorn.logging.sys.stderr = sys.stderr
 
 
+def _restore_when_started(server: uvicorn.Server) -> None:
+    # Overlap the model load with UI startup once the API is reachable.
+    while not server.started and not server.should_exit:
+        time.sleep(0.05)
+    if server.started:
+        from backend.app import restore_last_model
+
+        restore_last_model()
+
+
 def main():
     host = os.environ.get("IDLE_NPU_HOST", "127.0.0.1")
     port = int(os.environ.get("IDLE_NPU_PORT", "8000"))
+    from app.config import RESTORE_LAST_MODEL
     from backend.app import app
 
-    uvicorn.run(
+    server = uvicorn.Server(uvicorn.Config(
         app,
         host=host,
         port=port,
         reload=False,
         use_colors=False,
         log_config=None,
-    )
+    ))
+    if RESTORE_LAST_MODEL:
+        threading.Thread(target=_restore_when_started, args=(server,), daemon=True).start()
+    server.run()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,80 @@
+"""
+Time the ASR input path from WAV bytes to what WhisperPipeline.generate receives.
+
+Usage: python benchmarks/bench_audio_path.py [--seconds S ...] [--rate HZ] [--channels C]
+
+Synthetic 16-bit WAV clips are decoded, resampled to 16 kHz and prepared for
+the pipeline twice: the old way (linear ``np.interp`` and a per-sample
+``float(x)`` list) and the current one (polyphase filter, float32 buffer).
+The second ``polyphase`` column is a rerun with the filter already cached.
+"""
+import argparse
+import io
+import sys
+import time
+import wave
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).resolve().parents[1]
+if str(ROOT_DIR) not in sys.path:
+    sys.path.insert(0, str(ROOT_DIR))
+
+import numpy as np
+
+from app.core.llm_process import _decode_wav_bytes, _polyphase_filter, _resample_audio
+
+
+def _wav(seconds: float, rate: int, channels: int) -> bytes:
+    t = np.arange(int(seconds * rate)) / rate
+    tone = 0.4 * np.sin(2 * np.pi * 440 * t) + 0.1 * np.random.default_rng(0).standard_normal(len(t))
+    pcm = (np.repeat(tone[:, None], channels, axis=1) * 32767).astype("<i2")
+    buf = io.BytesIO()
+    with wave.open(buf, "wb") as wf:
+        wf.setnchannels(channels)
+        wf.setsampwidth(2)
+        wf.setframerate(rate)
+        wf.writeframes(pcm.tobytes())
+    return buf.getvalue()
+
+
+def _legacy(raw: bytes):
+    audio, sr = _decode_wav_bytes(raw)
+    length = len(audio)
+    target_len = int(length * 16000.0 / float(sr))
+    x_old = np.linspace(0, length - 1, num=length)
+    x_new = np.linspace(0, length - 1, num=target_len)
+    audio = np.interp(x_new, x_old, audio).astype(np.float32)
+    return [float(x) for x in audio]
+
+
+def _current(raw: bytes):
+    audio, sr = _decode_wav_bytes(raw)
+    return _resample_audio(audio, sr, 16000)
+
+
+def _time(fn, raw: bytes) -> float:
+    start = time.perf_counter()
+    fn(raw)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--seconds", type=float, nargs="+", default=[30, 300, 1200])
+    parser.add_argument("--rate", type=int, default=44100)
+    parser.add_argument("--channels", type=int, default=2)
+    args = parser.parse_args()
+
+    print(f"{args.rate} Hz, {args.channels} channel(s), 16-bit")
+    print(f"{'clip':>8} {'wav MB':>8} {'legacy s':>10} {'polyphase s':>12} {'cached s':>10}")
+    for seconds in args.seconds:
+        raw = _wav(seconds, args.rate, args.channels)
+        legacy = _time(_legacy, raw)
+        _polyphase_filter.cache_clear()
+        cold = _time(_current, raw)
+        warm = _time(_current, raw)
+        print(f"{seconds:>7.0f}s {len(raw) / 1e6:>8.1f} {legacy:>10.3f} {cold:>12.3f} {warm:>10.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""
+Compare the multiprocessing.Queue transport with the shared-memory ring used
+between LLMService and the model process.
+
+Usage: python benchmarks/bench_ipc_transport.py [--tokens N] [--history-kb K]
+
+The child process mimics llm_process_entry: it receives a ``generate`` command
+carrying a chat history, answers with ``tokens`` ``token`` events and a
+``finished`` event. Reported numbers are token events per second and the
+round trip of the generate command with its history payload.
+"""
+import argparse
+import base64
+import multiprocessing
+import os
+import sys
+import time
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).resolve().parents[1]
+if str(ROOT_DIR) not in sys.path:
+    sys.path.insert(0, str(ROOT_DIR))
+
+from app.core.shm_transport import ShmQueue
+
+
+def _echo_worker(cmd_queue, res_queue):
+    while True:
+        cmd = cmd_queue.get()
+        if cmd is None:
+            break
+        if cmd.get("type") == "generate":
+            res_queue.put({"type": "load_stage", "stage": "received", "message": ""})
+            for i in range(cmd["config"]["tokens"]):
+                res_queue.put({"type": "token", "token": f"tok{i} "})
+            res_queue.put({"type": "finished", "stats": {"tokens": cmd["config"]["tokens"]}})
+
+
+def _history(size_kb: int):
+    blob = base64.b64encode(os.urandom(size_kb * 1024 * 3 // 4)).decode("ascii")
+    return [
+        {"role": "system", "content": "You are a helpful AI assistant."},
+        {"role": "user", "content": "Describe this image.", "attachments": [
+            {"name": "a.png", "kind": "image", "content": f"data:image/png;base64,{blob}"}
+        ]},
+    ]
+
+
+def _run(label, ctx, make_channel, tokens, history, rounds):
+    cmd_queue = make_channel()
+    res_queue = make_channel()
+    proc = ctx.Process(target=_echo_worker, args=(cmd_queue, res_queue), daemon=True)
+    proc.start()
+    payload_times = []
+    token_rates = []
+    try:
+        for _ in range(rounds):
+            start = time.perf_counter()
+            cmd_queue.put({"type": "generate", "messages": history, "config": {"tokens": tokens}})
+            msg = res_queue.get()
+            assert msg["type"] == "load_stage"
+            payload_times.append(time.perf_counter() - start)
+            start = time.perf_counter()
+            count = 0
+            while True:
+                msg = res_queue.get()
+                if msg["type"] == "token":
+                    count += 1
+                elif msg["type"] == "finished":
+                    break
+            token_rates.append(count / (time.perf_counter() - start))
+        cmd_queue.put(None)
+        proc.join(timeout=5)
+    finally:
+        if proc.is_alive():
+            proc.terminate()
+        for channel in (cmd_queue, res_queue):
+            close = getattr(channel, "close", None)
+            if close and isinstance(channel, ShmQueue):
+                close()
+    payload_times.sort()
+    token_rates.sort()
+    print(
+        f"{label:<6} tokens/s median={token_rates[len(token_rates) // 2]:>10.0f}  "
+        f"generate payload median={payload_times[len(payload_times) // 2] * 1000:>8.2f} ms"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--tokens", type=int, default=20000)
+    parser.add_argument("--history-kb", type=int, default=4096)
+    parser.add_argument("--rounds", type=int, default=5)
+    args = parser.parse_args()
+
+    ctx = multiprocessing.get_context("spawn")
+    history = _history(args.history_kb)
+    print(f"{args.tokens} token events, {args.history_kb} KB history, {args.rounds} rounds")
+    _run("queue", ctx, ctx.Queue, args.tokens, history, args.rounds)
+    _run("shm", ctx, lambda: ShmQueue(ctx), args.tokens, history, args.rounds)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""
+Insert and load throughput of the session database.
+
+Usage: python benchmarks/bench_session_db.py [--sessions N] [--messages M] [--loads L]
+
+Each run writes into a fresh data directory. ``per-op`` opens a new
+connection (and re-runs the PRAGMAs) for every operation, as SessionManager
+used to; ``pooled`` is the current per-thread connection. The session history
+cache is disabled so loads go to the database.
+"""
+import argparse
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).resolve().parents[1]
+if str(ROOT_DIR) not in sys.path:
+    sys.path.insert(0, str(ROOT_DIR))
+
+os.environ["IDLE_NPU_DATA_DIR"] = tempfile.mkdtemp(prefix="bench_session_db_")
+os.environ["IDLE_NPU_SESSION_CACHE_MB"] = "0"
+
+import app.config as config
+from app.core.session import SessionManager
+
+
+def _per_op_connect(self) -> sqlite3.Connection:
+    conn = sqlite3.connect(self.db_path)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA foreign_keys = ON")
+    conn.execute("PRAGMA journal_mode = WAL")
+    return conn
+
+
+def _run(label: str, connect, sessions: int, messages: int, loads: int) -> None:
+    directory = Path(tempfile.mkdtemp(prefix=f"{label}_", dir=config.DATA_DIR))
+    SessionManager.__init__.__globals__["SESSIONS_DB_PATH"] = directory / "sessions.db"
+    original = SessionManager._connect
+    if connect is not None:
+        SessionManager._connect = connect
+    try:
+        manager = SessionManager()
+        sids = [manager.create_session(f"bench {i}") for i in range(sessions)]
+        text = "lorem ipsum dolor sit amet " * 20
+
+        start = time.perf_counter()
+        for sid in sids:
+            for i in range(messages):
+                manager.add_message("user" if i % 2 == 0 else "assistant", text, sid=sid)
+        inserted = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for i in range(loads):
+            manager.get_session(sids[i % len(sids)])
+        loaded = time.perf_counter() - start
+
+        close = getattr(manager, "close", None)
+        if close is not None:
+            close()
+    finally:
+        SessionManager._connect = original
+
+    total = sessions * messages
+    print(
+        f"{label:>8} {total / inserted:>14.0f} {loads / loaded:>14.1f} "
+        f"{loads * messages / loaded:>16.0f}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sessions", type=int, default=20)
+    parser.add_argument("--messages", type=int, default=200)
+    parser.add_argument("--loads", type=int, default=200)
+    args = parser.parse_args()
+
+    print(f"{args.sessions} sessions x {args.messages} messages, {args.loads} loads")
+    print(f"{'':>8} {'inserts/s':>14} {'sessions/s':>14} {'loaded msgs/s':>16}")
+    _run("per-op", _per_op_connect, args.sessions, args.messages, args.loads)
+    _run("pooled", None, args.sessions, args.messages, args.loads)
+
+
+if __name__ == "__main__":
+    main()
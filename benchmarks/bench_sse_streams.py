@@ -0,0 +1,130 @@
+"""
+Load test for the chat SSE endpoints: many concurrent streams while the UI
+keeps polling /api/models/status.
+
+Usage: python benchmarks/bench_sse_streams.py [--streams N] [--tokens T] [--token-ms MS]
+
+The FastAPI app runs in-process under uvicorn with a throwaway data
+directory. ``llm_service.generate`` is replaced by a fake job whose events
+are emitted from a background thread, exactly as the model monitor does, so
+only the web layer is measured. A synchronous relay blocks a threadpool
+worker (40 by default) on the job queue until the next token arrives, so
+streams and status polls compete for the pool; compare poll latency with a
+checkout from before the async relay to see the difference.
+"""
+import argparse
+import asyncio
+import os
+import socket
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).resolve().parents[1]
+if str(ROOT_DIR) not in sys.path:
+    sys.path.insert(0, str(ROOT_DIR))
+
+os.environ.setdefault("IDLE_NPU_DATA_DIR", tempfile.mkdtemp(prefix="idle_npu_bench_"))
+os.environ.setdefault("IDLE_NPU_RESTORE_LAST_MODEL", "0")
+
+import httpx
+import uvicorn
+
+from app.core.gen_metrics import _percentile
+from backend import app as app_module
+from backend.llm_service import DEFAULT_PRIORITY, GenerationJob
+
+
+def _fake_generate(tokens: int, token_ms: float):
+    def generate(messages, config, priority=DEFAULT_PRIORITY, session_id=None, model_path=None):
+        job = GenerationJob(messages, config, priority=priority, session_id=session_id)
+
+        def produce():
+            job.emit({"type": "started", "job_id": job.id})
+            for i in range(tokens):
+                if job.done.is_set():
+                    return
+                time.sleep(token_ms / 1000.0)
+                job.emit({"type": "token", "token": f"t{i} "})
+            job.finish({"type": "done", "stats": {"tokens": tokens}}, "done")
+
+        threading.Thread(target=produce, daemon=True).start()
+        return job
+
+    return generate
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+async def _stream(client: httpx.AsyncClient, session_id: str) -> bool:
+    payload = {"session_id": session_id, "text": "hello"}
+    async with client.stream("POST", "/api/chat/stream", json=payload) as resp:
+        async for line in resp.aiter_lines():
+            if line.startswith("data:") and '"done"' in line:
+                return True
+    return False
+
+
+async def _poll_status(client: httpx.AsyncClient, stop: asyncio.Event, latencies):
+    while not stop.is_set():
+        start = time.perf_counter()
+        resp = await client.get("/api/models/status")
+        resp.raise_for_status()
+        latencies.append((time.perf_counter() - start) * 1000.0)
+        await asyncio.sleep(0.05)
+
+
+async def _run(base_url: str, streams: int, pollers: int):
+    limits = httpx.Limits(max_connections=streams + pollers + 4)
+    async with httpx.AsyncClient(base_url=base_url, timeout=120, limits=limits) as client:
+        resp = await client.post("/api/sessions", json={"title": "bench", "is_temporary": True})
+        session_id = resp.json()["id"]
+
+        latencies = []
+        stop = asyncio.Event()
+        poll_tasks = [asyncio.create_task(_poll_status(client, stop, latencies)) for _ in range(pollers)]
+        start = time.perf_counter()
+        results = await asyncio.gather(*[_stream(client, session_id) for _ in range(streams)])
+        elapsed = time.perf_counter() - start
+        stop.set()
+        await asyncio.gather(*poll_tasks)
+
+    print(
+        f"streams completed={sum(results)}/{streams} in {elapsed:.2f} s  "
+        f"status polls={len(latencies)} p50={_percentile(latencies, 50):.1f} ms "
+        f"p95={_percentile(latencies, 95):.1f} ms max={max(latencies or [0]):.1f} ms"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--streams", type=int, default=100)
+    parser.add_argument("--tokens", type=int, default=200)
+    parser.add_argument("--token-ms", type=float, default=20.0)
+    parser.add_argument("--pollers", type=int, default=4)
+    args = parser.parse_args()
+
+    app_module.llm_service.generate = _fake_generate(args.tokens, args.token_ms)
+    port = _free_port()
+    server = uvicorn.Server(uvicorn.Config(app_module.app, host="127.0.0.1", port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.05)
+
+    print(f"{args.streams} streams x {args.tokens} tokens every {args.token_ms} ms, {args.pollers} status pollers")
+    try:
+        asyncio.run(_run(f"http://127.0.0.1:{port}", args.streams, args.pollers))
+    finally:
+        server.should_exit = True
+        thread.join(timeout=5)
+
+
+if __name__ == "__main__":
+    main()
@@ -5,6 +5,7 @@ const API_BASE = '';
 let currentSessionId = null;
 let sessions = [];
 let isGenerating = false;
+let currentJobId = null;
 let modelLoaded = false;
 let config = null;
 let presetModels = [];
@@ -17,10 +18,14 @@ let pendingAttachments = [];
 let maxFileBytes = 512 * 1024;
 let maxImageBytes = 5 * 1024 * 1024;
 let maxAudioBytes = 20 * 1024 * 1024;
+let maxAudioUploadBytes = 512 * 1024 * 1024;
 let markdownReady = false;
 let mermaidReady = false;
 let codeHighlightReady = false;
 let currentMessages = [];
+// Long sessions open on their newest page; older pages load on request.
+const MESSAGE_PAGE_SIZE = 50;
+let olderMessagesBeforeId = null;
 let editingIndex = null;
 let downloadRunning = false;
 let downloadAbortController = null;
@@ -143,6 +148,7 @@ const downloadCacheDirInput = document.getElementById('downloadCacheDirInput');
 const sessionsDbInput = document.getElementById('sessionsDbInput');
 const configDirInput = document.getElementById('configDirInput');
 const logsDirInput = document.getElementById('logsDirInput');
+const blobsDirInput = document.getElementById('blobsDirInput');
 const attachmentsDirInput = document.getElementById('attachmentsDirInput');
 const saveAppPathsBtn = document.getElementById('saveAppPathsBtn');
 const pathsRestartHint = document.getElementById('pathsRestartHint');
@@ -1269,6 +1275,11 @@ function buildUserDisplayText(text, attachments) {
     return text ? `${text}\n\n${note}` : note;
 }
 
+function blobUrl(digest, mime) {
+    const query = mime ? `?mime=${encodeURIComponent(mime)}` : '';
+    return `${API_BASE}/api/blobs/${digest}${query}`;
+}
+
 function normalizeAttachment(att) {
     const content = typeof att.content === 'string' ? att.content : '';
     let kind = (att.kind || '').toLowerCase();
@@ -1290,7 +1301,18 @@ function normalizeAttachment(att) {
         }
     }
     const name = att.name || 'attachment';
-    return { name, kind, mime, content };
+    if (att.blob) {
+        // Stored in the blob store: load by URL, show the small thumbnail in the chat.
+        const src = blobUrl(att.blob, mime);
+        const thumbSrc = att.thumb ? blobUrl(att.thumb, 'image/jpeg') : src;
+        return { name, kind, mime, content, blob: att.blob, size: att.size || 0, src, thumbSrc };
+    }
+    if (att.url && !content) {
+        // Left out of the paged message list; fetched when it is displayed.
+        const src = `${API_BASE}${att.url}`;
+        return { name, kind, mime, content, url: att.url, size: att.size || 0, src, thumbSrc: src };
+    }
+    return { name, kind, mime, content, src: content, thumbSrc: content };
 }
 
 function drawCoverImage(ctx, img, width, height) {
@@ -1384,21 +1406,21 @@ function renderMessageAttachments(messageDiv, attachments, messageIndex = null)
         const item = document.createElement('div');
         item.className = 'message-attachment-card';
 
-        if (att.kind === 'audio' && att.content.startsWith('data:audio/')) {
+        if (att.kind === 'audio' && (att.blob || att.url || att.content.startsWith('data:audio/'))) {
             const audio = document.createElement('audio');
             audio.className = 'message-attachment-audio';
             audio.controls = true;
-            audio.src = att.content;
+            audio.src = att.src;
             audio.preload = 'none';
             item.appendChild(audio);
-        } else if (att.kind === 'image' && att.content.startsWith('data:image/')) {
+        } else if (att.kind === 'image' && (att.blob || att.url || att.content.startsWith('data:image/'))) {
             if (isAssistant) {
-                const canvas = createPixelRevealThumb(att.content, att.name);
-                canvas.addEventListener('click', () => openImagePreview(att.content, att.name));
+                const canvas = createPixelRevealThumb(att.thumbSrc, att.name);
+                canvas.addEventListener('click', () => openImagePreview(att.src, att.name));
                 canvas.addEventListener('keydown', (event) => {
                     if (event.key === 'Enter' || event.key === ' ') {
                         event.preventDefault();
-                        openImagePreview(att.content, att.name);
+                        openImagePreview(att.src, att.name);
                     }
                 });
                 item.appendChild(canvas);
@@ -1409,14 +1431,14 @@ function renderMessageAttachments(messageDiv, attachments, messageIndex = null)
                 thumb.title = att.name || '';
                 thumb.loading = 'lazy';
                 thumb.decoding = 'async';
-                thumb.src = att.content;
+                thumb.src = att.thumbSrc;
                 thumb.tabIndex = 0;
                 thumb.setAttribute('role', 'button');
-                thumb.addEventListener('click', () => openImagePreview(att.content, att.name));
+                thumb.addEventListener('click', () => openImagePreview(att.src, att.name));
                 thumb.addEventListener('keydown', (event) => {
                     if (event.key === 'Enter' || event.key === ' ') {
                         event.preventDefault();
-                        openImagePreview(att.content, att.name);
+                        openImagePreview(att.src, att.name);
                     }
                 });
                 item.appendChild(thumb);
@@ -1448,6 +1470,9 @@ function renderMessageAttachments(messageDiv, attachments, messageIndex = null)
             kind: att.kind,
             mime: att.mime,
             content: att.content,
+            blob: att.blob,
+            url: att.url,
+            src: att.src,
             messageIndex: Number.isInteger(messageIndex) ? messageIndex : null,
             attachmentIndex: attIndex
         };
@@ -1552,6 +1577,7 @@ function textToBase64(text) {
 }
 
 function estimateAttachmentSize(att) {
+    if (att && (att.blob || att.url)) return att.size || 0;
     if (!att || !att.content) return 0;
     const kind = (att.kind || '').toLowerCase();
     if (kind === 'image' && typeof att.content === 'string' && att.content.startsWith('data:')) {
@@ -1574,7 +1600,7 @@ function collectSessionAttachments() {
         const attachments = msg.attachments || [];
         attachments.forEach((att, attIndex) => {
             const content = typeof att.content === 'string' ? att.content : '';
-            if (!content) return;
+            if (!content && !att.blob && !att.url) return;
             const name = att.name || `attachment-${msgIndex + 1}-${attIndex + 1}`;
             let kind = (att.kind || '').toLowerCase();
             if (!kind) {
@@ -1587,7 +1613,7 @@ function collectSessionAttachments() {
                 }
             }
             const mime = att.mime || ((kind === 'image' || kind === 'audio') ? parseDataUrl(content).mime : 'text/plain');
-            const size = estimateAttachmentSize({ content, kind });
+            const size = estimateAttachmentSize({ content, kind, blob: att.blob, url: att.url, size: att.size });
             files.push({
                 id: `${msgIndex}-${attIndex}`,
                 name,
@@ -1595,6 +1621,9 @@ function collectSessionAttachments() {
                 mime,
                 size,
                 content,
+                blob: att.blob,
+                url: att.url,
+                src: att.blob ? blobUrl(att.blob, mime) : (att.url ? `${API_BASE}${att.url}` : content),
                 messageIndex: msgIndex,
                 attachmentIndex: attIndex
             });
@@ -1622,12 +1651,21 @@ function openExternal(url) {
 }
 
 async function downloadAttachment(file) {
-    if (!file || !file.content) return;
+    if (!file || !(file.content || file.blob || file.url)) return;
     const invoke = getTauriInvoke();
     if (invoke) {
         try {
             let base64 = '';
-            if (typeof file.content === 'string' && file.content.startsWith('data:')) {
+            if (file.blob || file.url) {
+                const response = await fetch(file.src || (file.blob ? blobUrl(file.blob, file.mime) : `${API_BASE}${file.url}`));
+                if (!response.ok) throw new Error('download failed');
+                const bytes = new Uint8Array(await response.arrayBuffer());
+                let binary = '';
+                for (let i = 0; i < bytes.length; i += 0x8000) {
+                    binary += String.fromCharCode.apply(null, bytes.subarray(i, i + 0x8000));
+                }
+                base64 = btoa(binary);
+            } else if (typeof file.content === 'string' && file.content.startsWith('data:')) {
                 base64 = dataUrlToBase64(file.content);
             } else {
                 base64 = textToBase64(String(file.content));
@@ -1679,8 +1717,8 @@ async function downloadAttachment(file) {
     let blob;
     let mime = file.mime || '';
     try {
-        if (typeof file.content === 'string' && file.content.startsWith('data:')) {
-            const response = await fetch(file.content);
+        if (file.blob || (typeof file.content === 'string' && file.content.startsWith('data:'))) {
+            const response = await fetch(file.blob ? (file.src || blobUrl(file.blob, mime)) : file.content);
             blob = await response.blob();
             mime = response.type || mime;
         } else {
@@ -1790,6 +1828,16 @@ function readFileAsDataUrl(file) {
     });
 }
 
+async function uploadFile(file, mime) {
+    const response = await fetch(`${API_BASE}/api/uploads?mime=${encodeURIComponent(mime)}`, {
+        method: 'POST',
+        headers: { 'Content-Type': mime },
+        body: file
+    });
+    if (!response.ok) throw new Error(`Upload failed: ${response.status}`);
+    return response.json();
+}
+
 async function handleFileSelection() {
     const files = Array.from(fileInput.files || []);
     fileInput.value = '';
@@ -1820,18 +1868,22 @@ async function handleFileSelection() {
                     showToast(t('msg_audio_format_unsupported', 'Only WAV audio is supported for transcription.'));
                     continue;
                 }
-                const limit = maxAudioBytes || 20 * 1024 * 1024;
+                const limit = maxAudioUploadBytes || maxAudioBytes || 20 * 1024 * 1024;
                 if (file.size > limit) {
                     showToast(t('msg_file_too_large', file.name));
                     continue;
                 }
-                const content = await readFileAsDataUrl(file);
+                // Recordings go to the blob store as-is instead of a base64 data URL.
+                const mime = file.type || 'audio/wav';
+                const stored = await uploadFile(file, mime);
                 pendingAttachments.push({
                     name: file.name,
-                    content,
+                    content: '',
                     truncated: false,
                     kind: 'audio',
-                    mime: file.type || 'audio/wav'
+                    mime: stored.mime || mime,
+                    blob: stored.blob,
+                    size: stored.size
                 });
                 showToast(t('msg_file_attached', file.name));
                 continue;
@@ -2079,6 +2131,7 @@ async function loadConfig() {
         maxFileBytes = data.max_file_bytes || maxFileBytes;
         maxImageBytes = data.max_image_bytes || maxImageBytes;
         maxAudioBytes = data.max_audio_bytes || maxAudioBytes;
+        maxAudioUploadBytes = data.max_audio_upload_bytes || maxAudioUploadBytes;
 
         populateDownloadModelList();
         renderDownloadCards(downloadSearchInput ? downloadSearchInput.value : '');
@@ -2138,6 +2191,7 @@ async function loadAppPaths() {
         setPathInputValue(ovCacheDirInput, overrides.ov_cache_dir, paths.ov_cache_dir);
         setPathInputValue(downloadCacheDirInput, overrides.download_cache_dir, paths.download_cache_dir);
         setPathInputValue(sessionsDbInput, overrides.sessions_db, paths.sessions_db);
+        setPathInputValue(blobsDirInput, overrides.blobs_dir, paths.blobs_dir);
         setPathInputValue(configDirInput, overrides.config_dir, paths.config_dir);
         setPathInputValue(logsDirInput, overrides.logs_dir, paths.logs_dir);
         const downloadsPlaceholder = t('placeholder_system_downloads', 'System default (Downloads)');
@@ -2155,6 +2209,7 @@ async function saveAppPaths() {
         ov_cache_dir: ovCacheDirInput ? ovCacheDirInput.value.trim() : '',
         download_cache_dir: downloadCacheDirInput ? downloadCacheDirInput.value.trim() : '',
         sessions_db: sessionsDbInput ? sessionsDbInput.value.trim() : '',
+        blobs_dir: blobsDirInput ? blobsDirInput.value.trim() : '',
         config_dir: configDirInput ? configDirInput.value.trim() : '',
         logs_dir: logsDirInput ? logsDirInput.value.trim() : '',
         attachments_dir: attachmentsDirInput ? attachmentsDirInput.value.trim() : ''
@@ -2261,6 +2316,11 @@ async function restoreModelStatus() {
         const response = await fetch(`${API_BASE}/api/models/status`);
         if (!response.ok) return;
         const data = await response.json();
+        if (data && !data.loaded && data.restore && data.restore.state === 'loading') {
+            // The backend is reloading the last model; pick it up once ready.
+            setTimeout(restoreModelStatus, 1000);
+            return;
+        }
         if (!data || !data.loaded) return;
 
         const lastConfig = loadLastModelConfig();
@@ -2353,36 +2413,162 @@ async function selectSession(sessionId) {
     }
 }
 
+async function fetchMessagePage(sessionId, beforeId = null) {
+    const params = new URLSearchParams({ limit: String(MESSAGE_PAGE_SIZE) });
+    if (beforeId !== null && beforeId !== undefined) params.set('before_id', String(beforeId));
+    const response = await fetch(`${API_BASE}/api/sessions/${sessionId}/messages?${params}`);
+    if (!response.ok) throw new Error(`Failed to load messages: ${response.status}`);
+    return response.json();
+}
+
 async function loadMessages(sessionId) {
     try {
-        const response = await fetch(`${API_BASE}/api/sessions/${sessionId}/messages`);
-        const data = await response.json();
-        renderMessages(data.messages || []);
+        const data = await fetchMessagePage(sessionId);
+        renderMessages(data.messages || [], data);
+        resumeSessionJob(sessionId).catch(error => console.error('Failed to resume generation:', error));
     } catch (error) {
         console.error('Failed to load messages:', error);
     }
 }
 
-function renderMessages(messages) {
-    currentMessages = (messages || []).map(msg => ({
-        ...msg,
-        content: normalizeMessageContent(msg.content)
-    }));
+// Reattach to a generation that kept running while the page was away
+// (reload, dropped connection); the job's events are replayed from the start.
+async function resumeSessionJob(sessionId) {
+    if (isGenerating) return;
+    const response = await fetch(`${API_BASE}/api/jobs?session_id=${encodeURIComponent(sessionId)}`);
+    if (!response.ok) return;
+    const job = ((await response.json()).jobs || [])[0];
+    if (!job || sessionId !== currentSessionId) return;
+
+    let assistantIndex = currentMessages.length - 1;
+    const last = currentMessages[assistantIndex];
+    if (!last || last.role !== 'assistant' || last.job_id !== job.job_id) {
+        assistantIndex = currentMessages.length;
+        currentMessages.push({ role: 'assistant', content: '' });
+        welcomeScreen.classList.add('hidden');
+        appendMessage('assistant', '', true, assistantIndex);
+    }
+    const contentDiv = messagesDiv.querySelector(`.message[data-index="${assistantIndex}"] .message-content`);
+    setAssistantPlaceholder(contentDiv);
+
+    isGenerating = true;
+    currentJobId = job.job_id;
+    sendBtn.classList.add('hidden');
+    stopBtn.classList.remove('hidden');
+    let fullResponse = '';
+    try {
+        const stream = await fetch(`${API_BASE}/api/jobs/${job.job_id}/stream?last_event_id=0`);
+        const reader = stream.body.getReader();
+        const decoder = new TextDecoder();
+        while (true) {
+            const { value, done } = await reader.read();
+            if (done) break;
+            for (const line of decoder.decode(value).split('\n')) {
+                if (!line.startsWith('data: ')) continue;
+                let data;
+                try {
+                    data = JSON.parse(line.slice(6));
+                } catch (e) {
+                    continue;
+                }
+                if (data.type === 'queued') {
+                    setQueuedPlaceholder(contentDiv, data.position);
+                } else if (data.type === 'token') {
+                    fullResponse += data.token;
+                    currentMessages[assistantIndex].content = fullResponse;
+                    if (contentDiv) contentDiv.innerHTML = formatAssistantContent(fullResponse);
+                    scrollToBottom();
+                } else if (data.type === 'error') {
+                    contentDiv.innerHTML = `<span style="color: var(--error-color)">${t('dialog_error')}: ${escapeHtml(data.message)}</span>`;
+                } else if (data.type === 'done') {
+                    // Re-render from the saved history so attachments and stats match a normal reply.
+                    if (sessionId === currentSessionId) {
+                        const saved = await fetchMessagePage(sessionId);
+                        renderMessages(saved.messages || [], saved);
+                    }
+                }
+            }
+        }
+    } catch (error) {
+        console.error('Failed to resume generation:', error);
+    } finally {
+        isGenerating = false;
+        currentJobId = null;
+        sendBtn.classList.remove('hidden');
+        stopBtn.classList.add('hidden');
+    }
+}
+
+// ``page`` is the paginated response the messages came from. Messages keep
+// their index in the whole history, so currentMessages has holes in front of
+// the loaded page until older pages are fetched.
+function renderMessages(messages, page = null) {
+    messages = messages || [];
+    currentMessages = [];
+    messages.forEach((msg, i) => {
+        currentMessages[Number.isInteger(msg.index) ? msg.index : i] = {
+            ...msg,
+            content: normalizeMessageContent(msg.content)
+        };
+    });
+    if (page && Number.isInteger(page.total)) {
+        currentMessages.length = Math.max(currentMessages.length, page.total);
+    }
+    olderMessagesBeforeId = page && page.next_before_id !== undefined ? page.next_before_id : null;
     if (messages.length === 0) {
         welcomeScreen.classList.remove('hidden');
         messagesDiv.innerHTML = '';
     } else {
         welcomeScreen.classList.add('hidden');
         messagesDiv.innerHTML = '';
-        messages.forEach((msg, index) => {
+        messages.forEach((msg, i) => {
+            const index = Number.isInteger(msg.index) ? msg.index : i;
             appendMessage(msg.role, msg.content, false, index, msg.attachments || []);
         });
+        renderOlderMessagesButton();
         scrollToBottom(true);
     }
     updateScrollState();
     refreshCurrentChatSize();
 }
 
+function renderOlderMessagesButton() {
+    const existing = messagesDiv.querySelector('.load-older-messages');
+    if (existing) existing.remove();
+    if (olderMessagesBeforeId === null) return;
+    const button = document.createElement('button');
+    button.type = 'button';
+    button.className = 'refresh-btn load-older-messages';
+    button.textContent = t('btn_load_older', 'Load earlier messages');
+    button.addEventListener('click', () => {
+        button.disabled = true;
+        loadOlderMessages().catch(error => {
+            console.error('Failed to load earlier messages:', error);
+            button.disabled = false;
+        });
+    });
+    messagesDiv.insertBefore(button, messagesDiv.firstChild);
+}
+
+async function loadOlderMessages() {
+    const sessionId = currentSessionId;
+    if (!sessionId || olderMessagesBeforeId === null) return;
+    const data = await fetchMessagePage(sessionId, olderMessagesBeforeId);
+    if (sessionId !== currentSessionId) return;
+    const anchor = messagesDiv.querySelector('.message');
+    const previousHeight = chatContainer ? chatContainer.scrollHeight : 0;
+    (data.messages || []).forEach(msg => {
+        currentMessages[msg.index] = { ...msg, content: normalizeMessageContent(msg.content) };
+        appendMessage(msg.role, msg.content, false, msg.index, msg.attachments || [], anchor);
+    });
+    olderMessagesBeforeId = data.next_before_id !== undefined ? data.next_before_id : null;
+    renderOlderMessagesButton();
+    if (chatContainer) {
+        // Keep the message that was on screen where it was.
+        chatContainer.scrollTop += chatContainer.scrollHeight - previousHeight;
+    }
+}
+
 function estimateSessionSize(messages) {
     let total = 0;
     (messages || []).forEach(msg => {
@@ -2470,7 +2656,7 @@ function normalizeMessageContent(content) {
     return String(content);
 }
 
-function appendMessage(role, content, scroll = true, index = null, attachments = null) {
+function appendMessage(role, content, scroll = true, index = null, attachments = null, before = null) {
     welcomeScreen.classList.add('hidden');
 
     const messageDiv = document.createElement('div');
@@ -2504,7 +2690,11 @@ function appendMessage(role, content, scroll = true, index = null, attachments =
     const resolvedAttachments = attachments || (index !== null ? (getMessageByIndex(index)?.attachments || []) : []);
     renderMessageAttachments(messageDiv, resolvedAttachments, index);
 
-    messagesDiv.appendChild(messageDiv);
+    if (before) {
+        messagesDiv.insertBefore(messageDiv, before);
+    } else {
+        messagesDiv.appendChild(messageDiv);
+    }
 
     if (scroll) {
         scrollToBottom();
@@ -2741,7 +2931,13 @@ async function regenerateAssistant() {
                     try {
                         const data = JSON.parse(line.slice(6));
 
-                        if (data.type === 'token') {
+                        if (data.type === 'job') {
+                            currentJobId = data.job_id || null;
+                        } else if (data.type === 'queued') {
+                            setQueuedPlaceholder(contentDiv, data.position);
+                        } else if (data.type === 'started') {
+                            setAssistantPlaceholder(contentDiv);
+                        } else if (data.type === 'token') {
                             stopImageProgress(false);
                             fullResponse += data.token;
                             incrementGenTokens();
@@ -2811,6 +3007,7 @@ async function regenerateAssistant() {
         stopImageProgress(false);
         stopGenStats();
         isGenerating = false;
+        currentJobId = null;
         sendBtn.classList.remove('hidden');
         stopBtn.classList.add('hidden');
         refreshCurrentChatSize();
@@ -3254,6 +3451,17 @@ function setAssistantPlaceholder(contentDiv) {
     `;
 }
 
+function setQueuedPlaceholder(contentDiv, position) {
+    if (!contentDiv) return;
+    const label = escapeHtml(t('msg_queued', position));
+    contentDiv.innerHTML = `
+        <div class="assistant-placeholder">
+            <span class="assistant-placeholder-text">${label}</span>
+            <span class="typing-dots"><span></span><span></span><span></span></span>
+        </div>
+    `;
+}
+
 function startImageProgress(contentDiv) {
     if (!contentDiv) return;
     stopImageProgress(false);
@@ -3532,7 +3740,13 @@ async function sendMessage() {
                     try {
                         const data = JSON.parse(line.slice(6));
 
-                        if (data.type === 'token') {
+                        if (data.type === 'job') {
+                            currentJobId = data.job_id || null;
+                        } else if (data.type === 'queued') {
+                            setQueuedPlaceholder(contentDiv, data.position);
+                        } else if (data.type === 'started') {
+                            setAssistantPlaceholder(contentDiv);
+                        } else if (data.type === 'token') {
                             stopImageProgress(false);
                             fullResponse += data.token;
                             incrementGenTokens();
@@ -3604,6 +3818,7 @@ async function sendMessage() {
         stopImageProgress(false);
         stopGenStats();
         isGenerating = false;
+        currentJobId = null;
         sendBtn.classList.remove('hidden');
         stopBtn.classList.add('hidden');
     }
@@ -3611,7 +3826,11 @@ async function sendMessage() {
 
 async function stopGeneration() {
     try {
-        await fetch(`${API_BASE}/api/chat/stop`, { method: 'POST' });
+        await fetch(`${API_BASE}/api/chat/stop`, {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ job_id: currentJobId })
+        });
     } catch (error) {
         console.error('Failed to stop generation:', error);
     }
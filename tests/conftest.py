@@ -0,0 +1,11 @@
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+# app.config creates its directories on import; keep them out of the user's data dir.
+os.environ["IDLE_NPU_DATA_DIR"] = tempfile.mkdtemp(prefix="idle_npu_tests_")
+
+ROOT_DIR = Path(__file__).resolve().parents[1]
+if str(ROOT_DIR) not in sys.path:
+    sys.path.insert(0, str(ROOT_DIR))
@@ -0,0 +1,292 @@
+import itertools
+import json
+import socket
+import threading
+import time
+
+import pytest
+
+pytest.importorskip("fastapi")
+httpx = pytest.importorskip("httpx")
+
+from fastapi.testclient import TestClient
+
+from app.config import JOB_RETENTION_S
+from backend import app as app_module
+from backend.llm_service import GenerationJob
+
+TIMEOUT = 5.0
+
+
+@pytest.fixture(scope="module")
+def client():
+    with TestClient(app_module.app) as test_client:
+        yield test_client
+
+
+def _upload(client, data, mime="audio/wav"):
+    resp = client.post("/api/uploads", content=data, headers={"content-type": mime})
+    assert resp.status_code == 200
+    return resp.json()["blob"]
+
+
+def test_blob_media_type_is_limited_to_raster_and_audio(client):
+    digest = _upload(client, b"<svg xmlns='http://www.w3.org/2000/svg'><script>alert(1)</script></svg>")
+
+    for mime in ("image/svg+xml", "text/html", "application/xml"):
+        resp = client.get(f"/api/blobs/{digest}", params={"mime": mime})
+        assert resp.status_code == 200
+        assert resp.headers["content-type"] == "application/octet-stream"
+        assert resp.headers["x-content-type-options"] == "nosniff"
+        assert resp.headers["content-security-policy"] == "sandbox"
+
+    resp = client.get(f"/api/blobs/{digest}", params={"mime": "audio/webm;codecs=opus"})
+    assert resp.headers["content-type"].startswith("audio/webm")
+
+
+def test_upload_rejects_non_audio(client):
+    resp = client.post("/api/uploads", content=b"<svg/>", headers={"content-type": "image/svg+xml"})
+    assert resp.status_code == 415
+
+
+def test_blob_range_requests_stream_the_requested_span(client):
+    data = bytes(range(256)) * 1024
+    digest = _upload(client, data)
+
+    resp = client.get(f"/api/blobs/{digest}", headers={"Range": "bytes=1000-200999"})
+    assert resp.status_code == 206
+    assert resp.headers["content-range"] == f"bytes 1000-200999/{len(data)}"
+    assert resp.headers["content-length"] == "200000"
+    assert resp.content == data[1000:201000]
+
+    resp = client.get(f"/api/blobs/{digest}", headers={"Range": "bytes=-100"})
+    assert resp.content == data[-100:]
+
+    resp = client.get(f"/api/blobs/{digest}", headers={"Range": f"bytes={len(data)}-"})
+    assert resp.status_code == 416
+
+
+def _frames(body):
+    frames = []
+    for block in body.split("\n\n"):
+        if not block.strip():
+            continue
+        frame = {}
+        for line in block.splitlines():
+            field, _, value = line.partition(": ")
+            if field == "id":
+                frame["id"] = int(value)
+            elif field == "data":
+                frame["data"] = json.loads(value)
+        frames.append(frame)
+    return frames
+
+
+def _job(finished=True):
+    """A job with events 1..5 (job, started, token a, token b, done), registered with the service."""
+    job = GenerationJob([{"role": "user", "content": "hi"}], {})
+    job.emit({"type": "job", "job_id": job.id, "priority": job.priority})
+    job.emit({"type": "started", "job_id": job.id, "wait": 0.0})
+    job.emit({"type": "token", "token": "a"})
+    job.emit({"type": "token", "token": "b"})
+    service = app_module.llm_service
+    with service._lock:
+        if finished:
+            job.finish({"type": "done", "stats": {"tokens": 2}}, "done")
+            service._finished[job.id] = job
+        else:
+            service._jobs[job.id] = job
+    return job
+
+
+def test_job_stream_replays_after_last_event_id(client):
+    job = _job()
+
+    frames = _frames(client.get(f"/api/jobs/{job.id}/stream", headers={"Last-Event-ID": "3"}).text)
+    assert [f["data"]["type"] for f in frames] == ["token", "done"]
+    assert frames[0]["data"]["token"] == "b"
+    assert [f["id"] for f in frames] == [4, 5]
+
+    frames = _frames(client.get(f"/api/jobs/{job.id}/stream", params={"last_event_id": 2}).text)
+    assert "".join(f["data"].get("token", "") for f in frames) == "ab"
+
+
+def test_job_stream_after_done_replays_the_whole_log(client):
+    job = _job()
+
+    frames = _frames(client.get(f"/api/jobs/{job.id}/stream").text)
+    assert [f["data"]["type"] for f in frames][:2] == ["job", "started"]
+    assert frames[-1]["data"]["type"] == "done" and frames[-1]["id"] == 5
+    assert _frames(client.get(f"/api/jobs/{job.id}/stream", headers={"Last-Event-ID": "5"}).text) == []
+
+
+def test_job_stream_resumes_a_running_job(client):
+    job = _job(finished=False)
+
+    def finish():
+        time.sleep(0.2)
+        job.emit({"type": "token", "token": "c"})
+        job.finish({"type": "done", "stats": {"tokens": 3}}, "done")
+
+    threading.Thread(target=finish, daemon=True).start()
+    frames = _frames(client.get(f"/api/jobs/{job.id}/stream", headers={"Last-Event-ID": "4"}).text)
+    assert [f["data"]["type"] for f in frames] == ["token", "done"]
+    assert frames[0]["data"]["token"] == "c"
+    assert [f["id"] for f in frames] == [5, 6]
+    with app_module.llm_service._lock:
+        app_module.llm_service._jobs.pop(job.id, None)
+
+
+def test_job_stream_unknown_or_expired_job(client):
+    assert client.get("/api/jobs/unknown/stream").status_code == 404
+
+    job = _job()
+    job.finished_at = time.time() - JOB_RETENTION_S - 1
+    with app_module.llm_service._lock:
+        app_module.llm_service._finished.move_to_end(job.id, last=False)
+    assert client.get(f"/api/jobs/{job.id}/stream").status_code == 404
+
+    assert client.get(f"/api/jobs/{_job().id}/stream", headers={"Last-Event-ID": "x"}).status_code == 400
+
+
+@pytest.fixture
+def fake_loads(monkeypatch):
+    calls = []
+    gate = threading.Event()
+    gate.set()
+    failures = []
+
+    def load_model(source, model_id, model_dir, device, max_prompt_len=16384, **options):
+        calls.append({"path": model_dir, "device": device, "max_prompt_len": max_prompt_len, **options})
+        gate.wait(TIMEOUT)
+        if failures:
+            raise RuntimeError(failures.pop())
+        return model_dir, device, "llm"
+
+    monkeypatch.setattr(app_module.llm_service, "load_model", load_model)
+    monkeypatch.setitem(app_module.restore_state, "state", "idle")
+    yield calls, gate, failures
+    app_module.session_mgr.set_last_model(None)
+
+
+def _wait_restore():
+    assert app_module.restore_done.wait(TIMEOUT)
+
+
+def test_restore_uses_the_saved_load_options(client, fake_loads, tmp_path):
+    calls, _, _ = fake_loads
+    resp = client.post("/api/models/load", json={
+        "path": str(tmp_path), "device": "NPU", "max_prompt_len": 4096, "serving_mode": True,
+        "max_num_seqs": 4, "draft_path": str(tmp_path / "draft"), "prompt_lookup": True,
+    })
+    assert resp.status_code == 200
+
+    assert app_module.restore_last_model()
+    _wait_restore()
+    user, restored = calls
+    user.pop("warmup")
+    assert restored == user
+    assert restored["serving"]["max_num_seqs"] == 4
+    assert restored["draft"] == {"path": str(tmp_path / "draft"), "device": "NPU"}
+    assert restored["prompt_lookup"] is True
+    assert app_module.restore_state["state"] == "done"
+
+
+def test_failed_restore_is_not_retried(client, fake_loads, tmp_path):
+    calls, _, failures = fake_loads
+    assert client.post("/api/models/load", json={"path": str(tmp_path)}).status_code == 200
+    failures.append("device lost")
+
+    assert app_module.restore_last_model()
+    _wait_restore()
+    assert app_module.restore_state["state"] == "error"
+    assert app_module.session_mgr.get_last_model()["restore_error"] == "device lost"
+    assert not app_module.restore_last_model()
+    assert len(calls) == 2
+
+    # A successful load by the user makes the model restorable again.
+    assert client.post("/api/models/load", json={"path": str(tmp_path)}).status_code == 200
+    assert app_module.restore_last_model()
+    _wait_restore()
+
+
+def test_user_load_waits_for_a_running_restore(client, fake_loads, tmp_path):
+    calls, gate, _ = fake_loads
+    app_module.session_mgr.set_last_model({"path": str(tmp_path), "device": "CPU"})
+    gate.clear()
+    assert app_module.restore_last_model()
+
+    other = tmp_path / "other"
+    other.mkdir()
+    result = {}
+    user = threading.Thread(
+        target=lambda: result.update(resp=client.post("/api/models/load", json={"path": str(other)})),
+    )
+    user.start()
+    time.sleep(0.2)
+    assert [call["path"] for call in calls] == [str(tmp_path)]
+
+    gate.set()
+    user.join(TIMEOUT)
+    assert result["resp"].status_code == 200
+    assert [call["path"] for call in calls] == [str(tmp_path), str(other)]
+    assert app_module.session_mgr.get_last_model()["path"] == str(other)
+
+
+@pytest.fixture
+def live_server():
+    """The app under uvicorn: unlike TestClient, a client may drop a stream midway."""
+    uvicorn = pytest.importorskip("uvicorn")
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    server = uvicorn.Server(uvicorn.Config(app_module.app, host="127.0.0.1", port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    deadline = time.time() + TIMEOUT
+    while not server.started and time.time() < deadline:
+        time.sleep(0.02)
+    assert server.started
+    yield f"http://127.0.0.1:{port}"
+    server.should_exit = True
+    thread.join(TIMEOUT)
+
+
+def test_chat_stream_unsubscribes_when_the_client_disconnects(client, live_server, monkeypatch):
+    jobs = []
+
+    def generate(messages, config, priority=None, session_id=None, model_path=None):
+        job = GenerationJob(messages, config, session_id=session_id)
+
+        def produce():
+            job.emit({"type": "started", "job_id": job.id})
+            while not job.done.is_set():
+                job.emit({"type": "token", "token": "x" * 80})
+                time.sleep(0.01)
+
+        threading.Thread(target=produce, daemon=True).start()
+        jobs.append(job)
+        return job
+
+    monkeypatch.setattr(app_module.llm_service, "generate", generate)
+    sid = client.post("/api/sessions", json={"title": "stream", "is_temporary": True}).json()["id"]
+
+    with httpx.Client(base_url=live_server, timeout=TIMEOUT) as http:
+        with http.stream("POST", "/api/chat/stream", json={"session_id": sid, "text": "hi"}) as resp:
+            lines = resp.iter_lines()
+            assert any('"token"' in line for line in itertools.islice(lines, 20))
+            job = jobs[0]
+            assert len(job._listeners) == 2  # the relay and the reply recorder
+
+    def relay_gone():
+        with job._events_lock:
+            listeners = list(job._listeners)
+        return len(listeners) == 1 and isinstance(listeners[0].__self__, app_module._ReplyRecorder)
+
+    deadline = time.time() + TIMEOUT
+    while not relay_gone() and time.time() < deadline:
+        time.sleep(0.02)
+    assert relay_gone()
+    # The job itself keeps running for a later reattach.
+    assert not job.done.is_set()
+    job.finish({"type": "done", "stats": {}}, "done")
@@ -0,0 +1,84 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from app.core.llm_process import _resample_audio, _vad_segments
+
+RATE = 16000
+
+
+def _tone(seconds, rate=RATE, freq=300.0, amplitude=0.3):
+    t = np.arange(int(seconds * rate)) / rate
+    return (amplitude * np.sin(2 * np.pi * freq * t)).astype(np.float32)
+
+
+def _noise(seconds, rng):
+    return (0.001 * rng.standard_normal(int(seconds * RATE))).astype(np.float32)
+
+
+def test_resample_passes_through_target_rate_as_float32():
+    audio = np.linspace(-1, 1, 100, dtype=np.float64)
+    out = _resample_audio(audio, RATE)
+    assert out.dtype == np.float32
+    assert out.flags["C_CONTIGUOUS"]
+    assert np.allclose(out, audio)
+    assert len(_resample_audio(np.zeros(0), 44100)) == 0
+
+
+@pytest.mark.parametrize("src_rate", [8000, 22050, 44100, 48000])
+def test_resample_keeps_duration_and_pitch(src_rate):
+    out = _resample_audio(_tone(1.0, rate=src_rate, freq=440.0), src_rate)
+
+    assert out.dtype == np.float32
+    assert len(out) == RATE
+    spectrum = np.abs(np.fft.rfft(out[1000:-1000]))
+    peak_hz = np.argmax(spectrum) * RATE / len(out[1000:-1000])
+    assert abs(peak_hz - 440.0) < 2.0
+
+
+def test_resample_matches_scipy_polyphase():
+    signal = pytest.importorskip("scipy.signal")
+    audio = _tone(1.0, rate=44100, freq=440.0)
+
+    ours = _resample_audio(audio, 44100)
+    reference = signal.resample_poly(audio, 160, 441)
+    assert len(ours) == len(reference)
+    assert np.abs(ours[100:-100] - reference[100:-100]).max() < 1e-2
+
+
+def test_vad_drops_silence():
+    assert _vad_segments(np.zeros(3 * RATE, dtype=np.float32), RATE) == []
+    assert _vad_segments(np.zeros(0, dtype=np.float32), RATE) == []
+
+
+def test_vad_covers_speech_and_merges_up_to_max_length():
+    rng = np.random.default_rng(0)
+    audio = np.concatenate([_noise(1, rng), _tone(2), _noise(1, rng), _tone(3), _noise(1, rng)])
+
+    segments = _vad_segments(audio, RATE, max_s=30.0)
+    assert len(segments) == 1
+    start, end = segments[0]
+    assert start <= 1 * RATE and end >= 6 * RATE
+    assert end <= len(audio)
+
+
+def test_vad_cuts_at_pauses_when_speech_exceeds_max_length():
+    rng = np.random.default_rng(0)
+    audio = np.concatenate([_noise(1, rng), _tone(2), _noise(1, rng), _tone(3), _noise(1, rng)])
+
+    segments = _vad_segments(audio, RATE, max_s=2.5)
+    assert len(segments) > 1
+    assert all(end - start <= 2.5 * RATE for start, end in segments)
+    assert all(a_end <= b_start for (_, a_end), (b_start, _) in zip(segments, segments[1:]))
+    # The pause between the two bursts is not part of any segment.
+    gap = (3 * RATE + RATE // 2, 3 * RATE + RATE // 2 + 1)
+    assert not any(start < gap[1] and end > gap[0] for start, end in segments)
+
+
+def test_vad_splits_continuous_audio_without_pauses():
+    audio = _tone(70)
+    segments = _vad_segments(audio, RATE, max_s=30.0)
+
+    assert segments[0][0] == 0 and segments[-1][1] == len(audio)
+    assert all(end - start <= 30 * RATE for start, end in segments)
+    assert all(a_end == b_start for (_, a_end), (b_start, _) in zip(segments, segments[1:]))
@@ -0,0 +1,125 @@
+import os
+import time
+
+import pytest
+
+from app.core.blob_store import BlobStore
+from app.core.session import SessionManager
+
+
+def _age(store, digest, seconds):
+    path = store.path(digest)
+    past = time.time() - seconds
+    os.utime(path, (past, past))
+
+
+def test_put_stores_identical_bytes_once_and_refreshes_mtime(tmp_path):
+    store = BlobStore(tmp_path)
+    digest = store.put(b"hello")
+    _age(store, digest, 3600)
+
+    assert store.put(b"hello") == digest
+    assert time.time() - store.path(digest).stat().st_mtime < 60
+    assert list(store.digests()) == [digest]
+
+
+def test_writer_commit_of_existing_bytes_refreshes_mtime(tmp_path):
+    store = BlobStore(tmp_path)
+    digest = store.put(b"audio")
+    _age(store, digest, 3600)
+
+    writer = store.writer()
+    writer.write(b"au")
+    writer.write(b"dio")
+    assert writer.commit() == digest
+    assert time.time() - store.path(digest).stat().st_mtime < 60
+
+
+def test_delete_before_keeps_recent_files(tmp_path):
+    store = BlobStore(tmp_path)
+    digest = store.put(b"fresh")
+
+    assert not store.delete(digest, before=time.time() - 60)
+    assert store.path(digest) is not None
+    assert store.delete(digest)
+    assert store.path(digest) is None
+
+
+def test_delete_keeps_shard_directory_for_concurrent_puts(tmp_path):
+    store = BlobStore(tmp_path)
+    digest = store.put(b"only blob in its shard")
+    shard = store.path(digest).parent
+
+    assert store.delete(digest)
+    assert shard.is_dir()
+    assert store.put(b"only blob in its shard") == digest
+    assert store.read(digest) == b"only blob in its shard"
+
+
+@pytest.fixture
+def manager(tmp_path):
+    mgr = SessionManager()
+    mgr.blobs = BlobStore(tmp_path / "blobs")
+    yield mgr
+    mgr.close()
+
+
+def _attach(manager, sid, digest):
+    image = {"name": "a.png", "kind": "image", "mime": "image/png", "blob": digest, "size": 1}
+    manager.add_message("user", "look", sid=sid, attachments=[image])
+
+
+def test_collect_blobs_follows_attachment_refcounts(manager):
+    digest = manager.blobs.put(b"shared image")
+    _age(manager.blobs, digest, 2 * 24 * 3600)
+    first = manager.create_session("first")
+    second = manager.create_session("second")
+    _attach(manager, first, digest)
+    _attach(manager, second, digest)
+
+    manager.delete_session(first)
+    assert manager.collect_blobs(grace_s=60) == 0
+    assert manager.blobs.path(digest) is not None
+
+    manager.delete_session(second)
+    assert manager.blobs.path(digest) is None
+
+
+def test_collect_blobs_spares_recent_blobs(manager):
+    digest = manager.blobs.put(b"just uploaded")
+    sid = manager.create_session("recent")
+    _attach(manager, sid, digest)
+    manager.delete_session(sid)
+
+    assert manager.collect_blobs(grace_s=60, sweep=True) == 0
+    assert manager.blobs.path(digest) is not None
+
+    _age(manager.blobs, digest, 120)
+    assert manager.collect_blobs(grace_s=60) == 1
+    assert manager.blobs.path(digest) is None
+
+
+def test_collect_blobs_keeps_temp_session_references(manager):
+    digest = manager.blobs.put(b"temporary image")
+    _age(manager.blobs, digest, 3600)
+    sid = manager.create_session("temp", is_temporary=True)
+    _attach(manager, sid, digest)
+
+    assert manager.collect_blobs(grace_s=60, sweep=True) == 0
+    assert manager.blobs.path(digest) is not None
+
+    manager.delete_session(sid)
+    assert manager.collect_blobs(grace_s=60, sweep=True) == 1
+
+
+def test_sweep_collects_blobs_that_were_never_attached(manager):
+    orphan = manager.blobs.put(b"never sent")
+    kept = manager.blobs.put(b"sent")
+    _age(manager.blobs, orphan, 3600)
+    _age(manager.blobs, kept, 3600)
+    _attach(manager, manager.create_session("kept"), kept)
+
+    assert manager.collect_blobs(grace_s=60, sweep=False) == 0
+    assert manager.collect_blobs(grace_s=60, sweep=True) == 1
+    assert manager.blobs.path(orphan) is None
+    assert manager.blobs.path(kept) is not None
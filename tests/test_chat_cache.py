@@ -0,0 +1,106 @@
+from types import SimpleNamespace
+
+from app.core.chat_cache import ChatKVCache
+from app.core.llm_process import _generated_ids, _token_ids
+
+EOT = 2
+
+
+def _turn(cache, sid, prompt_ids, reply_ids):
+    """Run one turn the way the model process does; return the ids prefilled."""
+    delta = cache.delta(sid, prompt_ids)
+    if delta is None:
+        cache.reset()
+        cache.active = True
+        cache.session_id = sid
+        cache.misses += 1
+        prefilled = list(prompt_ids)
+    else:
+        cache.hits += 1
+        prefilled = delta
+    cache.commit(sid, prompt_ids, reply_ids)
+    return prefilled
+
+
+def test_inactive_cache_misses():
+    cache = ChatKVCache()
+    assert cache.delta("s1", [1, 2, 3]) is None
+    assert not cache.matches("s1")
+
+
+def test_next_turn_prefills_only_new_tokens():
+    cache = ChatKVCache()
+    first = [10, 11, 12]
+    reply = [20, 21, EOT]
+    assert _turn(cache, "s1", first, reply) == first
+    assert cache.tokens == 6
+
+    second = first + reply + [13, 14]
+    assert _turn(cache, "s1", second, [22, EOT]) == [13, 14]
+    assert cache.ids == second + [22, EOT]
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_prompt_equal_to_cache_is_a_miss():
+    cache = ChatKVCache()
+    cache.commit("s1", [1, 2], [3])
+    assert cache.delta("s1", [1, 2, 3]) is None
+
+
+def test_reply_rendered_without_its_end_token_is_a_miss():
+    # The streamer never shows the end-of-turn token; a template that drops it
+    # (or strips a <think> block) from past replies no longer extends the cache.
+    cache = ChatKVCache()
+    cache.commit("s1", [1, 2], [3, 4, EOT])
+    assert cache.delta("s1", [1, 2, 3, 4, 5, 6]) is None
+
+
+def test_retokenization_that_splits_differently_is_a_miss():
+    cache = ChatKVCache()
+    cache.commit("s1", [1, 2], [30, 31])
+    # Same text, but the full prompt merged the reply's last token with the next turn.
+    assert cache.delta("s1", [1, 2, 30, 99, 5]) is None
+
+
+def test_session_switch_invalidates():
+    cache = ChatKVCache()
+    cache.commit("s1", [1, 2], [3])
+    assert cache.delta("s2", [1, 2, 3, 4]) is None
+    assert cache.delta(None, [1, 2, 3, 4]) is None
+    assert cache.matches("s1") and not cache.matches("s2")
+    assert cache.matches(None)
+
+
+def test_edited_history_invalidates():
+    cache = ChatKVCache()
+    _turn(cache, "s1", [1, 2], [3, EOT])
+    _turn(cache, "s1", [1, 2, 3, EOT, 4], [5, EOT])
+
+    # The first user message was edited: the prompt diverges inside the cache.
+    edited = [1, 7, 3, EOT, 4, 5, EOT, 6]
+    assert _turn(cache, "s1", edited, [8, EOT]) == edited
+    assert cache.ids == edited + [8, EOT]
+
+    # Truncated history (retry of the last turn) is shorter than the cache.
+    assert cache.delta("s1", [1, 7, 3, EOT]) is None
+
+
+def test_reset_clears_state():
+    cache = ChatKVCache()
+    cache.commit("s1", [1], [2])
+    cache.reset()
+    assert cache.ids == [] and cache.tokens == 0
+    assert cache.session_id is None
+    assert not cache.matches(None)
+
+
+class _Tensor:
+    def __init__(self, rows):
+        self.data = rows
+
+
+def test_token_id_helpers_read_pipeline_outputs():
+    assert _token_ids(SimpleNamespace(input_ids=_Tensor([[5, 6, 7]]))) == [5, 6, 7]
+    assert _token_ids(object()) is None
+    assert _generated_ids(SimpleNamespace(tokens=[[8, 9, EOT]])) == [8, 9, EOT]
+    assert _generated_ids(SimpleNamespace(texts=["decoded only"])) is None
@@ -0,0 +1,59 @@
+from app.core.context_builder import (
+    MESSAGE_OVERHEAD_TOKENS,
+    MIN_PROMPT_BUDGET,
+    TRUNCATION_MARK,
+    ContextBuilder,
+)
+
+
+def _turns(n):
+    return [{"role": "user" if i % 2 == 0 else "assistant", "content": f"m{i}"} for i in range(n)]
+
+
+def test_count_estimates_three_bytes_per_token():
+    builder = ContextBuilder()
+    assert builder.count("") == 0
+    assert builder.count("ab") == 1
+    assert builder.count("a" * 12) == 4
+    assert builder.count("你好世界") == 4
+
+
+def test_budget_reserves_new_tokens_with_a_floor():
+    assert ContextBuilder.budget(4096, 1024) == 3072
+    assert ContextBuilder.budget(1024, 4096) == MIN_PROMPT_BUDGET
+
+
+def test_select_keeps_newest_messages_within_budget():
+    messages = _turns(6)
+    counts = [10] * 6
+    per_message = 10 + MESSAGE_OVERHEAD_TOKENS
+    selected, total = ContextBuilder().select(messages, counts, budget=3 * per_message + 5)
+
+    # Three messages fit, but the window is moved to start on a user turn.
+    assert [m["content"] for m in selected] == ["m4", "m5"]
+    assert total == 2 * per_message
+
+
+def test_select_honours_reserved_tokens_and_message_limit():
+    messages = _turns(6)
+    counts = [10] * 6
+    per_message = 10 + MESSAGE_OVERHEAD_TOKENS
+    builder = ContextBuilder()
+
+    selected, total = builder.select(messages, counts, budget=10_000, reserved=100, max_messages=4)
+    assert [m["content"] for m in selected] == ["m2", "m3", "m4", "m5"]
+    assert total == 100 + 4 * per_message
+
+    selected, _ = builder.select(messages, counts, budget=100 + 2 * per_message, reserved=100)
+    assert [m["content"] for m in selected] == ["m4", "m5"]
+
+
+def test_select_truncates_a_single_oversized_message():
+    message = {"role": "user", "content": "x" * 3000}
+    selected, total = ContextBuilder().select([message], [1000], budget=300, reserved=40)
+
+    content = selected[0]["content"]
+    assert content.endswith(TRUNCATION_MARK)
+    assert len(content) < 3000
+    assert total == 300
+    assert message["content"] == "x" * 3000
@@ -0,0 +1,234 @@
+import queue
+import threading
+import time
+
+import pytest
+
+from backend.llm_service import LLMService, ModelWorker
+
+TIMEOUT = 5.0
+
+
+class _FakeProcess:
+    pid = 4242
+    exitcode = None
+
+    def is_alive(self):
+        return True
+
+    def join(self, timeout=None):
+        pass
+
+    def terminate(self):
+        pass
+
+
+@pytest.fixture
+def service():
+    svc = LLMService()
+    yield svc
+    svc.shutdown()
+
+
+def _fake_worker(service, tmp_path, max_running=1, serving=False):
+    """A loaded worker whose 'process' is this test: commands land on cmd_queue."""
+    key = (str(tmp_path), "CPU", "llm")
+    worker = ModelWorker(key, queue.Queue(), queue.Queue(), threading.Event())
+    worker.process = _FakeProcess()
+    worker.loaded = True
+    worker.path = str(tmp_path)
+    worker.kind = "llm"
+    worker.max_running = max_running
+    worker.serving_mode = serving
+    worker.load_options = {"args": ("local", "", str(tmp_path), "CPU", 4096)}
+    with service._lock:
+        service._workers[key] = worker
+        service._active = worker
+    monitor = threading.Thread(target=service._monitor_loop, args=(worker,), daemon=True)
+    monitor.start()
+    return worker
+
+
+def _commands(worker, count):
+    return [worker.cmd_queue.get(timeout=TIMEOUT) for _ in range(count)]
+
+
+def _finish(worker, job, stats=None):
+    worker.res_queue.put({"type": "finished", "job_id": job.id, "stats": stats or {"tokens": 1}})
+    assert job.done.wait(TIMEOUT)
+
+
+def _generate(service, text, priority):
+    return service.generate([{"role": "user", "content": text}], {"do_sample": True}, priority=priority)
+
+
+def test_interactive_jobs_overtake_background_ones(service, tmp_path):
+    worker = _fake_worker(service, tmp_path)
+    first = _generate(service, "a", "background")
+    second = _generate(service, "b", "background")
+    third = _generate(service, "c", "interactive")
+
+    assert [cmd["job_id"] for cmd in _commands(worker, 1)] == [first.id]
+    assert (first.state, second.state, third.state) == ("running", "queued", "queued")
+    assert (third.position, second.position) == (1, 2)
+    queued = [e["position"] for e in second.events if e["type"] == "queued"]
+    assert queued[-1] == 2
+
+    _finish(worker, first)
+    assert _commands(worker, 1)[0]["job_id"] == third.id
+    assert second.position == 1
+    _finish(worker, third)
+    assert _commands(worker, 1)[0]["job_id"] == second.id
+    _finish(worker, second)
+
+    stats = service.get_scheduler_stats()
+    assert (stats["submitted"], stats["completed"], stats["cancelled"]) == (3, 3, 0)
+    assert stats["queue_depth"] == 0
+
+
+def test_cancel_while_pending_removes_the_job_from_the_queue(service, tmp_path):
+    worker = _fake_worker(service, tmp_path)
+    running = _generate(service, "a", "interactive")
+    pending = _generate(service, "b", "interactive")
+    last = _generate(service, "c", "interactive")
+    _commands(worker, 1)
+    assert last.position == 2
+
+    assert service.cancel(pending.id)
+    assert pending.state == "cancelled"
+    assert pending.events[-1]["stats"]["cancelled"] is True
+    assert last.position == 1
+    assert service.get_scheduler_stats()["queue_depth"] == 1
+
+    _finish(worker, running)
+    assert _commands(worker, 1)[0]["job_id"] == last.id
+    _finish(worker, last)
+    stats = service.get_scheduler_stats()
+    assert (stats["completed"], stats["cancelled"]) == (2, 1)
+
+
+def test_cancelled_running_job_counts_as_cancelled(service, tmp_path):
+    worker = _fake_worker(service, tmp_path)
+    job = _generate(service, "a", "interactive")
+    _commands(worker, 1)
+
+    assert service.cancel(job.id)
+    assert worker.stop_event.is_set()
+    assert not job.done.is_set()
+    _finish(worker, job, {"tokens": 3})
+
+    assert job.state == "cancelled"
+    assert job.events[-1]["type"] == "done"
+    assert job.events[-1]["stats"]["cancelled"] is True
+    stats = service.get_scheduler_stats()
+    assert (stats["completed"], stats["cancelled"]) == (0, 1)
+    assert not service.cancel(job.id)
+
+
+def test_serving_mode_cancels_one_job_and_runs_several(service, tmp_path):
+    worker = _fake_worker(service, tmp_path, max_running=2, serving=True)
+    first = _generate(service, "a", "interactive")
+    second = _generate(service, "b", "interactive")
+    assert {cmd["job_id"] for cmd in _commands(worker, 2)} == {first.id, second.id}
+
+    service.cancel(first.id)
+    assert _commands(worker, 1)[0] == {"type": "cancel", "job_id": first.id}
+    assert not worker.stop_event.is_set()
+    _finish(worker, first)
+    _finish(worker, second)
+    assert (first.state, second.state) == ("cancelled", "done")
+
+
+def test_jobs_need_a_loaded_model(service):
+    with pytest.raises(RuntimeError):
+        _generate(service, "a", "interactive")
+
+
+def _stub_process_entry(cmd_queue, res_queue, stop_event):
+    """Stands in for llm_process_entry: loads instantly, hangs on a "hang" prompt."""
+    while True:
+        cmd = cmd_queue.get()
+        if cmd is None:
+            return
+        if cmd["type"] == "load":
+            res_queue.put({"type": "loaded", "dev": "CPU", "kind": "llm"})
+        elif cmd["type"] == "ping":
+            res_queue.put({"type": "pong"})
+        elif cmd["type"] == "generate":
+            res_queue.put({"type": "token", "job_id": cmd["job_id"], "token": "x"})
+            if cmd["messages"][-1]["content"] != "hang":
+                res_queue.put({"type": "finished", "job_id": cmd["job_id"], "stats": {"tokens": 1}})
+
+
+@pytest.fixture
+def spawning_service(monkeypatch, service):
+    monkeypatch.setattr("backend.llm_service.llm_process_entry", _stub_process_entry)
+    sent = []
+    send = service._send
+
+    def record(worker, msg):
+        sent.append(msg)
+        send(worker, msg)
+
+    service._send = record
+    return service, sent
+
+
+def _wait_for(predicate, timeout=30.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.05)
+    return False
+
+
+def _start_hanging_job(service, tmp_path):
+    service.load_model("local", "", str(tmp_path), "CPU", 2048,
+                       draft={"path": str(tmp_path / "draft")}, prompt_lookup=True)
+    worker = service._active
+    hung = _generate(service, "hang", "interactive")
+    waiting = _generate(service, "ok", "interactive")
+    assert _wait_for(lambda: any(e["type"] == "token" for e in hung.events))
+    assert waiting.state == "queued"
+    return worker, hung, waiting
+
+
+def test_dead_worker_is_respawned_with_its_load_options(spawning_service, tmp_path):
+    service, sent = spawning_service
+    worker, hung, waiting = _start_hanging_job(service, tmp_path)
+    first_pid = worker.pid
+
+    worker.process.kill()
+
+    assert hung.done.wait(30)
+    assert hung.state == "error"
+    assert hung.events[-1]["code"] == "model_process_failed"
+    # The queued job waits for the reload and runs on the new process.
+    assert waiting.done.wait(30)
+    assert waiting.state == "done"
+    assert worker.pid not in (None, first_pid)
+
+    loads = [msg for msg in sent if msg["type"] == "load"]
+    assert len(loads) == 2
+    assert loads[1] == loads[0]
+    assert loads[1]["options"]["draft"] == {"path": str(tmp_path / "draft")}
+    assert loads[1]["options"]["prompt_lookup"] is True
+    supervisor = service.get_supervisor_stats()
+    assert supervisor["restarts"] == 1 and supervisor["recovering"] == 0
+    assert supervisor["last_recovery_s"] is not None
+
+
+def test_worker_is_unloaded_after_too_many_restarts(monkeypatch, spawning_service, tmp_path):
+    service, sent = spawning_service
+    monkeypatch.setattr("backend.llm_service.MODEL_MAX_RESTARTS", 0)
+    worker, hung, waiting = _start_hanging_job(service, tmp_path)
+
+    worker.process.kill()
+
+    assert hung.done.wait(30) and waiting.done.wait(30)
+    for job in (hung, waiting):
+        assert job.state == "error"
+        assert "unloaded" in job.events[-1]["msg"]
+    assert not service.get_status()["loaded"]
+    assert [msg["type"] for msg in sent].count("load") == 1
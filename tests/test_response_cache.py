@@ -0,0 +1,109 @@
+import os
+import time
+
+import pytest
+
+from app.core.response_cache import ResponseCache, model_fingerprint
+
+MESSAGES = [{"role": "user", "content": "hello"}]
+
+
+@pytest.fixture
+def model_dir(tmp_path):
+    path = tmp_path / "model"
+    path.mkdir()
+    (path / "openvino_model.xml").write_text("<net/>")
+    (path / "openvino_model.bin").write_bytes(b"\0" * 64)
+    return path
+
+
+@pytest.fixture
+def cache():
+    return ResponseCache(None, memory_bytes=1 << 20, disk_bytes=0)
+
+
+def _key(cache, model_dir, config=None, load_options=None, kind="llm", messages=MESSAGES):
+    # Greedy decoding unless the test says otherwise.
+    config = dict({"do_sample": False}, **(config or {}))
+    return cache.key_for((str(model_dir), "CPU", kind), messages, config, load_options)
+
+
+def test_greedy_requests_have_stable_keys(cache, model_dir):
+    key = _key(cache, model_dir)
+    assert key is not None
+    assert key == _key(cache, model_dir)
+    # Options that do not change the output do not change the key.
+    assert key == _key(cache, model_dir, {"system_prompt": "ignored here", "reuse_kv_cache": False})
+    assert key != _key(cache, model_dir, messages=[{"role": "user", "content": "other"}])
+
+
+def test_sampled_and_unseeded_requests_are_not_cached(cache, model_dir):
+    assert _key(cache, model_dir, {"do_sample": True}) is None
+    assert _key(cache, model_dir, kind="image") is None
+    assert _key(cache, model_dir, {"rng_seed": 7}, kind="image") is not None
+
+
+def test_load_options_are_part_of_the_key(cache, model_dir, tmp_path):
+    base = {"args": ["local", "", str(model_dir), "CPU", 16384], "serving": None, "draft": None}
+    key = _key(cache, model_dir, load_options=base)
+    shorter = dict(base, args=["local", "", str(model_dir), "CPU", 1024])
+    assert _key(cache, model_dir, load_options=shorter) != key
+
+    draft_dir = tmp_path / "draft"
+    draft_dir.mkdir()
+    (draft_dir / "openvino_model.xml").write_text("<draft/>")
+    with_draft = dict(base, draft={"path": str(draft_dir), "device": "CPU"})
+    assert _key(cache, model_dir, load_options=with_draft) not in (None, key)
+
+
+def test_replaced_model_files_change_the_key(cache, model_dir):
+    key = _key(cache, model_dir)
+    weights = model_dir / "openvino_model.bin"
+    weights.write_bytes(b"\1" * 64)
+    stat = weights.stat()
+    os.utime(weights, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+    assert _key(cache, model_dir) != key
+
+
+def test_missing_model_is_not_cached(cache, tmp_path):
+    assert model_fingerprint(str(tmp_path / "gone")) is None
+    assert _key(cache, tmp_path / "gone") is None
+
+
+def test_memory_tier_evicts_least_recently_used():
+    cache = ResponseCache(None, memory_bytes=300, disk_bytes=0)
+    entry = {"events": [{"type": "token", "token": "x" * 50}], "stats": {}}
+    for key in ("a", "b", "c"):
+        cache.put(key, entry)
+    assert cache.get("a") is None
+    assert cache.get("b") == entry
+    cache.put("d", entry)
+    # "b" was used more recently than "c".
+    assert cache.get("c") is None
+    assert cache.get("b") == entry
+    stats = cache.stats()
+    assert stats["memory_bytes"] <= 300
+    assert stats["hits"] == 2 and stats["misses"] == 2
+
+
+def _wait_for(predicate, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.01)
+    return False
+
+
+def test_disk_tier_survives_restart_and_is_bounded(tmp_path):
+    entry = {"events": [{"type": "token", "token": "y" * 100}], "stats": {"tokens": 1}}
+    cache = ResponseCache(tmp_path, memory_bytes=0, disk_bytes=400)
+    for key in ("k1", "k2", "k3", "k4"):
+        cache.put(key, entry)
+        assert _wait_for(lambda: (tmp_path / f"{key}.json").exists())
+    assert _wait_for(lambda: sum(p.stat().st_size for p in tmp_path.glob("*.json")) <= 400)
+
+    reopened = ResponseCache(tmp_path, memory_bytes=1 << 20, disk_bytes=400)
+    assert reopened.get("k4") == entry
+    assert reopened.get("k1") is None
+    assert reopened.stats()["disk_hits"] == 1
@@ -0,0 +1,127 @@
+import sqlite3
+import threading
+
+import pytest
+
+from app.core.session import SessionManager
+
+
+@pytest.fixture(scope="module")
+def manager():
+    mgr = SessionManager()
+    yield mgr
+    mgr.close()
+
+
+@pytest.fixture(params=[False, True], ids=["stored", "temporary"])
+def sid(request, manager):
+    sid = manager.create_session("test", is_temporary=request.param)
+    yield sid
+    manager.delete_session(sid)
+
+
+def _contents(manager, sid):
+    return [msg["content"] for msg in manager.get_session(sid)["history"]]
+
+
+def test_update_message_follows_its_message(manager, sid):
+    manager.add_message("user", "q1", sid=sid)
+    key = manager.add_message("assistant", "partial", sid=sid, partial=True)
+    manager.add_message("user", "q2", sid=sid)
+
+    assert manager.update_message(key, "a1", sid=sid)
+    assert _contents(manager, sid) == ["q1", "a1", "q2"]
+    assert "partial" not in manager.get_session(sid)["history"][1]
+
+
+def test_update_message_after_truncate_does_not_overwrite_new_turn(manager, sid):
+    manager.add_message("user", "q1", sid=sid)
+    key = manager.add_message("assistant", "partial", sid=sid, partial=True)
+
+    # The reply is regenerated: its message is removed and a new one takes its index.
+    manager.truncate_history(1, sid=sid)
+    manager.add_message("user", "q1 edited", sid=sid)
+
+    assert not manager.update_message(key, "late checkpoint", sid=sid)
+    assert _contents(manager, sid) == ["q1", "q1 edited"]
+
+
+def _walk_pages(manager, sid, limit):
+    pages = []
+    before = None
+    while True:
+        page = manager.get_messages_page(sid, before_id=before, limit=limit)
+        pages.append(page)
+        before = page["next_before_id"]
+        if before is None:
+            return pages
+
+
+@pytest.mark.parametrize("cached", [False, True], ids=["database", "cache"])
+def test_message_pages_cover_history_once(manager, sid, cached):
+    for i in range(23):
+        manager.add_message("user" if i % 2 == 0 else "assistant", f"m{i}", sid=sid)
+    history = manager.get_session(sid)["history"]
+    if not cached:
+        manager._cache_drop(sid)
+
+    pages = _walk_pages(manager, sid, limit=5)
+    assert len(pages) == 5
+    assert all(page["total"] == 23 for page in pages)
+    items = [item for page in reversed(pages) for item in page["items"]]
+    assert [index for _, index, _ in items] == list(range(23))
+    assert [msg["content"] for _, _, msg in items] == [msg["content"] for msg in history]
+    ids = [message_id for message_id, _, _ in items]
+    assert ids == sorted(set(ids))
+
+
+def test_message_page_without_limit_returns_everything(manager, sid):
+    for i in range(3):
+        manager.add_message("user", f"m{i}", sid=sid)
+    manager._cache_drop(sid)
+    page = manager.get_messages_page(sid)
+    assert [msg["content"] for _, _, msg in page["items"]] == ["m0", "m1", "m2"]
+    assert page["next_before_id"] is None
+
+
+def test_message_page_of_empty_or_unknown_session(manager, sid):
+    manager._cache_drop(sid)
+    page = manager.get_messages_page(sid, limit=10)
+    assert page == {"items": [], "total": 0, "next_before_id": None}
+    assert manager.get_messages_page("no-such-session") is None
+
+
+def test_message_page_from_database_keeps_attachments(manager):
+    sid = manager.create_session("attachments")
+    manager.add_message("user", "see file", sid=sid,
+                        attachments=[{"name": "a.txt", "kind": "text", "content": "hello"}])
+    manager.add_message("assistant", "ok", sid=sid)
+    manager._cache_drop(sid)
+    (_, _, first), (_, _, second) = manager.get_messages_page(sid, limit=2)["items"]
+    assert first["attachments"][0]["content"] == "hello"
+    assert "attachments" not in second
+    assert sid not in manager._history_cache
+    manager.delete_session(sid)
+
+
+def test_connections_of_exited_threads_are_closed(manager):
+    opened = []
+    # All threads hold their connection until every one has opened it.
+    barrier = threading.Barrier(4)
+
+    def work():
+        manager.get_session_size(manager.create_session("thread"))
+        opened.append(manager._local.conn)
+        barrier.wait()
+
+    threads = [threading.Thread(target=work) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert all(conn in manager._conns.values() for conn in opened)
+
+    manager.checkpoint()
+    assert not any(conn in manager._conns.values() for conn in opened)
+    with pytest.raises(sqlite3.ProgrammingError):
+        opened[0].execute("SELECT 1")
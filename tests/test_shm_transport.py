@@ -0,0 +1,120 @@
+import multiprocessing
+import queue
+import threading
+import time
+
+import pytest
+
+from app.core.shm_transport import ShmQueue
+
+CTX = multiprocessing.get_context("spawn")
+
+
+def _echo(cmd_queue, res_queue):
+    while True:
+        msg = cmd_queue.get()
+        if msg is None:
+            break
+        res_queue.put(msg)
+
+
+def _exit_immediately():
+    pass
+
+
+@pytest.fixture
+def channel():
+    ch = ShmQueue(CTX, ring_bytes=4096, blob_bytes=1024, inline_max=512)
+    yield ch
+    ch.close()
+
+
+def test_round_trip_inline_and_multipart(channel):
+    small = {"type": "token", "text": "hi"}
+    large = {"type": "generate", "messages": ["x" * 5000, bytes(range(256)) * 20]}
+    received = []
+    # A multi-part message needs a reader taking the parts as they arrive.
+    reader = threading.Thread(target=lambda: received.extend(channel.get(timeout=5) for _ in range(2)))
+    reader.start()
+    channel.put(small)
+    channel.put(large, timeout=5)
+    reader.join(timeout=5)
+    assert received == [small, large]
+    assert channel.empty()
+
+
+def test_round_trip_across_processes():
+    cmd, res = ShmQueue(CTX), ShmQueue(CTX, blob_bytes=64 * 1024)
+    proc = CTX.Process(target=_echo, args=(cmd, res), daemon=True)
+    proc.start()
+    try:
+        cmd.watch(proc.is_alive)
+        payloads = [{"i": i, "data": "y" * (i * 40_000)} for i in range(5)]
+        for payload in payloads:
+            cmd.put(payload, timeout=5)
+            assert res.get(timeout=10) == payload
+        cmd.put(None, timeout=5)
+        proc.join(timeout=5)
+    finally:
+        if proc.is_alive():
+            proc.terminate()
+        cmd.close()
+        res.close()
+
+
+def test_get_times_out_when_empty(channel):
+    with pytest.raises(queue.Empty):
+        channel.get_nowait()
+    start = time.monotonic()
+    with pytest.raises(queue.Empty):
+        channel.get(timeout=0.1)
+    assert time.monotonic() - start < 1
+
+
+def test_put_times_out_when_ring_is_full(channel):
+    with pytest.raises(queue.Full):
+        for _ in range(100):
+            channel.put("z" * 400, timeout=0.05)
+    with pytest.raises(queue.Full):
+        channel.put("z" * 400, block=False)
+    # Draining makes room again.
+    channel.get(timeout=1)
+    channel.put("z" * 400, timeout=0.05)
+
+
+def test_put_times_out_while_payload_region_is_busy(channel):
+    channel.put("a" * 600)  # multi-part message left unread
+    start = time.monotonic()
+    with pytest.raises(queue.Full):
+        channel.put("b" * 600, timeout=0.1)
+    assert time.monotonic() - start < 1
+    assert channel.get(timeout=1) == "a" * 600
+
+
+def test_put_fails_when_watched_consumer_is_dead(channel):
+    proc = CTX.Process(target=_exit_immediately)
+    proc.start()
+    proc.join(timeout=10)
+    channel.watch(proc.is_alive)
+    channel.put("a" * 600)
+    with pytest.raises(BrokenPipeError):
+        channel.put("b" * 600)  # no timeout: only the dead consumer ends the wait
+
+
+def test_close_unblocks_a_waiting_put(channel):
+    channel.put("a" * 600)
+    errors = []
+
+    def producer():
+        try:
+            channel.put("b" * 600)
+        except BrokenPipeError as exc:
+            errors.append(exc)
+
+    thread = threading.Thread(target=producer)
+    thread.start()
+    time.sleep(0.1)
+    channel.close()
+    thread.join(timeout=2)
+    assert not thread.is_alive()
+    assert len(errors) == 1
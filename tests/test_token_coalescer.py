@@ -0,0 +1,103 @@
+import threading
+import time
+
+from app.core.token_coalescer import TimedCoalescer, TokenCoalescer
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def _fast_stream(coalescer, clock, pieces, gap=0.001):
+    frames = []
+    for piece in pieces:
+        frame = coalescer.push(piece)
+        if frame:
+            frames.append(frame)
+        clock.now += gap
+    return frames
+
+
+def test_first_piece_passes_through():
+    clock = FakeClock()
+    coalescer = TokenCoalescer(flush_ms=30, max_chars=100, clock=clock)
+    assert coalescer.push("Hello") == "Hello"
+
+
+def test_fast_pieces_are_merged_by_age():
+    clock = FakeClock()
+    coalescer = TokenCoalescer(flush_ms=30, max_chars=1000, clock=clock)
+    frames = _fast_stream(coalescer, clock, [f"t{i} " for i in range(100)])
+    tail = coalescer.flush()
+    text = "".join(frames) + (tail or "")
+    assert text == "".join(f"t{i} " for i in range(100))
+    assert coalescer.frames < 10
+    assert coalescer.frames_saved == coalescer.pushed - coalescer.frames
+
+
+def test_frames_are_bounded_by_size():
+    clock = FakeClock()
+    coalescer = TokenCoalescer(flush_ms=1000, max_chars=10, clock=clock)
+    frames = _fast_stream(coalescer, clock, ["abcd"] * 20)
+    assert frames
+    assert all(len(frame) <= 12 for frame in frames[1:])
+
+
+def test_slow_pieces_pass_through():
+    clock = FakeClock()
+    coalescer = TokenCoalescer(flush_ms=30, max_chars=100, clock=clock)
+    frames = _fast_stream(coalescer, clock, ["a", "b", "c", "d"], gap=0.1)
+    assert frames == ["a", "b", "c", "d"]
+
+
+def test_poll_and_time_to_flush():
+    clock = FakeClock()
+    coalescer = TokenCoalescer(flush_ms=30, max_chars=100, clock=clock)
+    _fast_stream(coalescer, clock, ["a", "b", "c"])
+    assert coalescer.time_to_flush() is not None
+    assert coalescer.poll() is None
+    clock.now += 0.05
+    assert coalescer.time_to_flush() == 0.0
+    assert coalescer.poll() == "bc"
+    assert coalescer.time_to_flush() is None
+
+
+def test_disabled_coalescer_passes_everything():
+    coalescer = TokenCoalescer(flush_ms=0, max_chars=0)
+    assert [coalescer.push(p) for p in ("a", "b", "c")] == ["a", "b", "c"]
+
+
+def test_timed_coalescer_flushes_without_another_token():
+    frames = []
+    stamps = []
+    done = threading.Event()
+
+    def emit(frame):
+        frames.append(frame)
+        stamps.append(time.perf_counter())
+        if "".join(frames) == "abc":
+            done.set()
+
+    timed = TimedCoalescer(emit, TokenCoalescer(flush_ms=20, max_chars=1000))
+    for piece in "abc":
+        timed.push(piece)
+    pushed_at = time.perf_counter()
+    # The producer now stalls; the buffered text must still go out.
+    assert done.wait(1.0)
+    assert stamps[-1] - pushed_at < 0.5
+    timed.flush()
+    assert "".join(frames) == "abc"
+
+
+def test_timed_coalescer_flush_emits_in_order():
+    frames = []
+    timed = TimedCoalescer(frames.append, TokenCoalescer(flush_ms=1000, max_chars=1000))
+    for piece in "abcdef":
+        timed.push(piece)
+    timed.flush()
+    assert "".join(frames) == "abcdef"
+    assert timed.frames_saved > 0